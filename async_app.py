@@ -0,0 +1,356 @@
+"""Asynchronous serving mode for the search app
+
+The routes that spend their time waiting on Elasticsearch (/search,
+/list-all, /download, /download-json and /metrics) are served here by
+coroutines on a shared AsyncElasticsearch connection pool, so a worker
+can keep many requests in flight instead of one. Every other route (the
+pages, uploads, jobs, suggestions) is the unchanged Flask app, run in a
+thread pool behind a WSGI adapter. Both halves share search_app's caches,
+document store, log shipper and counters.
+
+Run it under an ASGI worker with the usual gunicorn settings:
+
+    gunicorn -c gunicorn.conf.py -k uvicorn_worker.UvicornWorker async_app:app
+
+or directly with `uvicorn async_app:app --workers 2`.
+"""
+import contextlib
+import datetime
+import functools
+import json
+import os
+import time
+import uuid
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+import passages
+import search_app
+import search_cache
+from es_client import create_async_client, pool_stats
+from search_app import (ES_INDEX, PASSAGE_INDEX, LIST_PAGE_SIZE, LIST_MAX_PAGE_SIZE, LIST_PIT_KEEP_ALIVE,
+                        SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE, SEARCH_FILTER_PATH, COMPRESSED_DOWNLOADS,
+                        DOWNLOAD_MAX_AGE)
+
+flask_app = search_app.app
+logger = flask_app.logger
+
+# Connections per Elasticsearch node shared by all requests in a worker
+ES_CONNECTIONS = int(os.environ.get('ASYNC_ES_CONNECTIONS', 100))
+# Threads running the Flask routes and local-disk work
+WSGI_THREADS = int(os.environ.get('ASYNC_WSGI_THREADS', 10))
+
+aes = create_async_client(search_app.ES_URL, api_key=search_app.ES_API_KEY, connections_per_node=ES_CONNECTIONS)
+# The async pool is reported next to the sync one, under client="async"
+search_app.registry.add_collector(lambda registry: search_app.set_pool_gauges(registry, pool_stats(aes), 'async'))
+
+def tracked(handler):
+    """Request ids, counters and access logs, as search_app's before/after_request hooks keep them"""
+    @functools.wraps(handler)
+    async def wrapper(request):
+        request_id = request.headers.get('X-Request-ID') or str(uuid.uuid4())
+        start_time = time.time()
+        search_app.ensure_bootstrapped()
+        flask_app.request_count += 1
+        flask_app.active_requests.add(request_id)
+        logger.info(f"Request started: {request.method} {request.url.path}", extra={'request_id': request_id})
+        try:
+            response = await handler(request)
+        except Exception as e:
+            logger.error(f"Exception during request: {str(e)}")
+            response = JSONResponse({"error": str(e)}, status_code=500)
+        finally:
+            flask_app.active_requests.discard(request_id)
+
+        duration = time.time() - start_time
+        search_app.record_request(handler.__name__, request.method, response.status_code, duration)
+        client = request.client.host if request.client else None
+        search_app.log_shipper.enqueue('mimiketech-logs', {
+            'timestamp': datetime.datetime.utcnow().isoformat(),
+            'method': request.method,
+            'path': request.url.path,
+            'status_code': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'user_agent': request.headers.get('user-agent', ''),
+            'ip': client,
+            'request_id': request_id
+        })
+        logger.info(f"{client} - {request.method} {request.url.path}?{request.url.query} "
+                    f"{response.status_code} in {duration:.3f}s", extra={'request_id': request_id})
+        response.headers['X-Request-ID'] = request_id
+        return response
+    return wrapper
+
+def int_arg(request, name, default):
+    """Integer query parameter, falling back to `default` like Flask's args.get(type=int)"""
+    try:
+        return int(request.query_params.get(name, default))
+    except ValueError:
+        return default
+
+async def check_index_generation():
+    """Invalidate cached results if documents were indexed by another process"""
+    if not search_app.generation_check_due():
+        return
+    try:
+        stats = await aes.indices.stats(index=ES_INDEX, metric='indexing')
+        # The caches live in SQLite; every call into them runs in the thread pool, never on the event loop
+        await run_in_threadpool(search_app.sync_index_generation, stats)
+    except Exception as e:
+        print(f"Failed to check index generation: {e}")
+
+async def fetch_document(doc_id):
+    """Fetch a document's _source, served from the document cache when possible"""
+    source = await run_in_threadpool(search_app.document_cache.get, doc_id)
+    if source is None:
+        if search_app.local_index is not None and not search_app.cluster_health.available():
+            return await run_in_threadpool(search_app.local_index.get, doc_id)
+        try:
+            doc = await aes.get(index=ES_INDEX, id=doc_id)
+        except Exception as e:
+            if not search_app.es_unavailable(e) or search_app.local_index is None:
+                raise
+            logger.warning(f"Elasticsearch unavailable, reading {doc_id} from the local index: {e}")
+            return await run_in_threadpool(search_app.local_index.get, doc_id)
+        source = doc.get('_source') if doc else None
+        if source:
+            await run_in_threadpool(search_app.document_cache.set, doc_id, source)
+    return source
+
+async def search_local(query, offset, size, track_total_hits, ids_only):
+    """/search response from the embedded local index, searched off the event loop"""
+    hits, total = await run_in_threadpool(
+        search_app.local_index.search, query, offset, size, track_total_hits=track_total_hits, ids_only=ids_only
+    )
+    payload = {"hits": hits, "source": "local"}
+    if total is not None:
+        payload["total"] = total
+    logger.info(f"Local search results: {len(hits)} hits for query '{query}'")
+    return JSONResponse(payload)
+
+@tracked
+async def search(request):
+    query = request.query_params.get('q', '')
+
+    if not query:
+        return JSONResponse({"hits": []})
+
+    # Paging and payload options
+    try:
+        offset = max(int_arg(request, 'from', 0), 0)
+        size = min(max(int_arg(request, 'size', SEARCH_PAGE_SIZE), 1), SEARCH_MAX_PAGE_SIZE)
+        track_total_hits = search_app.parse_track_total_hits(request.query_params.get('track_total_hits'))
+    except ValueError:
+        return JSONResponse({"error": "track_total_hits must be true, false or an integer"}, status_code=400)
+    ids_only = request.query_params.get('mode') == 'ids'
+
+    logger.info(f"Search query: {query}")
+
+    local_index = search_app.local_index
+    if local_index is not None and flask_app.config['LOCAL_SEARCH'] == 'primary':
+        return await search_local(query, offset, size, track_total_hits, ids_only)
+
+    # Serve repeated queries from the result cache
+    await check_index_generation()
+    layout = flask_app.config['SEARCH_LAYOUT']
+    cache_key = search_cache.make_key(
+        query, offset=offset, size=size, track_total_hits=track_total_hits, ids_only=ids_only, layout=layout
+    )
+    cached_payload = await run_in_threadpool(search_app.result_cache.get, cache_key)
+    if cached_payload is not None:
+        logger.info(f"Search cache hit: {len(cached_payload['hits'])} hits for query '{query}'")
+        return JSONResponse(cached_payload)
+
+    if not search_app.cluster_health.available():
+        if local_index is not None:
+            logger.warning("Elasticsearch circuit open, searching the local index")
+            return await search_local(query, offset, size, track_total_hits, ids_only)
+        return JSONResponse({"error": "Search is temporarily unavailable"}, status_code=503)
+
+    try:
+        if layout == 'passages':
+            body = passages.passage_query(query, offset, size, track_total_hits=track_total_hits, ids_only=ids_only)
+            response = await aes.search(index=PASSAGE_INDEX, body=body)
+            hits, total = passages.format_passage_hits(response, track_total_hits, ids_only)
+        else:
+            body = search_app.build_search_query(query, offset, size, track_total_hits, ids_only)
+            response = await aes.search(index=ES_INDEX, body=body, filter_path=SEARCH_FILTER_PATH)
+            hits, total = search_app.format_search_hits(response, ids_only)
+
+        payload = {"hits": hits}
+        if track_total_hits is not False:
+            payload["total"] = total
+
+        await run_in_threadpool(search_app.result_cache.set, cache_key, payload)
+        search_app.cluster_health.record_success()
+        logger.info(f"Search results: {len(hits)} hits for query '{query}'")
+        return JSONResponse(payload)
+
+    except Exception as e:
+        if search_app.es_unavailable(e) and local_index is not None:
+            logger.warning(f"Elasticsearch unavailable, searching the local index: {str(e)}")
+            return await search_local(query, offset, size, track_total_hits, ids_only)
+        logger.error(f"Search error: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def close_point_in_time(pit_id):
+    """Release a point in time, ignoring ones that already expired"""
+    try:
+        await aes.close_point_in_time(id=pit_id)
+    except Exception as e:
+        logger.warning(f"Failed to close point in time: {str(e)}")
+
+async def list_page(size, cursor=None, fields=search_app.LIST_FIELDS):
+    """Fetch one page of document listings using point-in-time + search_after"""
+    if cursor:
+        pit_id, search_after = search_app.decode_cursor(cursor)
+    else:
+        pit_id = (await aes.open_point_in_time(index=ES_INDEX, keep_alive=LIST_PIT_KEEP_ALIVE))["id"]
+        search_after = None
+
+    response = await aes.search(body=search_app.build_list_query(size, pit_id, search_after, fields))
+    pit_id = response.get("pit_id", pit_id)
+    hits, search_after = search_app.format_list_page(response, size, fields)
+
+    if search_after is None:
+        await close_point_in_time(pit_id)
+        return hits, None
+    return hits, search_app.encode_cursor(pit_id, search_after)
+
+@tracked
+async def list_all(request):
+    try:
+        logger.info("List all documents request")
+
+        # Streaming mode: every document as newline-delimited JSON
+        if request.query_params.get('format') == 'ndjson':
+            async def generate():
+                cursor = None
+                try:
+                    while True:
+                        hits, cursor = await list_page(LIST_MAX_PAGE_SIZE, cursor)
+                        yield ''.join(json.dumps(hit) + "\n" for hit in hits)
+                        if cursor is None:
+                            break
+                finally:
+                    # Release the point in time if the client went away mid-stream
+                    if cursor is not None:
+                        await close_point_in_time(search_app.decode_cursor(cursor)[0])
+            logger.info("Streaming all documents as NDJSON")
+            return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+        size = min(int_arg(request, 'size', LIST_PAGE_SIZE), LIST_MAX_PAGE_SIZE)
+        if size < 1:
+            return JSONResponse({"error": "size must be positive"}, status_code=400)
+
+        hits, next_cursor = await list_page(size, request.query_params.get('cursor'))
+
+        logger.info(f"Listed {len(hits)} documents")
+        return JSONResponse({"hits": hits, "next_cursor": next_cursor})
+
+    except Exception as e:
+        logger.error(f"List all error: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def send_stored(request, doc_id, kind):
+    """Stream a file from the document store with the headers search_app.send_stored sets, or None"""
+    accepted = parse_accept_header(request.headers.get('accept-encoding'))
+    gzipped = kind in COMPRESSED_DOWNLOADS and accepted['gzip'] > 0
+    stored = await run_in_threadpool(search_app.doc_store.get, doc_id, kind, gzipped)
+    if stored is None:
+        return None
+    path, mimetype, meta = stored
+    encoded = path.endswith('.gz')
+    headers = {
+        'ETag': f'"{doc_id}-{kind}{"-gzip" if encoded else ""}"',
+        'Cache-Control': f'public, max-age={DOWNLOAD_MAX_AGE}'
+    }
+    if kind in COMPRESSED_DOWNLOADS:
+        headers['Vary'] = 'Accept-Encoding'
+    if headers['ETag'] in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers=headers)
+    if encoded:
+        headers['Content-Encoding'] = 'gzip'
+    # FileResponse reads the file in blocks off the event loop and answers Range requests
+    return FileResponse(path, media_type=mimetype, headers=headers,
+                        filename=search_app.download_name(doc_id, kind, meta))
+
+async def stored_or_fetched(request, doc_id, kind):
+    """Serve a download from the store, fetching the document into it on a miss"""
+    response = await send_stored(request, doc_id, kind)
+    if response is not None:
+        return response
+    source = await fetch_document(doc_id)
+    if not source:
+        return None
+    # Documents indexed by other tools enter the store on their first download
+    await run_in_threadpool(search_app.doc_store.put, doc_id, source)
+    return await send_stored(request, doc_id, kind)
+
+@tracked
+async def download_document(request):
+    doc_id = request.path_params['doc_id']
+    try:
+        logger.info(f"Download request for document ID: {doc_id}")
+        response = await stored_or_fetched(request, doc_id, 'text')
+        if response is None:
+            logger.warning(f"Document not found: {doc_id}")
+            return PlainTextResponse("Document not found", status_code=404)
+        logger.info(f"Downloading document: {doc_id}")
+        return response
+    except Exception as e:
+        logger.error(f"Download error: {str(e)}")
+        return PlainTextResponse(f"Error retrieving document: {str(e)}", status_code=500)
+
+@tracked
+async def download_json(request):
+    doc_id = request.path_params['doc_id']
+    try:
+        logger.info(f"Download JSON request for document ID: {doc_id}")
+        response = await stored_or_fetched(request, doc_id, 'json')
+        if response is None:
+            logger.warning(f"Document not found: {doc_id}")
+            return PlainTextResponse("Document not found", status_code=404)
+        logger.info(f"Downloading JSON: {doc_id}")
+        return response
+    except Exception as e:
+        logger.error(f"Download JSON error: {str(e)}")
+        return PlainTextResponse(f"Error retrieving document: {str(e)}", status_code=500)
+
+@tracked
+async def metrics(request):
+    try:
+        accept = parse_accept_header(request.headers.get('accept'), MIMEAccept)
+        if search_app.prometheus_requested(accept, request.query_params.get('format')):
+            text = await run_in_threadpool(search_app.registry.prometheus)
+            return Response(text, headers={'Content-Type': search_app.PROMETHEUS_CONTENT_TYPE})
+        payload = await run_in_threadpool(search_app.collect_metrics)
+        payload['async_elasticsearch'] = pool_stats(aes)
+        return JSONResponse(payload)
+    except Exception as e:
+        logger.error(f"Metrics error: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await aes.close()
+
+app = Starlette(
+    routes=[
+        Route('/search', search),
+        Route('/list-all', list_all),
+        Route('/download/{doc_id}', download_document),
+        Route('/download-json/{doc_id}', download_json),
+        Route('/metrics', metrics),
+        # Everything else is the Flask app, run in worker threads
+        Mount('/', app=WSGIMiddleware(flask_app, workers=WSGI_THREADS))
+    ],
+    lifespan=lifespan
+)
@@ -1,11 +1,18 @@
 import time
 import os
-import json
-from docx import Document
-from elasticsearch import Elasticsearch
+import tempfile
+import docx_stream
+from es_client import create_client
+from es_health import HealthMonitor
 import logging
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from ingest_pipeline import IngestPipeline
+from file_events import EventCoalescer
+import doc_identity
+from ingest_manifest import IngestManifest, scan_folder, delete_removed
+from index_management import ensure_alias
+from doc_store import DocumentStore
 
 # Configure logging
 logging.basicConfig(
@@ -27,8 +34,26 @@ ES_INDEX = "docstraining4"
 WATCH_FOLDER = r"C:\elasticsearch-upload\Mimiketech uploads"
 PROCESSED_FOLDER = os.path.join(WATCH_FOLDER, "processed")
 
+# Pipeline tuning
+PARSE_WORKERS = int(os.environ.get("DOCX_PARSE_WORKERS", os.cpu_count() or 2))
+INDEX_BATCH_SIZE = int(os.environ.get("DOCX_INDEX_BATCH_SIZE", 50))
+INDEX_FLUSH_INTERVAL = float(os.environ.get("DOCX_INDEX_FLUSH_INTERVAL", 2.0))
+STATS_LOG_INTERVAL = 60  # seconds between throughput log lines
+EVENT_DEBOUNCE_SECONDS = float(os.environ.get("DOCX_EVENT_DEBOUNCE", 0.5))
+
+# Fingerprints of already-indexed content and the manifest of indexed files,
+# so unchanged files are skipped before parsing and restarts only handle the delta
+INGEST_STATE_PATH = os.path.join(WATCH_FOLDER, f".{ES_INDEX}.fingerprints.sqlite3")
+# The search app's download store; entries of deleted documents are removed from it
+DOC_STORE_PATH = os.environ.get("DOC_STORE_PATH", os.path.join(tempfile.gettempdir(), 'mimiketech-doc-store'))
+
 # Initialize Elasticsearch client
-es = Elasticsearch(ES_URL, api_key=ES_API_KEY, verify_certs=False)
+es = create_client(ES_URL, api_key=ES_API_KEY)
+# Cluster state probed in the background instead of a ping before every document
+cluster_health = HealthMonitor(es, interval=float(os.environ.get("DOCX_HEALTH_CHECK_INTERVAL", 10)))
+fingerprints = doc_identity.FingerprintIndex(INGEST_STATE_PATH)
+manifest = IngestManifest(INGEST_STATE_PATH)
+doc_store = DocumentStore(DOC_STORE_PATH)
 
 def ensure_folders_exist():
     """Ensure the watch folder and processed folder exist"""
@@ -43,11 +68,8 @@ def ensure_folders_exist():
 def convert_docx_to_json(file_path, original_filename):
     """Convert a .docx file to JSON format"""
     try:
-        # Open the document
-        doc = Document(file_path)
-        
-        # Extract text from paragraphs
-        paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
+        # Stream the document XML: headings, paragraphs, table cells, headers and footers
+        paragraphs, headings = docx_stream.extract_text(file_path)
         
         # Extract base name without extension
         base_name = os.path.splitext(original_filename)[0]
@@ -58,6 +80,7 @@ def convert_docx_to_json(file_path, original_filename):
             "filename": original_filename,
             "content": "\n\n".join(paragraphs),
             "paragraphs": paragraphs,
+            "headings": headings,
             "upload_date": time.strftime("%Y-%m-%d %H:%M:%S")
         }
         
@@ -67,79 +90,141 @@ def convert_docx_to_json(file_path, original_filename):
         logger.error(f"Error converting document {original_filename}: {str(e)}")
         raise
 
-def index_to_elasticsearch(json_data):
-    """Index JSON data to Elasticsearch"""
-    try:
-        if not es.ping():
-            logger.error("Cannot connect to Elasticsearch")
-            return False
-            
-        result = es.index(index=ES_INDEX, document=json_data)
-        return result['_id']
-        
-    except Exception as e:
-        logger.error(f"Error indexing to Elasticsearch: {str(e)}")
-        return False
+def move_to_processed(file_path):
+    """Move a handled file into the processed folder, replacing older copies"""
+    processed_path = os.path.join(PROCESSED_FOLDER, os.path.basename(file_path))
+    os.replace(file_path, processed_path)
+    return processed_path
+
+def skip_if_indexed(file_path, content_hash):
+    """Move a file whose exact content is already indexed out of the way"""
+    existing_id = fingerprints.lookup(content_hash)
+    if existing_id:
+        processed_path = move_to_processed(file_path)
+        manifest.record(processed_path, content_hash, existing_id)
+        logger.info(f"Skipping unchanged file: {os.path.basename(file_path)} (ID: {existing_id})")
+        return True
+    return False
+
+def is_docx(filename):
+    """Check for .docx files, skipping Word's ~$ lock files"""
+    return filename.lower().endswith('.docx') and not filename.startswith('~$')
 
-def process_file(file_path):
-    """Process a single file - convert and index it"""
-    filename = os.path.basename(file_path)
+def create_pipeline():
+    """Create the conversion/indexing pipeline and the event coalescer feeding it"""
+    coalescer = None
+    content_hashes = {}  # file path -> hash computed before parsing
+    identities = {}      # file path -> identity stamped after parsing
     
-    if not filename.lower().endswith('.docx'):
-        logger.info(f"Skipping non-docx file: {filename}")
-        return False
+    def submit_if_changed(file_path):
+        # Hash before parsing so unchanged files never reach the process pool
+        try:
+            content_hash = doc_identity.file_hash(file_path)
+            if skip_if_indexed(file_path, content_hash):
+                coalescer.done(file_path, forget=True)
+                return
+        except Exception as e:
+            logger.error(f"Error fingerprinting {os.path.basename(file_path)}: {str(e)}")
+            coalescer.done(file_path, forget=True)
+            return
+        content_hashes[file_path] = content_hash
+        pipeline.submit(file_path)
     
-    try:
-        logger.info(f"Processing file: {filename}")
-        
-        # Convert to JSON
-        json_data = convert_docx_to_json(file_path, filename)
-        
-        # Index to Elasticsearch
-        doc_id = index_to_elasticsearch(json_data)
-        
-        if doc_id:
-            # Move to processed folder
-            processed_path = os.path.join(PROCESSED_FOLDER, filename)
-            os.rename(file_path, processed_path)
-            
+    def prepare_document(file_path, document):
+        content_hash = content_hashes.pop(file_path)
+        identities[file_path] = doc_identity.stamp_document(
+            document, content_hash, os.path.basename(file_path), fingerprints
+        )
+    
+    def on_document_indexed(file_path, doc_id):
+        # Record the fingerprint and move the file to the processed folder
+        filename = os.path.basename(file_path)
+        try:
+            identity = identities.pop(file_path)
+            if doc_identity.record_indexed(es, ES_INDEX, identity, fingerprints):
+                doc_store.delete(identity['superseded_id'])
+            processed_path = move_to_processed(file_path)
+            manifest.record(processed_path, identity['content_hash'], doc_id)
             logger.info(f"Successfully processed {filename} (ID: {doc_id})")
-            return True
-        else:
-            logger.error(f"Failed to index {filename} to Elasticsearch")
-            return False
-            
-    except Exception as e:
-        logger.error(f"Error processing {filename}: {str(e)}")
-        return False
+            coalescer.done(file_path, forget=True)
+        except Exception as e:
+            logger.error(f"Error finishing {filename} after indexing: {str(e)}")
+            coalescer.done(file_path, forget=True)
+    
+    def on_document_failed(file_path, error):
+        content_hashes.pop(file_path, None)
+        identities.pop(file_path, None)
+        logger.error(f"Error processing {os.path.basename(file_path)}: {error}")
+        # Forget the signature so the file is retried on its next event, even if unchanged
+        coalescer.done(file_path, forget=True)
+    
+    pipeline = IngestPipeline(
+        es,
+        ES_INDEX,
+        convert_docx_to_json,
+        prepare=prepare_document,
+        on_indexed=on_document_indexed,
+        on_failed=on_document_failed,
+        parse_workers=PARSE_WORKERS,
+        batch_size=INDEX_BATCH_SIZE,
+        flush_interval=INDEX_FLUSH_INTERVAL,
+        health=cluster_health
+    )
+    coalescer = EventCoalescer(submit_if_changed, debounce=EVENT_DEBOUNCE_SECONDS)
+    return pipeline, coalescer
 
 class DocxHandler(FileSystemEventHandler):
-    """Watchdog handler to detect new files"""
+    """Watchdog handler to detect new files
     
-    def on_created(self, event):
-        """Called when a file or directory is created"""
-        if event.is_directory:
-            return
-            
-        file_path = event.src_path
+    Events are only recorded here; the coalescer decides when a file is
+    fully written and hands it to the pipeline exactly once, so the
+    observer thread never blocks.
+    """
+    
+    def __init__(self, coalescer):
+        super().__init__()
+        self.coalescer = coalescer
+    
+    def _notify(self, file_path):
         filename = os.path.basename(file_path)
         
-        # Only process .docx files
-        if filename.lower().endswith('.docx'):
-            logger.info(f"New file detected: {filename}")
-            
-            # Wait a moment to ensure file is completely written
-            time.sleep(1)
-            
-            # Process the file
-            process_file(file_path)
+        # Only process .docx files in the watch folder itself
+        if is_docx(filename) and os.path.dirname(os.path.abspath(file_path)) == os.path.abspath(WATCH_FOLDER):
+            logger.debug(f"File event: {filename}")
+            self.coalescer.notify(file_path)
+    
+    def on_created(self, event):
+        """Called when a file or directory is created"""
+        if not event.is_directory:
+            self._notify(event.src_path)
+    
+    def on_modified(self, event):
+        """Called while a file is being written"""
+        if not event.is_directory:
+            self._notify(event.src_path)
+    
+    def on_moved(self, event):
+        """Called when a file is renamed into place (e.g. after a temp-file save)"""
+        if not event.is_directory:
+            self._notify(event.dest_path)
 
-def process_existing_files():
-    """Process any existing files in the watch folder"""
-    for filename in os.listdir(WATCH_FOLDER):
-        file_path = os.path.join(WATCH_FOLDER, filename)
-        if os.path.isfile(file_path) and filename.lower().endswith('.docx'):
-            process_file(file_path)
+def process_existing_files(coalescer):
+    """Queue new drops and the delta of the processed folder since the last run"""
+    # Anything still in the watch folder has not been handled yet
+    for file_path, _, _ in scan_folder(WATCH_FOLDER, is_docx):
+        coalescer.notify(file_path)
+    
+    # Processed files: only those changed or unknown to the manifest are re-read
+    delta = manifest.compute_delta(PROCESSED_FOLDER, scan_folder(PROCESSED_FOLDER, is_docx))
+    for file_path in delta.new + delta.changed:
+        coalescer.notify(file_path)
+    
+    # Files deleted from the processed folder are removed from the index
+    deleted = delete_removed(es, ES_INDEX, delta.removed, manifest, fingerprints, doc_store)
+    logger.info(
+        f"Startup delta: {len(delta.new)} new, {len(delta.changed)} changed, "
+        f"{len(delta.unchanged)} unchanged, {len(delta.removed)} removed ({deleted} documents deleted)"
+    )
 
 def main():
     """Main entry point for the watcher service"""
@@ -148,22 +233,29 @@ def main():
     # Ensure folders exist
     ensure_folders_exist()
     
-    # Test Elasticsearch connection
+    # Test Elasticsearch connection; the monitor keeps probing in the background from here on
     try:
-        if not es.ping():
+        if not cluster_health.probe():
             logger.error("Cannot connect to Elasticsearch. Please check your connection settings.")
             return
         logger.info("Successfully connected to Elasticsearch")
+        logger.info(f"Writing to '{ES_INDEX}' ({ensure_alias(es, ES_INDEX, 'documents')})")
     except Exception as e:
         logger.error(f"Error connecting to Elasticsearch: {str(e)}")
         return
     
+    # Start the conversion/indexing pipeline
+    pipeline, coalescer = create_pipeline()
+    pipeline.start()
+    coalescer.start()
+    logger.info(f"Pipeline started with {PARSE_WORKERS} parse workers, batch size {INDEX_BATCH_SIZE}")
+    
     # Process any existing files
     logger.info("Processing existing files...")
-    process_existing_files()
+    process_existing_files(coalescer)
     
     # Set up the file watcher
-    event_handler = DocxHandler()
+    event_handler = DocxHandler(coalescer)
     observer = Observer()
     observer.schedule(event_handler, WATCH_FOLDER, recursive=False)
     observer.start()
@@ -172,12 +264,20 @@ def main():
     logger.info("Press Ctrl+C to stop")
     
     try:
+        last_stats = time.time()
         while True:
             time.sleep(1)
+            if time.time() - last_stats >= STATS_LOG_INTERVAL:
+                logger.info(f"Pipeline stats: {pipeline.stats()}, events: {coalescer.stats()}, "
+                            f"cluster: {cluster_health.stats()['state']}")
+                last_stats = time.time()
     except KeyboardInterrupt:
         observer.stop()
     
     observer.join()
+    coalescer.stop()
+    pipeline.stop()
+    logger.info(f"Pipeline stats: {pipeline.stats()}")
     logger.info("Document uploader service stopped")
 
 if __name__ == "__main__":
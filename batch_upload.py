@@ -0,0 +1,99 @@
+import os
+import tempfile
+import zipfile
+
+from werkzeug.utils import secure_filename
+
+# Refuse archive members that would inflate past this, whatever the archive claims
+MAX_MEMBER_BYTES = 64 * 1024 * 1024
+COPY_BUFFER_BYTES = 1024 * 1024
+
+
+class FileBudget:
+    """How many more documents a batch may take, shared by its plain files and every archive"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+
+    def take(self):
+        """Count one document; False once the limit is passed"""
+        self.used += 1
+        return self.used <= self.limit
+
+
+def copy_bounded(source, target, limit):
+    """Copy `source` to `target` in blocks; False if it holds more than `limit` bytes"""
+    copied = 0
+    while True:
+        block = source.read(COPY_BUFFER_BYTES)
+        if not block:
+            return True
+        copied += len(block)
+        if copied > limit:
+            return False
+        target.write(block)
+
+
+def is_archive(filename):
+    return filename.lower().endswith('.zip')
+
+
+def iter_archive(source, allowed, budget):
+    """Yield (filename, source, error) for each document in a zip archive
+
+    Each member is copied to an anonymous temp file on disk, which is
+    closed (and removed) when the next member is requested, so at most one
+    member exists at a time and none is held in memory. Directories, macOS
+    resource forks and Office lock files are ignored; members that are not
+    allowed documents, too large or beyond the batch's `budget` (a
+    FileBudget) are yielded with `source` None and an error message.
+    """
+    with zipfile.ZipFile(source) as archive:
+        for member in archive.infolist():
+            name = os.path.basename(member.filename)
+            if member.is_dir() or not name or member.filename.startswith('__MACOSX/') or name.startswith('~$'):
+                continue
+            filename = secure_filename(name)
+            if not allowed(filename):
+                yield filename, None, "File type not allowed"
+                continue
+            if not budget.take():
+                yield filename, None, f"Batch has more than {budget.limit} documents"
+                continue
+            if member.file_size > MAX_MEMBER_BYTES:
+                yield filename, None, "File too large"
+                continue
+            with tempfile.TemporaryFile() as spooled:
+                with archive.open(member) as stream:
+                    # The size in the archive header may be wrong, so the copy stops at the limit itself
+                    complete = copy_bounded(stream, spooled, MAX_MEMBER_BYTES)
+                if not complete:
+                    yield filename, None, "File too large"
+                    continue
+                spooled.seek(0)
+                yield filename, spooled, None
+
+
+def iter_uploads(uploads, allowed, max_files=500):
+    """Yield (filename, source, error) for uploads, expanding zip archives
+
+    `uploads` is a list of (filename, source) where a source is a path or a
+    seekable binary file object. Plain documents are yielded as given,
+    archive members as temp files that are only valid until the next item
+    is requested. At most `max_files` documents are accepted across the
+    whole batch, archive members included.
+    """
+    budget = FileBudget(max_files)
+    for filename, source in uploads:
+        if is_archive(filename):
+            try:
+                yield from iter_archive(source, allowed, budget)
+            except zipfile.BadZipFile:
+                yield filename, None, "Not a valid zip archive"
+        elif not allowed(filename):
+            yield filename, None, "File type not allowed"
+        elif not budget.take():
+            yield filename, None, f"Batch has more than {max_files} documents"
+        else:
+            yield filename, source, None
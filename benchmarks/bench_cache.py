@@ -0,0 +1,99 @@
+"""Compare per-process and shared (SQLite) result caching across workers
+
+Each simulated gunicorn worker issues queries drawn from a Zipf-like
+distribution. A cache miss costs `--miss-ms` milliseconds, standing in for
+the Elasticsearch round trip. The report shows the hit rate and the
+per-lookup latency seen by the workers for both backends.
+
+    python benchmarks/bench_cache.py --workers 2 --requests 5000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_backends import create_backend
+from search_cache import SearchCache, make_key
+
+
+def zipf_queries(count, distinct, seed):
+    """Generate `count` query strings with a skewed popularity distribution"""
+    rng = random.Random(seed)
+    weights = [1.0 / rank for rank in range(1, distinct + 1)]
+    return [f"query {i}" for i in rng.choices(range(distinct), weights=weights, k=count)]
+
+
+def run_worker(kind, path, queries, miss_ms, results):
+    options = {'path': path} if kind == 'sqlite' else {}
+    cache = SearchCache(create_backend(kind, **options), namespace='bench', ttl=600)
+    latencies = []
+    hits = 0
+    for query in queries:
+        start = time.perf_counter()
+        key = make_key(query)
+        value = cache.get(key)
+        if value is None:
+            time.sleep(miss_ms / 1000.0)
+            cache.set(key, [{"id": query, "title": query, "filename": f"{query}.docx"}])
+        else:
+            hits += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+    results.put((hits, latencies))
+
+
+def run(kind, workers, requests, distinct, miss_ms):
+    path = os.path.join(tempfile.mkdtemp(), 'bench-cache.sqlite3')
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=run_worker,
+            args=(kind, path, zipf_queries(requests, distinct, seed), miss_ms, results)
+        )
+        for seed in range(workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    hits = sum(h for h, _ in collected)
+    latencies = sorted(l for _, ls in collected for l in ls)
+    total = len(latencies)
+    hit_latencies = sorted(l for l in latencies if l < miss_ms)
+    return {
+        'backend': kind,
+        'hit_rate': hits / total,
+        'mean_ms': statistics.mean(latencies),
+        'p50_ms': latencies[total // 2],
+        'p99_ms': latencies[int(total * 0.99)],
+        'hit_p50_us': hit_latencies[len(hit_latencies) // 2] * 1000 if hit_latencies else 0.0,
+        'wall_s': elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-process vs shared result caching")
+    parser.add_argument("--workers", type=int, default=2, help="Simulated gunicorn workers")
+    parser.add_argument("--requests", type=int, default=3000, help="Requests per worker")
+    parser.add_argument("--distinct", type=int, default=500, help="Distinct queries")
+    parser.add_argument("--miss-ms", type=float, default=5.0, help="Simulated cost of a cache miss")
+    args = parser.parse_args()
+
+    print(f"{'backend':<8} {'hit rate':>9} {'mean ms':>9} {'p50 ms':>8} {'p99 ms':>8} {'hit p50 us':>11} {'wall s':>7}")
+    for kind in ('memory', 'sqlite'):
+        r = run(kind, args.workers, args.requests, args.distinct, args.miss_ms)
+        print(f"{r['backend']:<8} {r['hit_rate']:>9.3f} {r['mean_ms']:>9.3f} {r['p50_ms']:>8.3f} "
+              f"{r['p99_ms']:>8.3f} {r['hit_p50_us']:>11.1f} {r['wall_s']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Load-test the sync (gunicorn) and async (ASGI) serving modes
+
+Starts a stand-in Elasticsearch that answers every request after a fixed
+delay (--es-latency, the round trip to the hosted cluster), then serves
+the app twice on it with the same number of workers: the sync Flask app
+under gunicorn's default workers, and async_app under uvicorn workers.
+For each concurrency level, --clients simulated clients request
+/search with a different query each time (so the result cache never
+answers) for --duration seconds. Reports throughput, latency
+percentiles and errors.
+
+    python benchmarks/bench_concurrency.py --clients 10 100 200 --es-latency 0.05
+    python benchmarks/bench_concurrency.py --path "/list-all?size=50"
+
+Needs gunicorn, uvicorn-worker and aiohttp installed.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    'sync': ['-k', 'sync', 'search_app:app'],
+    'async': ['-k', 'uvicorn_worker.UvicornWorker', 'async_app:app']
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class FakeElasticsearch:
+    """Just enough of the Elasticsearch HTTP API for the app's startup and read routes"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.port = free_port()
+        self.requests = 0
+        self.hits = [{"_id": f"doc-{n}", "_score": 1.0 - n / 100, "sort": [n],
+                      "_source": {"title": f"Report {n}", "filename": f"report-{n}.docx"},
+                      "highlight": {"content": [f"... <em>match</em> in report {n} ..."]}} for n in range(10)]
+
+    def respond(self, method, path, body):
+        path = path.split('?')[0]
+        if path.startswith('/_alias/'):
+            return 404, {}
+        if method == 'HEAD':
+            return 200, None
+        if '/_stats' in path:
+            return 200, {"_all": {"primaries": {"indexing": {"index_total": 1, "delete_total": 0}}}}
+        if path.endswith('/_pit'):
+            return 200, {"id": "pit"}
+        if path == '/_pit':
+            return 200, {"succeeded": True, "num_freed": 1}
+        if path.endswith('/_search'):
+            return 200, {"pit_id": "pit", "hits": {"total": {"value": 10, "relation": "eq"}, "hits": self.hits}}
+        if path.endswith('/_bulk'):
+            actions = body.count(b'\n') // 2
+            return 200, {"errors": False, "items": [{"index": {"status": 201}}] * actions}
+        if '/_doc/' in path and method == 'GET':
+            doc_id = path.rsplit('/', 1)[1]
+            return 200, {"_id": doc_id, "found": True,
+                         "_source": {"title": doc_id, "filename": f"{doc_id}.docx", "content": "Text " * 200}}
+        if path.endswith('/_doc'):
+            return 201, {"_id": "m", "result": "created"}
+        return 200, {}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(' ', 2)
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b''):
+                        break
+                    name, _, value = line.decode().partition(':')
+                    if name.lower() == 'content-length':
+                        length = int(value)
+                body = await reader.readexactly(length) if length else b''
+                self.requests += 1
+                await asyncio.sleep(self.latency)
+                status, payload = self.respond(method, path, body)
+                data = json.dumps(payload).encode() if payload is not None else b''
+                writer.write((f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                              f"X-Elastic-Product: Elasticsearch\r\nContent-Length: {len(data)}\r\n\r\n").encode()
+                             + (data if method != 'HEAD' else b''))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(asyncio.start_server(self.handle, '127.0.0.1', self.port, backlog=1024))
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        return f"http://127.0.0.1:{self.port}"
+
+
+def start_server(mode, es_url, workers, scratch):
+    port = free_port()
+    env = dict(os.environ, ES_URL=es_url, ES_API_KEY='bench',
+               CACHE_PATH=os.path.join(scratch, f'{mode}-cache.sqlite3'),
+               FINGERPRINT_PATH=os.path.join(scratch, f'{mode}-fingerprints.sqlite3'),
+               DOC_STORE_PATH=os.path.join(scratch, f'{mode}-store'))
+    command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(workers),
+               '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'] + MODES[mode]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+async def load(base_url, path, clients, duration):
+    counter = itertools.count()
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(session):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            # A new query every time, so each request reaches Elasticsearch
+            url = base_url + path.replace('{n}', str(next(counter)))
+            started = time.perf_counter()
+            try:
+                async with session.get(url) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        errors += 1
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=clients)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test sync and async serving modes")
+    parser.add_argument("--clients", type=int, nargs='+', default=[10, 100, 200], help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per run")
+    parser.add_argument("--workers", type=int, default=2, help="Server worker processes")
+    parser.add_argument("--es-latency", type=float, default=0.05, help="Seconds before each Elasticsearch reply")
+    parser.add_argument("--path", default="/search?q=report+{n}", help="Request path; {n} is a counter")
+    parser.add_argument("--modes", nargs='+', default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    fake_es = FakeElasticsearch(args.es_latency)
+    es_url = fake_es.start()
+    scratch = tempfile.mkdtemp()
+    print(f"{args.workers} workers, Elasticsearch latency {args.es_latency * 1000:.0f} ms, "
+          f"{args.duration:.0f}s per run, GET {args.path}")
+    print(f"{'mode':<6} {'clients':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    try:
+        for mode in args.modes:
+            process, base_url = start_server(mode, es_url, args.workers, scratch)
+            try:
+                # Warm up: imports, startup requests and connection pools
+                asyncio.run(load(base_url, args.path, args.workers * 2, 2.0))
+                for clients in args.clients:
+                    latencies, errors, elapsed = asyncio.run(load(base_url, args.path, clients, args.duration))
+                    latencies.sort()
+                    print(f"{mode:<6} {clients:>8} {len(latencies) / elapsed:>9.1f} "
+                          f"{statistics.median(latencies) * 1000:>9.1f} {percentile(latencies, 0.95) * 1000:>9.1f} "
+                          f"{percentile(latencies, 0.99) * 1000:>9.1f} {errors:>7}")
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
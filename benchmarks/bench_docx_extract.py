@@ -0,0 +1,111 @@
+"""Compare python-docx and the streaming extractor on a large generated document
+
+Builds a synthetic manual (paragraphs, headings, tables and embedded
+images), then extracts it with each method in a fresh process and reports
+wall time and peak RSS growth over the process baseline.
+
+    python benchmarks/bench_docx_extract.py --pages 200
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psutil
+
+
+def png_bytes(width=400, height=300):
+    """A solid-colour PNG, so the benchmark needs no image files"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    raw = b''.join(b'\x00' + os.urandom(width * 3) for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+
+def build_document(path, pages):
+    from docx import Document
+    from docx.shared import Inches
+
+    doc = Document()
+    image = png_bytes()
+    sentence = "The monitoring agent ships metrics, logs and traces to the cluster for analysis. "
+    for page in range(pages):
+        doc.add_heading(f"Chapter {page + 1}", level=1)
+        for _ in range(18):
+            doc.add_paragraph(sentence * 4)
+        table = doc.add_table(rows=4, cols=3)
+        for row in table.rows:
+            for cell in row.cells:
+                cell.text = "Service level indicator"
+        if page % 5 == 0:
+            doc.add_picture(io.BytesIO(image), width=Inches(3))
+    doc.save(path)
+
+
+def extract_python_docx(path):
+    from docx import Document
+    doc = Document(path)
+    paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
+    return "\n\n".join(paragraphs), paragraphs
+
+
+def extract_streaming(path):
+    import docx_stream
+    paragraphs, _ = docx_stream.extract_text(path)
+    return "\n\n".join(paragraphs), paragraphs
+
+
+def measure(method, path, results):
+    import docx  # noqa: F401 - import cost excluded from both measurements
+    import docx_stream  # noqa: F401
+    process = psutil.Process()
+    baseline = process.memory_info().rss
+    peak = [baseline]
+    done = []
+
+    def sample():
+        while not done:
+            peak[0] = max(peak[0], process.memory_info().rss)
+            time.sleep(0.005)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    start = time.perf_counter()
+    content, paragraphs = method(path)
+    elapsed = time.perf_counter() - start
+    done.append(True)
+    sampler.join()
+    results.put((elapsed, (peak[0] - baseline) / 1024 / 1024, len(paragraphs), len(content)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DOCX text extraction")
+    parser.add_argument("--pages", type=int, default=200, help="Approximate pages in the generated document")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'manual.docx')
+    build_document(path, args.pages)
+    print(f"Document: {os.path.getsize(path) / 1024 / 1024:.1f} MB on disk, ~{args.pages} pages")
+
+    context = multiprocessing.get_context('spawn')
+    print(f"{'method':<12} {'seconds':>8} {'peak RSS MB':>12} {'paragraphs':>11} {'chars':>10}")
+    for name, method in (('python-docx', extract_python_docx), ('streaming', extract_streaming)):
+        results = context.Queue()
+        process = context.Process(target=measure, args=(method, path, results))
+        process.start()
+        elapsed, peak_mb, count, chars = results.get()
+        process.join()
+        print(f"{name:<12} {elapsed:>8.2f} {peak_mb:>12.1f} {count:>11} {chars:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Measure worker memory while downloading a large document
+
+Builds one large document (50 MB of text by default), then downloads it
+as text and as JSON through the app, reading the body in blocks as a
+slow client would. The old path built the whole body in memory
+(Response(json.dumps(...))); the new path streams the files written to
+the document store at ingest time. Each download runs in a fresh child
+process, and a sampler thread records its peak RSS above the baseline.
+The generated text repeats, so gzip sizes are far smaller than real
+documents would give; memory figures are unaffected.
+
+    python benchmarks/bench_download_memory.py --megabytes 50 --concurrent 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psutil
+from flask import Response
+
+# The document, built before the runs fork so every child shares it
+DOCUMENT = {}
+
+
+def build_document(megabytes):
+    sentence = "The monitoring agent ships metrics, logs and traces to the cluster for analysis. "
+    paragraph = sentence * 12
+    count = megabytes * 1024 * 1024 // (len(paragraph) + 2)
+    paragraphs = [f"{n} {paragraph}" for n in range(count)]
+    return {
+        "title": "large-report",
+        "filename": "large-report.docx",
+        "content": '\n\n'.join(paragraphs),
+        "paragraphs": paragraphs
+    }
+
+
+def in_memory_response(source, kind):
+    # The handlers as they were before downloads were streamed
+    if kind == 'text':
+        return Response(source['content'], mimetype='text/plain')
+    return Response(json.dumps(source, indent=2), mimetype='application/json')
+
+
+class PeakSampler(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.process = psutil.Process()
+        self.baseline = self.process.memory_info().rss
+        self.peak = self.baseline
+        self.running = True
+
+    def run(self):
+        while self.running:
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            time.sleep(0.002)
+
+
+def download(args):
+    method, kind, gzipped, doc_id, concurrent, results = args
+    import search_app
+
+    headers = {'Accept-Encoding': 'gzip'} if gzipped else {}
+    sampler = PeakSampler()
+    sampler.start()
+    sent = []
+
+    def one():
+        client = search_app.app.test_client()
+        if method == 'in-memory':
+            with search_app.app.test_request_context():
+                body = in_memory_response(DOCUMENT, kind).response
+            size = sum(len(part) for part in body)
+        else:
+            url = f"/download/{doc_id}" if kind == 'text' else f"/download-json/{doc_id}"
+            response = client.get(url, headers=headers, buffered=False)
+            size = 0
+            # Read like a client on a slow link: one block at a time
+            for block in response.response:
+                size += len(block)
+            response.close()
+        sent.append(size)
+
+    threads = [threading.Thread(target=one) for _ in range(concurrent)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sampler.running = False
+    sampler.join()
+    results.put((sampler.peak - sampler.baseline, sent[0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark memory used by large downloads")
+    parser.add_argument("--megabytes", type=int, default=50, help="Size of the document text")
+    parser.add_argument("--concurrent", type=int, default=4, help="Simultaneous downloads per run")
+    args = parser.parse_args()
+
+    store_path = tempfile.mkdtemp()
+    os.environ['DOC_STORE_PATH'] = store_path
+    import search_app
+
+    source = build_document(args.megabytes)
+    doc_id = 'bench-large-document'
+    started = time.perf_counter()
+    search_app.doc_store.put(doc_id, source)
+    print(f"Document: {len(source['content']) / 1024 / 1024:.0f} MB of text, stored in "
+          f"{time.perf_counter() - started:.1f}s; {args.concurrent} concurrent downloads per run")
+    # In-memory runs use the document as if just fetched from the cluster
+    DOCUMENT.update(source)
+    del source
+
+    print(f"{'method':<10} {'body':<6} {'encoding':<9} {'peak RSS MB':>12} {'sent MB':>9}")
+    context = multiprocessing.get_context('fork')
+    for method, kind, gzipped in [('in-memory', 'text', False), ('in-memory', 'json', False),
+                                  ('streamed', 'text', False), ('streamed', 'json', False),
+                                  ('streamed', 'text', True), ('streamed', 'json', True)]:
+        results = context.Queue()
+        child = context.Process(target=download, args=((method, kind, gzipped, doc_id, args.concurrent, results),))
+        child.start()
+        peak, sent = results.get()
+        child.join()
+        print(f"{method:<10} {kind:<6} {'gzip' if gzipped else 'identity':<9} "
+              f"{peak / 1024 / 1024:>12.1f} {sent / 1024 / 1024:>9.1f}")
+    shutil.rmtree(store_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
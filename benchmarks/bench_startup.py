@@ -0,0 +1,108 @@
+"""Measure cold start: import time and time to first request
+
+Starts a stand-in Elasticsearch that answers after a fixed delay
+(--es-latency; a slow or distant cluster), then measures:
+
+  * importing search_app in a fresh interpreter, as each worker does, and
+    how many Elasticsearch requests the import makes;
+  * starting gunicorn and polling / until the first 200 response, first
+    on a new deploy (bootstrap not run yet: the first worker to serve a
+    request starts it in the background) and then on a restart
+    (bootstrap already recorded, so skipped).
+
+With --budget, exits non-zero when any time to first request is over it,
+so the number can be tracked in CI.
+
+    python benchmarks/bench_startup.py --es-latency 0.5 --budget 5
+
+Needs gunicorn and aiohttp installed.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from bench_concurrency import ROOT, FakeElasticsearch, free_port
+
+
+def server_env(es_url, scratch):
+    return dict(os.environ, ES_URL=es_url, ES_API_KEY='bench',
+                CACHE_PATH=os.path.join(scratch, 'cache.sqlite3'),
+                FINGERPRINT_PATH=os.path.join(scratch, 'fingerprints.sqlite3'),
+                DOC_STORE_PATH=os.path.join(scratch, 'store'),
+                BOOTSTRAP_MARKER=os.path.join(scratch, 'bootstrap.json'))
+
+
+def time_import(env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'import search_app'], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def time_first_request(env, workers, timeout=120):
+    """Seconds from launching gunicorn to the first 200 from /"""
+    port = free_port()
+    command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(workers),
+               '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'search_app:app']
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=timeout) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.05)
+        raise RuntimeError("server did not answer")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure search app cold-start time")
+    parser.add_argument("--es-latency", type=float, default=0.5, help="Seconds before each Elasticsearch reply")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--imports", type=int, default=5, help="Import timings to take")
+    parser.add_argument("--budget", type=float, help="Maximum seconds to first request")
+    args = parser.parse_args()
+
+    fake_es = FakeElasticsearch(args.es_latency)
+    es_url = fake_es.start()
+    scratch = tempfile.mkdtemp()
+    env = server_env(es_url, scratch)
+    print(f"Elasticsearch latency {args.es_latency * 1000:.0f} ms, {args.workers} workers")
+    try:
+        before = fake_es.requests
+        timings = sorted(time_import(env) for _ in range(args.imports))
+        requests = (fake_es.requests - before) / args.imports
+        print(f"import search_app:     median {statistics.median(timings):.2f}s, "
+              f"max {timings[-1]:.2f}s, {requests:.0f} Elasticsearch requests per import")
+
+        results = []
+        for label in ('new deploy', 'restart'):
+            before = fake_es.requests
+            seconds = time_first_request(env, args.workers)
+            results.append(seconds)
+            print(f"first request ({label + '):':<12} {seconds:.2f}s, "
+                  f"{fake_es.requests - before} Elasticsearch requests")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if args.budget is not None:
+        over = [seconds for seconds in results if seconds > args.budget]
+        print(f"budget {args.budget:.2f}s: {'over' if over else 'within'}")
+        if over:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
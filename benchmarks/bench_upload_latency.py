@@ -0,0 +1,102 @@
+"""Compare temp-file and in-memory handling of uploaded .docx files
+
+Posts generated documents through a werkzeug request parser and times the
+path from request body to converted JSON: the old path saves the upload to
+the temp directory, converts it from disk and deletes it; the new path
+converts the spooled upload buffer directly. Reports per-upload latency
+percentiles and how many files each path created on disk.
+
+    python benchmarks/bench_upload_latency.py --uploads 200 --paragraphs 300
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+
+def build_document(paragraphs):
+    from docx import Document
+
+    doc = Document()
+    sentence = "The monitoring agent ships metrics, logs and traces to the cluster for analysis. "
+    for i in range(paragraphs):
+        if i % 20 == 0:
+            doc.add_heading(f"Section {i // 20 + 1}", level=1)
+        doc.add_paragraph(sentence * 3)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def make_request(data, request_class):
+    builder = EnvironBuilder(method='POST', data={'docfile': (io.BytesIO(data), 'report.docx')})
+    return request_class(builder.get_environ())
+
+
+def temp_file_upload(request, folder, convert, created):
+    file = request.files['docfile']
+    temp_filepath = os.path.join(folder, f"{uuid.uuid4()}_report.docx")
+    file.save(temp_filepath)
+    created.append(temp_filepath)
+    try:
+        return convert(temp_filepath, 'report.docx')
+    finally:
+        os.remove(temp_filepath)
+
+
+def in_memory_upload(request, folder, convert, created):
+    file = request.files['docfile']
+    stream = file.stream
+    stream.seek(0)
+    try:
+        return convert(stream, 'report.docx')
+    finally:
+        stream.close()
+
+
+def run(name, handler, request_class, data, uploads, folder, convert):
+    created = []
+    latencies = []
+    for _ in range(uploads):
+        request = make_request(data, request_class)
+        start = time.perf_counter()
+        request.files  # parse the multipart body, as Flask does on first access
+        handler(request, folder, convert, created)
+        latencies.append((time.perf_counter() - start) * 1000)
+        request.close()
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<10} {statistics.median(latencies):>9.2f} {p95:>9.2f} {statistics.mean(latencies):>9.2f} {len(created):>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark upload handling latency")
+    parser.add_argument("--uploads", type=int, default=200, help="Uploads per method")
+    parser.add_argument("--paragraphs", type=int, default=300, help="Paragraphs in the generated document")
+    args = parser.parse_args()
+
+    # Use the app's request class and converter so the benchmark follows the real code
+    import search_app
+
+    data = build_document(args.paragraphs)
+    folder = tempfile.mkdtemp()
+    print(f"Document: {len(data) / 1024:.0f} KB, {args.uploads} uploads per method, "
+          f"spool threshold {search_app.app.config['UPLOAD_SPOOL_BYTES'] / 1024 / 1024:.0f} MB")
+    print(f"{'method':<10} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9} {'temp files':>11}")
+    with search_app.app.app_context():
+        run('temp-file', temp_file_upload, Request, data, args.uploads, folder, search_app.convert_docx_to_json)
+        run('in-memory', in_memory_upload, search_app.SpooledRequest, data, args.uploads, folder,
+            search_app.convert_docx_to_json)
+
+
+if __name__ == "__main__":
+    main()
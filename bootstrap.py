@@ -0,0 +1,32 @@
+"""One-time startup tasks for the search app
+
+Creates the local folders, the index aliases and the static logo (see
+search_app.bootstrap) so gunicorn workers can import the app without
+network I/O. Run it once per deploy, before starting gunicorn:
+
+    python bootstrap.py [--force]
+
+(the release entry in Procfile.txt does this). If it was skipped, the
+first worker to serve a request runs it in the background; gunicorn
+itself never waits for it.
+"""
+import argparse
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the search app's one-time startup tasks")
+    parser.add_argument("--force", action="store_true", help="Run even if already done for this configuration")
+    args = parser.parse_args()
+
+    started = time.time()
+    import search_app
+    if not search_app.bootstrap(force=args.force):
+        print("Bootstrap failed; workers will retry it in the background")
+        sys.exit(1)
+    print(f"Bootstrap complete in {time.time() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from elasticsearch import ApiError
+
+from doc_identity import document_id
+
+# Statuses worth retrying: the cluster is overloaded or briefly unavailable
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+def iter_json_documents(folder_path, paths=None):
+    """Yield (filename, document) for each JSON file in a folder, one at a time
+
+    When `paths` is given only those files are read (e.g. the changed files
+    of an incremental run).
+    """
+    if paths is None:
+        with os.scandir(folder_path) as entries:
+            paths = [entry.path for entry in entries if entry.is_file() and entry.name.endswith('.json')]
+    for path in paths:
+        name = os.path.basename(path)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                yield name, json.load(file)
+        except Exception as e:
+            print(f"Error reading {name}: {str(e)}")
+
+
+def chunk_actions(actions, max_docs=500, max_bytes=5 * 1024 * 1024):
+    """Group (action, document) pairs into chunks bounded by count and serialized bytes
+
+    Each chunk is a list of (name, action_line, document_line) tuples with
+    both lines already serialized, so byte sizes are exact.
+    """
+    chunk = []
+    chunk_bytes = 0
+    for name, action, document in actions:
+        action_line = json.dumps(action)
+        document_line = json.dumps(document)
+        size = len(action_line) + len(document_line) + 2
+        if chunk and (len(chunk) >= max_docs or chunk_bytes + size > max_bytes):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append((name, action_line, document_line))
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
+
+def send_chunk(es, chunk, max_retries=5, initial_backoff=1.0):
+    """Send one chunk with _bulk, retrying rejected items with exponential backoff
+
+    Only items rejected inside a successful response are retried here; a
+    request that fails as a whole (429/5xx, dropped connection) has
+    already been retried by the client's transport (see es_client).
+
+    Returns (indexed, failed, latency_ms) where indexed is a list of
+    (name, document id) and failed a list of (name, error) for documents
+    that could not be indexed.
+    """
+    pending = chunk
+    indexed = []
+    failed = []
+    backoff = initial_backoff
+    start = time.time()
+
+    for attempt in range(max_retries + 1):
+        body = ''.join(f"{action_line}\n{document_line}\n" for _, action_line, document_line in pending)
+        try:
+            response = es.bulk(operations=body)
+        except ApiError as e:
+            failed.extend((name, str(e)) for name, _, _ in pending)
+            pending = []
+            break
+
+        retry = []
+        for item, entry in zip(response['items'], pending):
+            result = next(iter(item.values()))
+            if result.get('status', 500) < 300:
+                indexed.append((entry[0], result.get('_id')))
+            elif result.get('status') in RETRY_STATUSES:
+                retry.append(entry)
+            else:
+                failed.append((entry[0], result.get('error')))
+
+        if not retry:
+            pending = []
+            break
+        pending = retry
+        if attempt < max_retries:
+            time.sleep(backoff)
+            backoff *= 2
+
+    # Anything still pending ran out of retries
+    failed.extend((name, 'rejected: retries exhausted') for name, _, _ in pending)
+    return indexed, failed, (time.time() - start) * 1000
+
+
+@contextmanager
+def bulk_load_settings(es, index_name):
+    """Disable refresh and replicas for the duration of a bulk load, then restore them"""
+    # Keyed by concrete index, which differs from `index_name` when it is an alias
+    current = next(iter(es.indices.get_settings(index=index_name).values()))['settings']['index']
+    original = {
+        'refresh_interval': current.get('refresh_interval', '1s'),
+        'number_of_replicas': current.get('number_of_replicas', '1')
+    }
+    es.indices.put_settings(index=index_name, settings={'refresh_interval': '-1', 'number_of_replicas': 0})
+    try:
+        yield
+    finally:
+        es.indices.put_settings(index=index_name, settings=original)
+        es.indices.refresh(index=index_name)
+
+
+@contextmanager
+def _no_settings():
+    yield
+
+
+def index_action(index_name, document):
+    """Bulk action for a document, using its content-derived id when it has one"""
+    action = {'_index': index_name}
+    if 'content_hash' in document:
+        action['_id'] = document_id(document['content_hash'])
+    return {'index': action}
+
+
+def bulk_ingest(es, index_name, documents, workers=4, chunk_docs=500,
+                chunk_bytes=5 * 1024 * 1024, max_retries=5, tune_index=True, on_indexed=None):
+    """Index (name, document) pairs with concurrent _bulk senders
+
+    `documents` may be any iterable, including a generator; at most
+    `2 * workers` chunks are buffered at a time, so memory stays bounded
+    regardless of how many documents are loaded. `on_indexed(name, doc_id)`
+    is called from the sender threads for every indexed document. Returns a
+    stats dict with throughput and per-batch latencies.
+    """
+    actions = ((name, index_action(index_name, doc), doc) for name, doc in documents)
+    in_flight = threading.BoundedSemaphore(workers * 2)
+    lock = threading.Lock()
+    stats = {'indexed': 0, 'failed': [], 'batches': 0, 'batch_latencies_ms': []}
+
+    def send(chunk):
+        try:
+            indexed, failed, latency_ms = send_chunk(es, chunk, max_retries=max_retries)
+            if on_indexed:
+                for name, doc_id in indexed:
+                    on_indexed(name, doc_id)
+            with lock:
+                stats['indexed'] += len(indexed)
+                stats['failed'].extend(failed)
+                stats['batches'] += 1
+                stats['batch_latencies_ms'].append(latency_ms)
+        finally:
+            in_flight.release()
+
+    start = time.time()
+    settings = bulk_load_settings(es, index_name) if tune_index else _no_settings()
+    with settings:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for chunk in chunk_actions(actions, max_docs=chunk_docs, max_bytes=chunk_bytes):
+                in_flight.acquire()
+                futures.append(executor.submit(send, chunk))
+            for future in futures:
+                future.result()
+    if not tune_index:
+        es.indices.refresh(index=index_name)
+    elapsed = time.time() - start
+
+    latencies = sorted(stats['batch_latencies_ms'])
+    stats['elapsed_seconds'] = elapsed
+    stats['docs_per_second'] = stats['indexed'] / elapsed if elapsed > 0 else 0.0
+    stats['batch_latency_p50_ms'] = statistics.median(latencies) if latencies else 0.0
+    stats['batch_latency_p95_ms'] = latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+    return stats
+
+
+def print_report(stats, index_name):
+    """Print a summary of a bulk_ingest run"""
+    for name, error in stats['failed']:
+        print(f"Error indexing {name}: {error}")
+    print(f"Completed: {stats['indexed']} documents indexed into '{index_name}', "
+          f"{len(stats['failed'])} failed")
+    print(f"Throughput: {stats['docs_per_second']:.1f} docs/sec over {stats['elapsed_seconds']:.2f}s "
+          f"in {stats['batches']} batches")
+    print(f"Batch latency: p50 {stats['batch_latency_p50_ms']:.1f} ms, "
+          f"p95 {stats['batch_latency_p95_ms']:.1f} ms")
@@ -0,0 +1,239 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBackend:
+    """Per-process LRU/TTL key-value store with counters
+
+    Values are strings (callers serialize). Memory is bounded by entry count
+    and by the total length of the stored values.
+    """
+
+    shared = False
+
+    def __init__(self, max_entries=1000, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value stored under `key`, or None if missing/expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        """Store `value`; returns the number of entries evicted to make room"""
+        evicted = 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.time() + ttl)
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+        return evicted
+
+    def _remove(self, key):
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def scan(self, prefix):
+        """Unexpired values whose keys start with `prefix`, without refreshing them"""
+        now = time.time()
+        with self._lock:
+            return {key: value for key, (value, expires_at) in self._entries.items()
+                    if key.startswith(prefix) and expires_at >= now}
+
+    def incr(self, name, amount=1):
+        """Add `amount` to a named counter and return the new value"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+            return self._counters[name]
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def incr_many(self, amounts):
+        """Add to several counters at once; `amounts` maps counter names to increments"""
+        with self._lock:
+            for name, amount in amounts.items():
+                self._counters[name] = self._counters.get(name, 0) + amount
+
+    def counters(self, prefix):
+        """All counters whose names start with `prefix`"""
+        with self._lock:
+            return {name: value for name, value in self._counters.items() if name.startswith(prefix)}
+
+    def usage(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes}
+
+
+class SQLiteBackend:
+    """Key-value store and counters in a SQLite file shared by all local workers
+
+    Every gunicorn worker on the host opens the same database file, so a
+    value cached by one worker is a hit for the others and counters are
+    host-wide. The database runs in WAL mode so readers never block on the
+    single writer. Connections are opened lazily per process and thread,
+    which keeps the backend safe to create before gunicorn forks.
+    """
+
+    shared = True
+
+    def __init__(self, path=None, max_entries=5000, max_bytes=128 * 1024 * 1024):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'mimiketech-cache.sqlite3')
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, value TEXT, size INTEGER, expires_at REAL, last_access REAL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)')
+        conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute('SELECT value, expires_at FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        now = time.time()
+        if expires_at < now:
+            conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            return None
+        conn.execute('UPDATE entries SET last_access = ? WHERE key = ?', (now, key))
+        return value
+
+    def set(self, key, value, ttl):
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries (key, value, size, expires_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, value, len(value), now + ttl, now)
+            )
+            # Expired rows go first, then least recently used until within bounds
+            evicted = conn.execute('DELETE FROM entries WHERE expires_at < ?', (now,)).rowcount
+            count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+            while count > self.max_entries or total > self.max_bytes:
+                oldest = conn.execute(
+                    'SELECT key, size FROM entries ORDER BY last_access LIMIT 1'
+                ).fetchone()
+                if oldest is None:
+                    break
+                conn.execute('DELETE FROM entries WHERE key = ?', (oldest[0],))
+                count -= 1
+                total -= oldest[1]
+                evicted += 1
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return evicted
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM entries WHERE key = ?', (key,))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM entries')
+
+    def scan(self, prefix):
+        """Unexpired values whose keys start with `prefix`, without refreshing them"""
+        rows = self._connection().execute(
+            'SELECT key, value FROM entries WHERE substr(key, 1, ?) = ? AND expires_at >= ?',
+            (len(prefix), prefix, time.time())
+        ).fetchall()
+        return dict(rows)
+
+    def incr(self, name, amount=1):
+        conn = self._connection()
+        conn.execute(
+            'INSERT INTO counters (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+            (name, amount)
+        )
+        return self.counter(name)
+
+    def counter(self, name):
+        row = self._connection().execute('SELECT value FROM counters WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0
+
+    def incr_many(self, amounts):
+        """Add to several counters in one transaction; values may be floats"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT INTO counters (name, value) VALUES (?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+                amounts.items()
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def counters(self, prefix):
+        """All counters whose names start with `prefix`"""
+        rows = self._connection().execute(
+            'SELECT name, value FROM counters WHERE substr(name, 1, ?) = ?', (len(prefix), prefix)
+        ).fetchall()
+        return dict(rows)
+
+    def usage(self):
+        count, total = self._connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries'
+        ).fetchone()
+        return {'entries': count, 'bytes': total}
+
+
+def create_backend(kind='sqlite', **options):
+    """Create a cache backend by name ('memory' or 'sqlite')"""
+    if kind == 'memory':
+        return MemoryBackend(**options)
+    if kind == 'sqlite':
+        return SQLiteBackend(**options)
+    raise ValueError(f"Unknown cache backend: {kind}")
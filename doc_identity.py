@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Fields that change between uploads of the same document and must not affect its hash
+VOLATILE_FIELDS = {'upload_date', 'content_hash', 'version'}
+
+
+def file_hash(source, chunk_size=1024 * 1024):
+    """SHA-256 of a file's bytes, read in chunks
+
+    `source` is a path or a seekable binary file-like object, which is
+    rewound afterwards so it can be read again.
+    """
+    digest = hashlib.sha256()
+    if hasattr(source, 'read'):
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            digest.update(chunk)
+        source.seek(0)
+        return digest.hexdigest()
+    with open(source, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def document_hash(document):
+    """SHA-256 of a JSON document's stable fields, independent of key order"""
+    stable = {key: value for key, value in document.items() if key not in VOLATILE_FIELDS}
+    return hashlib.sha256(json.dumps(stable, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def document_id(content_hash):
+    """Deterministic Elasticsearch _id for a content hash
+
+    Identical content always maps to the same document, so re-uploading a
+    file overwrites (or conflicts with) its existing copy instead of adding
+    a new one.
+    """
+    return content_hash
+
+
+class FingerprintIndex:
+    """Local record of which content has already been indexed
+
+    Lets ingest paths skip unchanged files before parsing them or touching
+    the network. Also tracks the current version of each filename, so when
+    a file is re-uploaded with new content the caller can bump the version
+    and delete the document it supersedes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS fingerprints ('
+            'content_hash TEXT PRIMARY KEY, doc_id TEXT, filename TEXT, indexed_at REAL)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS versions ('
+            'filename TEXT PRIMARY KEY, doc_id TEXT, content_hash TEXT, version INTEGER)'
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def lookup(self, content_hash):
+        """Return the document id already indexed for this content, or None"""
+        row = self._connection().execute(
+            'SELECT doc_id FROM fingerprints WHERE content_hash = ?', (content_hash,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def next_version(self, filename):
+        """Return (version for new content under `filename`, id of the doc it supersedes)"""
+        row = self._connection().execute(
+            'SELECT doc_id, version FROM versions WHERE filename = ?', (filename,)
+        ).fetchone()
+        if row is None:
+            return 1, None
+        return row[1] + 1, row[0]
+
+    def record(self, content_hash, doc_id, filename, version=1):
+        """Remember that `content_hash` is indexed as `doc_id` and is the current `filename`"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO fingerprints (content_hash, doc_id, filename, indexed_at) '
+                'VALUES (?, ?, ?, ?)',
+                (content_hash, doc_id, filename, time.time())
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO versions (filename, doc_id, content_hash, version) '
+                'VALUES (?, ?, ?, ?)',
+                (filename, doc_id, content_hash, version)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def in_use(self, doc_id):
+        """Check whether `doc_id` is still the current version of any filename"""
+        row = self._connection().execute(
+            'SELECT 1 FROM versions WHERE doc_id = ? LIMIT 1', (doc_id,)
+        ).fetchone()
+        return row is not None
+
+    def forget(self, doc_id):
+        """Drop every record of `doc_id`, e.g. after it was deleted from the index"""
+        conn = self._connection()
+        conn.execute('DELETE FROM fingerprints WHERE doc_id = ?', (doc_id,))
+        conn.execute('DELETE FROM versions WHERE doc_id = ?', (doc_id,))
+
+
+def delete_superseded(es, index_name, superseded_id, doc_id, fingerprints):
+    """Delete the previous version of a document once its replacement is indexed"""
+    if not superseded_id or superseded_id == doc_id:
+        return False
+    # The same content may still be current under another filename
+    if fingerprints.in_use(superseded_id):
+        return False
+    try:
+        es.delete(index=index_name, id=superseded_id)
+    except Exception as e:
+        # Already gone (404) is fine; anything else is left for a later re-index
+        if getattr(e, 'status_code', None) != 404:
+            raise
+    fingerprints.forget(superseded_id)
+    return True
+
+
+def stamp_document(document, content_hash, filename, fingerprints):
+    """Add identity fields to `document` before indexing it
+
+    Returns an identity dict (doc_id, content_hash, filename, version,
+    superseded_id) to pass to `record_indexed` once indexing succeeded.
+    """
+    doc_id = document_id(content_hash)
+    version, superseded_id = fingerprints.next_version(filename)
+    if superseded_id == doc_id:
+        # Same content re-indexed under the same name: not a new version
+        version -= 1
+    document['content_hash'] = content_hash
+    document['version'] = version
+    return {
+        'doc_id': doc_id,
+        'content_hash': content_hash,
+        'filename': filename,
+        'version': version,
+        'superseded_id': superseded_id
+    }
+
+
+def record_indexed(es, index_name, identity, fingerprints):
+    """Record an indexed document and delete the previous version it replaced
+
+    Returns True if a superseded document was deleted.
+    """
+    fingerprints.record(identity['content_hash'], identity['doc_id'], identity['filename'], identity['version'])
+    return delete_superseded(es, index_name, identity['superseded_id'], identity['doc_id'], fingerprints)
+
+
+def iter_new_documents(documents, fingerprints, identities, skipped=None):
+    """Filter (name, document) pairs down to content that is not indexed yet
+
+    Each yielded document is stamped with its identity, which is stored in
+    `identities` under its name. (name, content hash) of skipped duplicates
+    are appended to `skipped` when given.
+    """
+    for name, document in documents:
+        content_hash = document_hash(document)
+        if fingerprints.lookup(content_hash):
+            if skipped is not None:
+                skipped.append((name, content_hash))
+            continue
+        identities[name] = stamp_document(document, content_hash, document.get('filename', name), fingerprints)
+        yield name, document
@@ -0,0 +1,135 @@
+import gzip
+import json
+import os
+import re
+import shutil
+import uuid
+
+# Files kept for each document: download kind -> (file name, mimetype)
+KINDS = {
+    'text': ('content.txt', 'text/plain'),  # servers add the utf-8 charset to text/* types
+    'json': ('document.json', 'application/json; charset=utf-8'),
+    'original': ('original.docx', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+}
+META = 'meta.json'
+# Text downloads also kept gzip-compressed, for clients that accept it
+COMPRESSED = ('text', 'json')
+# Characters written per call, so large documents are never encoded in one piece
+WRITE_CHARS = 256 * 1024
+
+SAFE_ID = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+
+
+def json_chunks(document):
+    """Pretty-printed JSON of a document, encoded piece by piece"""
+    return json.JSONEncoder(indent=2).iterencode(document)
+
+
+def text_chunks(document):
+    """Plain-text download body, as /download has always built it, in pieces"""
+    if 'content' in document:
+        content = document['content']
+        for start in range(0, len(content), WRITE_CHARS):
+            yield content[start:start + WRITE_CHARS]
+    elif 'paragraphs' in document:
+        for number, paragraph in enumerate(document['paragraphs']):
+            yield '\n\n' + paragraph if number else paragraph
+    else:
+        yield from json_chunks(document)
+
+
+class DocumentStore:
+    """Content-addressed files for each indexed document
+
+    Documents live under <root>/<first two id chars>/<id>/ as ready-to-send
+    files: the plain text, the JSON source and (for uploads) the original
+    .docx, plus the names used for downloads. Ids are content hashes, so a
+    file never changes once written and can be served straight from disk
+    with a strong ETag. Text and JSON are also kept gzip-compressed. Files
+    are written to a temporary name and renamed, so readers never see
+    partial content, and are written in pieces rather than built up as one
+    string first.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._hits = 0
+        self._misses = 0
+
+    def _folder(self, doc_id):
+        if not SAFE_ID.match(doc_id):
+            return None
+        return os.path.join(self.root, doc_id[:2], doc_id)
+
+    def _write(self, path, data=None, stream=None):
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'wb') as file:
+            if stream is not None:
+                shutil.copyfileobj(stream, file, 1024 * 1024)
+            else:
+                file.write(data)
+        os.replace(temp_path, path)
+
+    def _write_text(self, path, chunks):
+        """Write text chunks to `path` and a gzip copy to `path`.gz in one pass"""
+        suffix = f".{uuid.uuid4().hex}.tmp"
+        with open(path + suffix, 'w', encoding='utf-8') as plain, \
+                gzip.open(path + '.gz' + suffix, 'wt', encoding='utf-8', compresslevel=6) as compressed:
+            for chunk in chunks:
+                plain.write(chunk)
+                compressed.write(chunk)
+        os.replace(path + '.gz' + suffix, path + '.gz')
+        os.replace(path + suffix, path)
+
+    def put(self, doc_id, document, original=None):
+        """Store a document's downloads; `original` is an optional binary file object"""
+        folder = self._folder(doc_id)
+        if folder is None:
+            return False
+        os.makedirs(folder, exist_ok=True)
+        self._write_text(os.path.join(folder, KINDS['text'][0]), text_chunks(document))
+        self._write_text(os.path.join(folder, KINDS['json'][0]), json_chunks(document))
+        if original is not None:
+            original.seek(0)
+            self._write(os.path.join(folder, KINDS['original'][0]), stream=original)
+            original.seek(0)
+        meta = {'title': document.get('title'), 'filename': document.get('filename')}
+        self._write(os.path.join(folder, META), json.dumps(meta).encode('utf-8'))
+        return True
+
+    def get(self, doc_id, kind, gzipped=False):
+        """Return (path, mimetype, meta) for a stored download, or None
+
+        With `gzipped`, the path is the compressed copy when there is one;
+        callers can tell from its .gz suffix.
+        """
+        folder = self._folder(doc_id)
+        if folder is None:
+            return None
+        name, mimetype = KINDS[kind]
+        path = os.path.join(folder, name)
+        if gzipped and kind in COMPRESSED and os.path.exists(path + '.gz'):
+            path += '.gz'
+        try:
+            with open(os.path.join(folder, META)) as file:
+                meta = json.load(file)
+        except (FileNotFoundError, ValueError):
+            meta = None
+        if meta is None or not os.path.exists(path):
+            self._misses += 1
+            return None
+        self._hits += 1
+        return path, mimetype, meta
+
+    def delete(self, doc_id):
+        folder = self._folder(doc_id)
+        if folder is not None:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def stats(self):
+        lookups = self._hits + self._misses
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,143 @@
+import re
+import zipfile
+
+from lxml import etree
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W = '{%s}' % W_NS
+
+HEADING_STYLE = re.compile(r'^heading\s?(\d)$', re.IGNORECASE)
+HEADER_PART = re.compile(r'^word/header\d*\.xml$')
+FOOTER_PART = re.compile(r'^word/footer\d*\.xml$')
+
+
+def _paragraph_text(paragraph):
+    """Text of a w:p element, with tabs and line breaks like python-docx"""
+    parts = []
+    for node in paragraph.iter(W + 't', W + 'tab', W + 'br', W + 'cr'):
+        if node.tag == W + 't':
+            parts.append(node.text or '')
+        elif node.tag == W + 'tab':
+            parts.append('\t')
+        else:
+            parts.append('\n')
+    return ''.join(parts)
+
+
+def _heading_level(paragraph):
+    """Heading level from the paragraph style or outline level, or None"""
+    ppr = paragraph.find(W + 'pPr')
+    if ppr is None:
+        return None
+    style = ppr.find(W + 'pStyle')
+    if style is not None:
+        style_id = style.get(W + 'val', '')
+        if style_id.lower() == 'title':
+            return 0
+        match = HEADING_STYLE.match(style_id)
+        if match:
+            return int(match.group(1))
+    outline = ppr.find(W + 'outlineLvl')
+    if outline is not None:
+        return int(outline.get(W + 'val', '0')) + 1
+    return None
+
+
+def _iter_part(stream, part_type):
+    """Yield sections from one WordprocessingML part, releasing elements as it goes
+
+    Only the element currently being read and its ancestors stay in memory:
+    each finished paragraph is cleared and detached from its parent, so
+    memory stays bounded no matter how long the document is.
+    """
+    table_depth = 0
+    table_index = -1
+    row_index = -1
+    col_index = -1
+
+    for event, elem in etree.iterparse(stream, events=('start', 'end'), huge_tree=True):
+        tag = elem.tag
+        if event == 'start':
+            if tag == W + 'tbl':
+                table_depth += 1
+                if table_depth == 1:
+                    table_index += 1
+                    row_index = -1
+            elif tag == W + 'tr' and table_depth == 1:
+                row_index += 1
+                col_index = -1
+            elif tag == W + 'tc' and table_depth == 1:
+                col_index += 1
+            continue
+
+        if tag == W + 'p':
+            text = _paragraph_text(elem)
+            if text.strip():
+                if table_depth:
+                    yield {'type': 'table_cell', 'text': text,
+                           'table': table_index, 'row': row_index, 'col': col_index}
+                elif part_type != 'body':
+                    yield {'type': part_type, 'text': text}
+                else:
+                    level = _heading_level(elem)
+                    if level is not None:
+                        yield {'type': 'heading', 'text': text, 'level': level}
+                    else:
+                        yield {'type': 'paragraph', 'text': text}
+            _release(elem)
+        elif tag == W + 'tbl':
+            table_depth -= 1
+            _release(elem)
+        elif tag in (W + 'drawing', W + 'pict', W + 'object'):
+            # Embedded objects: any text boxes inside were already yielded
+            elem.clear()
+
+
+def _release(elem):
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        # Drop already-processed siblings so the parsed tree never grows
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+def iter_sections(source):
+    """Yield the structured sections of a .docx file one at a time
+
+    `source` is a path or a binary file-like object. Sections are dicts with
+    a 'type' of 'header', 'heading', 'paragraph', 'table_cell' or 'footer'
+    and their 'text'; headings carry a 'level' (0 for Title) and table cells
+    their 'table', 'row' and 'col' position. Header and footer text that
+    repeats across sections of the document is yielded once.
+    """
+    with zipfile.ZipFile(source) as archive:
+        names = archive.namelist()
+        headers = sorted(name for name in names if HEADER_PART.match(name))
+        footers = sorted(name for name in names if FOOTER_PART.match(name))
+
+        seen = set()
+        for part_type, parts in (('header', headers), ('body', ['word/document.xml']), ('footer', footers)):
+            for name in parts:
+                with archive.open(name) as stream:
+                    for section in _iter_part(stream, part_type):
+                        if part_type != 'body':
+                            if section['text'] in seen:
+                                continue
+                            seen.add(section['text'])
+                        yield section
+
+
+def extract_text(source):
+    """Return (paragraphs, headings) text lists for a .docx file
+
+    Paragraph texts include headings and table cells in document order;
+    headings are also listed on their own.
+    """
+    paragraphs = []
+    headings = []
+    for section in iter_sections(source):
+        paragraphs.append(section['text'])
+        if section['type'] == 'heading':
+            headings.append(section['text'])
+    return paragraphs, headings
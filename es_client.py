@@ -0,0 +1,359 @@
+import asyncio
+import os
+import random
+import socket
+import threading
+import time
+
+from elastic_transport import (AiohttpHttpNode, AsyncTransport, ConnectionError as ESConnectionError,
+                               ConnectionTimeout, Transport, Urllib3HttpNode)
+from elastic_transport.client_utils import DEFAULT
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+from urllib3.connection import HTTPConnection
+
+# Connections kept open per Elasticsearch node; bulk loaders ask for at least one per sender thread
+POOL_SIZE = int(os.environ.get('ES_POOL_SIZE', 10))
+# Default seconds before a request is abandoned; see OPERATION_TIMEOUTS for exceptions
+REQUEST_TIMEOUT = float(os.environ.get('ES_REQUEST_TIMEOUT', 30))
+# gzip request bodies (mostly _bulk) and accept gzip responses
+HTTP_COMPRESS = os.environ.get('ES_HTTP_COMPRESS', '1') != '0'
+
+# Overloaded or restarting cluster, or a dropped connection: retried with exponential backoff
+# (base * 2^attempt, capped, with jitter). 500s are not retried; Elasticsearch uses them for
+# errors that would fail again. This is the only retry layer: callers do not retry these themselves.
+MAX_RETRIES = int(os.environ.get('ES_MAX_RETRIES', 3))
+RETRY_ON_STATUS = (429, 502, 503, 504)
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_CAP = 8.0
+
+# Request timeouts for individual top-level APIs, in seconds
+OPERATION_TIMEOUTS = {
+    'ping': 3,
+    'get': 5,
+    'search': 10,
+    'count': 10,
+    'open_point_in_time': 10,
+    'close_point_in_time': 5,
+    'index': 30,
+    'bulk': 120,
+    'delete_by_query': 300
+}
+
+# Probe idle pooled sockets so connections dropped by a load balancer are noticed
+KEEPALIVE_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)] + [
+    (socket.IPPROTO_TCP, getattr(socket, name), value)
+    for name, value in (('TCP_KEEPIDLE', 60), ('TCP_KEEPINTVL', 15), ('TCP_KEEPCNT', 4))
+    if hasattr(socket, name)
+]
+
+
+def backoff_seconds(attempt):
+    """Delay before retry number `attempt` (1-based): half fixed, half random"""
+    delay = min(RETRY_BACKOFF_CAP, RETRY_BACKOFF_BASE * 2 ** (attempt - 1)) / 2
+    return delay + random.uniform(0, delay)
+
+
+# Callbacks told about every request a client from this module makes: callback(operation, seconds, status),
+# with the status None when no response came back; see add_request_observer
+REQUEST_OBSERVERS = []
+# Request path segments that name the API; the rest are index names and ids
+DOCUMENT_OPERATIONS = {'GET': 'get', 'HEAD': 'exists', 'DELETE': 'delete'}
+
+
+def add_request_observer(callback):
+    """Call `callback(operation, seconds, status)` after each request, retries included"""
+    REQUEST_OBSERVERS.append(callback)
+
+
+def operation_name(method, target):
+    """Short API name for a request, such as 'search', 'bulk' or 'get'"""
+    parts = [part for part in target.split('?', 1)[0].split('/') if part]
+    for part in parts:
+        if part in ('_doc', '_create', '_update', '_source'):
+            return DOCUMENT_OPERATIONS.get(method, 'index')
+        if part.startswith('_'):
+            return part[1:]
+    return 'ping' if not parts else 'indices'
+
+
+def notify_observers(method, target, started, status):
+    operation = operation_name(method, target)
+    seconds = time.perf_counter() - started
+    for callback in REQUEST_OBSERVERS:
+        try:
+            callback(operation, seconds, status)
+        except Exception as e:
+            print(f"Request observer failed: {e}")
+
+
+def retry_limit(transport, kwargs):
+    """Retries allowed for a request: a per-request max_retries (client.options) or the transport's"""
+    max_retries = kwargs.get('max_retries', DEFAULT)
+    return transport.max_retries if max_retries is DEFAULT else max_retries
+
+
+def retryable_error(error, retry_on_timeout):
+    """Whether a failed attempt is worth repeating: the connection failed, or timed out when allowed"""
+    if isinstance(error, ConnectionTimeout):
+        return retry_on_timeout
+    return isinstance(error, ESConnectionError)
+
+
+def retry_settings(transport, kwargs):
+    """(max_retries, retry_on_timeout) for a request, then limits the base class to one attempt"""
+    max_retries = retry_limit(transport, kwargs)
+    retry_on_timeout = kwargs.get('retry_on_timeout', DEFAULT)
+    if retry_on_timeout is DEFAULT:
+        retry_on_timeout = transport.retry_on_timeout
+    kwargs.update(max_retries=0, retry_on_status=())
+    return max_retries, retry_on_timeout
+
+
+class BackoffTransport(Transport):
+    """Transport that retries failed requests itself, with backoff
+
+    elastic_transport backs off between retries after connection errors
+    but retries throttled responses immediately, which only adds load to a
+    cluster that is already shedding it. Here the base class makes a
+    single attempt (it still marks a failed node dead), and both
+    connection errors and 429/5xx responses are retried by this loop with
+    backoff_seconds, up to max_retries in total. Each call, retries
+    included, is reported to REQUEST_OBSERVERS.
+    """
+
+    def perform_request(self, method, target, **kwargs):
+        max_retries, retry_on_timeout = retry_settings(self, kwargs)
+        started = time.perf_counter()
+        status = None
+        try:
+            for attempt in range(1, max_retries + 2):
+                try:
+                    response = super().perform_request(method, target, **kwargs)
+                except Exception as e:
+                    if attempt > max_retries or not retryable_error(e, retry_on_timeout):
+                        raise
+                else:
+                    status = response.meta.status
+                    if status not in RETRY_ON_STATUS or attempt > max_retries:
+                        return response
+                time.sleep(backoff_seconds(attempt))
+        finally:
+            if REQUEST_OBSERVERS:
+                notify_observers(method, target, started, status)
+
+
+class AsyncBackoffTransport(AsyncTransport):
+    """BackoffTransport for AsyncElasticsearch"""
+
+    async def perform_request(self, method, target, **kwargs):
+        max_retries, retry_on_timeout = retry_settings(self, kwargs)
+        started = time.perf_counter()
+        status = None
+        try:
+            for attempt in range(1, max_retries + 2):
+                try:
+                    response = await super().perform_request(method, target, **kwargs)
+                except Exception as e:
+                    if attempt > max_retries or not retryable_error(e, retry_on_timeout):
+                        raise
+                else:
+                    status = response.meta.status
+                    if status not in RETRY_ON_STATUS or attempt > max_retries:
+                        return response
+                await asyncio.sleep(backoff_seconds(attempt))
+        finally:
+            if REQUEST_OBSERVERS:
+                notify_observers(method, target, started, status)
+
+
+class NodeStats:
+    """Usage counters shared by the sync and async node classes"""
+
+    def _init_stats(self):
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counters = {
+            'requests': 0,
+            'errors': 0,
+            'retryable_responses': 0,
+            'peak_in_flight': 0,
+            'total_ms': 0.0
+        }
+
+    def _request_started(self):
+        with self._lock:
+            self._in_flight += 1
+            self._counters['requests'] += 1
+            self._counters['peak_in_flight'] = max(self._counters['peak_in_flight'], self._in_flight)
+        return time.perf_counter()
+
+    def _request_finished(self, started, status):
+        with self._lock:
+            self._in_flight -= 1
+            self._counters['total_ms'] += (time.perf_counter() - started) * 1000
+            if status is None:
+                self._counters['errors'] += 1
+            elif status in RETRY_ON_STATUS:
+                self._counters['retryable_responses'] += 1
+
+    def connection_stats(self):
+        """max_connections, connections_in_use and connections_opened for this node's pool"""
+        raise NotImplementedError
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, in_flight=self._in_flight)
+        requests = stats.pop('requests')
+        total_ms = stats.pop('total_ms')
+        stats.update(
+            node=self.base_url,
+            requests=requests,
+            avg_ms=round(total_ms / requests, 2) if requests else 0.0,
+            **self.connection_stats()
+        )
+        return stats
+
+
+class PooledNode(NodeStats, Urllib3HttpNode):
+    """urllib3 node with TCP keep-alive on its pooled sockets and usage counters"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.pool.conn_kw['socket_options'] = HTTPConnection.default_socket_options + KEEPALIVE_OPTIONS
+        self._init_stats()
+
+    def perform_request(self, *args, **kwargs):
+        started = self._request_started()
+        status = None
+        try:
+            response = super().perform_request(*args, **kwargs)
+            status = response.meta.status
+            return response
+        finally:
+            self._request_finished(started, status)
+
+    def connection_stats(self):
+        # urllib3 pre-fills its queue with one slot per allowed connection; slots out of it are in use
+        slots = self.pool.pool
+        return {
+            'max_connections': slots.maxsize,
+            'connections_in_use': slots.maxsize - slots.qsize(),
+            'connections_opened': self.pool.num_connections
+        }
+
+
+class AsyncPooledNode(NodeStats, AiohttpHttpNode):
+    """aiohttp node with the same usage counters as PooledNode"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self._init_stats()
+
+    async def perform_request(self, *args, **kwargs):
+        started = self._request_started()
+        status = None
+        try:
+            response = await super().perform_request(*args, **kwargs)
+            status = response.meta.status
+            return response
+        finally:
+            self._request_finished(started, status)
+
+    def connection_stats(self):
+        # The aiohttp session, and its connector, are created on the first request
+        connector = self.session.connector if self.session is not None else None
+        in_use = len(connector._acquired) if connector is not None else 0
+        idle = sum(len(connections) for connections in connector._conns.values()) if connector is not None else 0
+        return {
+            'max_connections': self._connections_per_node,
+            'connections_in_use': in_use,
+            'connections_opened': in_use + idle
+        }
+
+
+def client_options(connections_per_node=None, **overrides):
+    """Keyword arguments shared by every client this module creates"""
+    options = {
+        'verify_certs': False,
+        'connections_per_node': max(connections_per_node or 0, POOL_SIZE),
+        'request_timeout': REQUEST_TIMEOUT,
+        'http_compress': HTTP_COMPRESS,
+        'max_retries': MAX_RETRIES,
+        'retry_backoff_base': RETRY_BACKOFF_BASE,
+        'retry_backoff_cap': RETRY_BACKOFF_CAP
+    }
+    options.update(overrides)
+    return options
+
+
+def auth_options(api_key=None, username=None, password=None):
+    """API key if given, otherwise basic auth"""
+    if api_key:
+        return {'api_key': api_key}
+    if username and password:
+        return {'basic_auth': (username, password)}
+    return {}
+
+
+def create_client(url, api_key=None, username=None, password=None, connections_per_node=None, **overrides):
+    """A tuned synchronous client; `connections_per_node` raises the pool size for concurrent senders"""
+    options = client_options(connections_per_node, node_class=PooledNode, transport_class=BackoffTransport, **overrides)
+    return Elasticsearch(url, **auth_options(api_key, username, password), **options)
+
+
+def create_async_client(url, api_key=None, username=None, password=None, connections_per_node=None, **overrides):
+    """A tuned AsyncElasticsearch client with the same pool, timeout and retry settings"""
+    options = client_options(connections_per_node, node_class=AsyncPooledNode, transport_class=AsyncBackoffTransport,
+                             **overrides)
+    return AsyncElasticsearch(url, **auth_options(api_key, username, password), **options)
+
+
+def pool_stats(client):
+    """Usage counters for each node of a client created by create_client or create_async_client"""
+    return [node.stats() for node in client.transport.node_pool.all() if isinstance(node, NodeStats)]
+
+
+class SharedClient:
+    """Per-process client, created on first use so each forked worker opens its own sockets
+
+    Attribute access goes to this process's client. Top-level APIs listed
+    in OPERATION_TIMEOUTS run with their own request timeout.
+    """
+
+    def __init__(self, url, **kwargs):
+        self._url = url
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._pid = None
+        self._client = None
+        self._timed = {}
+
+    def client(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Sockets inherited from a parent process are never reused
+                    self._client = create_client(self._url, **self._kwargs)
+                    self._timed = {}
+                    self._pid = os.getpid()
+        return self._client
+
+    def __getattr__(self, name):
+        client = self.client()
+        timeout = OPERATION_TIMEOUTS.get(name)
+        if timeout is None:
+            return getattr(client, name)
+        timed = self._timed.get(timeout)
+        if timed is None:
+            timed = self._timed[timeout] = client.options(request_timeout=timeout)
+        return getattr(timed, name)
+
+    def stats(self):
+        if self._pid != os.getpid():
+            return []
+        return pool_stats(self._client)
+
+    def close(self):
+        if self._pid == os.getpid():
+            self._client.close()
+            self._pid = None
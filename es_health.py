@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+
+CLOSED = 'closed'        # cluster reachable; requests go through
+OPEN = 'open'            # cluster failing; callers skip it until a probe succeeds
+HALF_OPEN = 'half_open'  # reset timeout passed; the next probe decides
+
+
+class HealthMonitor:
+    """Background cluster probe with circuit-breaker state
+
+    A daemon thread pings the cluster every `interval` seconds, so routes
+    and ingest paths can ask `available()` (a field read) instead of
+    issuing their own ping before each request. Callers also report the
+    outcome of their real requests with `record_success` and
+    `record_failure`.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    `available()` is false. Once `reset_timeout` seconds have passed the
+    circuit is half-open and the next probe, sent immediately, decides:
+    success closes it, failure opens it for another `reset_timeout`.
+    Until the first probe finishes the cluster is assumed available.
+    """
+
+    def __init__(self, es_client, interval=10.0, failure_threshold=3, reset_timeout=30.0, probe_timeout=3.0):
+        self.es_client = es_client
+        self.interval = interval
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._closed.set()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._pid = None
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._last_error = None
+        self._stats = {
+            'probes': 0,
+            'probe_failures': 0,
+            'reported_failures': 0,
+            'times_opened': 0,
+            'last_probe_ms': 0.0,
+            'last_probe_at': None
+        }
+
+    def _ensure_started(self):
+        """Start the probe thread, restarting it after a fork"""
+        # Threads do not survive fork(), so each gunicorn worker starts its own
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='es-health', daemon=True)
+            self._thread.start()
+
+    def _set_state(self, state):
+        # Called with the lock held
+        if state == OPEN and self._state != OPEN:
+            self._stats['times_opened'] += 1
+        if state == OPEN:
+            self._opened_at = time.time()
+        self._state = state
+        if state == CLOSED:
+            self._closed.set()
+        else:
+            self._closed.clear()
+
+    def available(self):
+        """Whether requests should be sent to the cluster"""
+        self._ensure_started()
+        return self._state == CLOSED
+
+    @property
+    def state(self):
+        self._ensure_started()
+        return self._state
+
+    def wait_until_available(self, timeout=None):
+        """Block until the circuit closes or `timeout` seconds pass; returns available()"""
+        self._ensure_started()
+        return self._closed.wait(timeout)
+
+    def record_success(self):
+        """Report a request the cluster served"""
+        if self._failures or self._state != CLOSED:
+            with self._lock:
+                self._failures = 0
+                self._set_state(CLOSED)
+
+    def record_failure(self, error=None):
+        """Report a request that failed because the cluster was unreachable or overloaded"""
+        with self._lock:
+            self._stats['reported_failures'] += 1
+            self._failure(error)
+
+    def _failure(self, error):
+        # Called with the lock held
+        self._failures += 1
+        self._last_error = str(error) if error is not None else None
+        if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+            self._set_state(OPEN)
+        if self._state == OPEN:
+            # Probe again as soon as the reset timeout is up
+            self._wake.set()
+
+    def probe(self):
+        """Ping the cluster once and update the state; returns whether it answered"""
+        started = time.time()
+        try:
+            # One attempt with a short timeout: the probe must not wait out the client's retries
+            healthy = self.es_client.options(request_timeout=self.probe_timeout, max_retries=0).ping()
+            error = None if healthy else 'ping failed'
+        except Exception as e:
+            healthy = False
+            error = e
+        with self._lock:
+            self._stats['probes'] += 1
+            self._stats['last_probe_ms'] = round((time.time() - started) * 1000, 2)
+            self._stats['last_probe_at'] = started
+            if healthy:
+                self._failures = 0
+                self._set_state(CLOSED)
+            else:
+                self._stats['probe_failures'] += 1
+                self._failure(error)
+        return healthy
+
+    def _next_probe_delay(self):
+        with self._lock:
+            if self._state != OPEN:
+                return self.interval
+            remaining = self._opened_at + self.reset_timeout - time.time()
+            if remaining > 0:
+                return remaining
+            self._set_state(HALF_OPEN)
+            return 0
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.probe()
+            while not self._stop_event.is_set():
+                delay = self._next_probe_delay()
+                if delay <= 0:
+                    break
+                self._wake.clear()
+                if not self._wake.wait(delay) and self._state != OPEN:
+                    break
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update(
+                state=self._state,
+                consecutive_failures=self._failures,
+                last_error=self._last_error,
+                open_for_seconds=round(time.time() - self._opened_at, 1) if self._state != CLOSED else None
+            )
+        return snapshot
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+
+
+class EventCoalescer:
+    """Debounce file system events and emit each finished file exactly once
+
+    `notify(path)` is cheap and never blocks, so it is safe to call from the
+    watchdog observer thread for every created/modified/moved event. A
+    background thread waits until a path has been quiet for `debounce`
+    seconds and its size/mtime stayed the same for `stable_checks`
+    consecutive polls (and it can be opened for reading), then calls
+    `callback(path)`.
+
+    A path stays claimed from the moment it is emitted until the consumer
+    calls `done(path)`; events arriving meanwhile are ignored. After that, a
+    new event only re-emits the path if its size or mtime changed, so
+    duplicate OS events never turn into duplicate uploads.
+    """
+
+    def __init__(self, callback, debounce=0.5, poll_interval=0.25, stable_checks=2):
+        self.callback = callback
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.stable_checks = stable_checks
+
+        self._lock = threading.Lock()
+        self._pending = {}      # path -> [last event time, last signature, stable count]
+        self._in_flight = set()
+        self._emitted = {}      # path -> signature at emit time
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._stats = {'events': 0, 'coalesced': 0, 'emitted': 0, 'ignored': 0}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='event-coalescer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+
+    def notify(self, path):
+        """Record an event for `path`; repeated events restart its quiet period"""
+        with self._lock:
+            self._stats['events'] += 1
+            if path in self._in_flight:
+                self._stats['ignored'] += 1
+                return
+            entry = self._pending.get(path)
+            if entry is None:
+                self._pending[path] = [time.time(), None, 0]
+            else:
+                entry[0] = time.time()
+                self._stats['coalesced'] += 1
+
+    def done(self, path, forget=False):
+        """Release a path emitted earlier so future changes can be picked up
+
+        Pass `forget=True` once the file has been moved away, so a new file
+        dropped under the same name is always treated as new.
+        """
+        with self._lock:
+            self._in_flight.discard(path)
+            if forget:
+                self._emitted.pop(path, None)
+
+    def _run(self):
+        while not self._stop_event.wait(self.poll_interval):
+            for path in self._ready_paths():
+                try:
+                    self.callback(path)
+                except Exception as e:
+                    print(f"Error handling file event for {path}: {e}")
+                    self.done(path)
+
+    def _ready_paths(self):
+        """Return pending paths whose writes have completed, claiming them"""
+        now = time.time()
+        with self._lock:
+            candidates = [path for path, entry in self._pending.items() if now - entry[0] >= self.debounce]
+
+        ready = []
+        for path in candidates:
+            signature = _signature(path)
+            with self._lock:
+                entry = self._pending.get(path)
+                if entry is None:
+                    continue
+                if signature is None:
+                    # File vanished (moved away or deleted) before it settled
+                    del self._pending[path]
+                    continue
+                if signature != entry[1]:
+                    entry[1] = signature
+                    entry[2] = 0
+                    continue
+                entry[2] += 1
+                if entry[2] < self.stable_checks or not _readable(path):
+                    continue
+
+                del self._pending[path]
+                if self._emitted.get(path) == signature:
+                    # Same bytes as last time: a duplicate event, not a new version
+                    self._stats['ignored'] += 1
+                    continue
+                self._emitted[path] = signature
+                self._in_flight.add(path)
+                self._stats['emitted'] += 1
+                ready.append(path)
+        return ready
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['pending'] = len(self._pending)
+            snapshot['in_flight'] = len(self._in_flight)
+        return snapshot
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _readable(path):
+    # On Windows a file still being written by another process cannot be opened
+    try:
+        with open(path, 'rb'):
+            return True
+    except OSError:
+        return False
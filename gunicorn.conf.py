@@ -1,3 +1,15 @@
+import sys
+
 bind = "0.0.0.0:10000"
 workers = 2
-timeout = 120
\ No newline at end of file
+timeout = 120
+
+def worker_exit(server, worker):
+    # Finish running upload jobs, publish final metrics and flush queued log documents before the worker goes away
+    search_app = sys.modules.get('search_app')
+    if search_app is not None:
+        search_app.upload_jobs.shutdown()
+        search_app.registry.close()
+        search_app.log_shipper.close(timeout=10.0)
+        search_app.cluster_health.stop()
+        search_app.es.close()
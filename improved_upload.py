@@ -1,9 +1,12 @@
 import os
 import json
 import argparse
-from elasticsearch import Elasticsearch
+from es_client import create_client
+from bulk_ingest import bulk_ingest, iter_json_documents, print_report
+import doc_identity
+from index_management import ensure_alias
 
-def upload_json_files(folder_path, es_url, username=None, password=None, api_key=None, index_name="documents"):
+def upload_json_files(folder_path, es_url, username=None, password=None, api_key=None, index_name="documents", bulk=False, workers=4, chunk_size=500, fingerprint_path=None):
     # Connect to Elasticsearch
     es = None
     connection_successful = False
@@ -13,7 +16,7 @@ def upload_json_files(folder_path, es_url, username=None, password=None, api_key
     if api_key:
         try:
             print(f"Attempting to connect with API key...")
-            es = Elasticsearch(es_url, api_key=api_key, verify_certs=False)
+            es = create_client(es_url, api_key=api_key, connections_per_node=workers)
             if es.ping():
                 print("✓ Connection successful with API key!")
                 connection_successful = True
@@ -27,7 +30,7 @@ def upload_json_files(folder_path, es_url, username=None, password=None, api_key
     if not connection_successful and username and password:
         try:
             print(f"Attempting to connect with username/password...")
-            es = Elasticsearch(es_url, basic_auth=(username, password), verify_certs=False)
+            es = create_client(es_url, username=username, password=password, connections_per_node=workers)
             if es.ping():
                 print("✓ Connection successful with username/password!")
                 connection_successful = True
@@ -46,26 +49,30 @@ def upload_json_files(folder_path, es_url, username=None, password=None, api_key
     
     # Create index if it doesn't exist
     try:
-        if not es.indices.exists(index=index_name):
-            print(f"Creating index '{index_name}'...")
-            mapping = {
-                "mappings": {
-                    "properties": {
-                        "title": {"type": "text"},
-                        "filename": {"type": "keyword"},
-                        "content": {"type": "text"},
-                        "paragraphs": {"type": "text"}
-                    }
-                }
-            }
-            es.indices.create(index=index_name, body=mapping)
-            print(f"Index '{index_name}' created successfully")
-        else:
-            print(f"Index '{index_name}' already exists")
+        # A versioned index behind an alias named `index_name`
+        print(f"Writing to '{index_name}' ({ensure_alias(es, index_name, 'documents')})")
     except Exception as e:
         print(f"Error creating/checking index: {str(e)}")
         return
     
+    # Local record of already-indexed content, one per target index
+    fingerprints = doc_identity.FingerprintIndex(
+        fingerprint_path or os.path.join(folder_path, f".{index_name}.fingerprints.sqlite3")
+    )
+    
+    # Bulk mode: stream new files through concurrent _bulk senders
+    if bulk:
+        identities = {}
+        skipped = []
+        documents = doc_identity.iter_new_documents(iter_json_documents(folder_path), fingerprints, identities, skipped)
+        stats = bulk_ingest(
+            es, index_name, documents, workers=workers, chunk_docs=chunk_size,
+            on_indexed=lambda name, doc_id: doc_identity.record_indexed(es, index_name, identities[name], fingerprints)
+        )
+        print_report(stats, index_name)
+        print(f"Skipped {len(skipped)} unchanged files")
+        return
+    
     # Process all JSON files in the folder
     json_files = [f for f in os.listdir(folder_path) if f.endswith('.json')]
     
@@ -83,8 +90,17 @@ def upload_json_files(folder_path, es_url, username=None, password=None, api_key
             with open(file_path, 'r', encoding='utf-8') as file:
                 doc = json.load(file)
             
-            # Index the document
-            result = es.index(index=index_name, document=doc)
+            # Skip content that is already indexed
+            content_hash = doc_identity.document_hash(doc)
+            if fingerprints.lookup(content_hash):
+                print(f"Skipped {filename}: unchanged")
+                success_count += 1
+                continue
+            identity = doc_identity.stamp_document(doc, content_hash, doc.get('filename', filename), fingerprints)
+            
+            # Index the document under its content-derived id
+            result = es.index(index=index_name, id=identity['doc_id'], document=doc)
+            doc_identity.record_indexed(es, index_name, identity, fingerprints)
             print(f"Indexed {filename}: {result['result']}")
             success_count += 1
             
@@ -103,6 +119,10 @@ if __name__ == "__main__":
     parser.add_argument("--password", help="Elasticsearch password")
     parser.add_argument("--api-key", help="Elasticsearch API key")
     parser.add_argument("--index", default="documents", help="Elasticsearch index name")
+    parser.add_argument("--bulk", action="store_true", help="Use parallel _bulk ingestion")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent bulk senders (with --bulk)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Documents per bulk request (with --bulk)")
+    parser.add_argument("--fingerprints", help="Fingerprint database path (default: inside the folder)")
     
     args = parser.parse_args()
     
@@ -117,5 +137,9 @@ if __name__ == "__main__":
         args.username,
         args.password,
         args.api_key,
-        args.index
+        args.index,
+        bulk=args.bulk,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        fingerprint_path=args.fingerprints
     )
\ No newline at end of file
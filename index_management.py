@@ -0,0 +1,267 @@
+import argparse
+import time
+
+from elasticsearch import ApiError
+
+from es_client import create_client
+
+# Text fields searched and highlighted: offsets in the postings let the
+# unified highlighter skip re-analysing the stored text
+HIGHLIGHTED_TEXT = {"type": "text", "index_options": "offsets"}
+
+# Exact-match companion for short text fields (sorting, aggregations, term lookups)
+KEYWORD_SUBFIELD = {"keyword": {"type": "keyword", "ignore_above": 256}}
+
+# Strings in log and metric documents are identifiers, not prose
+STRINGS_AS_KEYWORDS = [{"strings": {"match_mapping_type": "string", "mapping": {"type": "keyword", "ignore_above": 1024}}}]
+
+# Versioned index specs, by kind. Bump a kind's version whenever its settings
+# or mappings change, then run `python index_management.py reindex <kind> <alias>`
+# to build the new version and swap the alias over to it.
+INDEX_SPECS = {
+    "documents": {
+        "version": 1,
+        "settings": {
+            "number_of_shards": 1,
+            "number_of_replicas": 1,
+            # Uploads are indexed by background jobs; a short delay before they are searchable is fine
+            "refresh_interval": "5s"
+        },
+        "mappings": {
+            # Unknown fields stay in _source but are not indexed, so no stray keyword doc values
+            "dynamic": False,
+            "properties": {
+                "title": dict(HIGHLIGHTED_TEXT, fields=KEYWORD_SUBFIELD),
+                "filename": {"type": "text", "fields": KEYWORD_SUBFIELD},
+                "content": HIGHLIGHTED_TEXT,
+                "paragraphs": {"type": "text"},
+                "headings": {"type": "text"},
+                "content_hash": {"type": "keyword", "doc_values": False},
+                "version": {"type": "integer"}
+            }
+        }
+    },
+    "passages": {
+        "version": 1,
+        "settings": {
+            "number_of_shards": 1,
+            "number_of_replicas": 1,
+            "refresh_interval": "5s"
+        },
+        "mappings": {
+            "dynamic": False,
+            "properties": {
+                "parent_id": {"type": "keyword"},
+                "title": dict(HIGHLIGHTED_TEXT, fields=KEYWORD_SUBFIELD),
+                "filename": {"type": "keyword"},
+                "passage": {"type": "integer"},
+                "text": HIGHLIGHTED_TEXT
+            }
+        }
+    },
+    "logs": {
+        "version": 1,
+        "settings": {
+            "number_of_shards": 1,
+            "number_of_replicas": 1,
+            "refresh_interval": "30s"
+        },
+        "mappings": {
+            "dynamic_templates": STRINGS_AS_KEYWORDS,
+            "properties": {
+                "timestamp": {"type": "date"},
+                "message": {"type": "text"},
+                "status_code": {"type": "short"},
+                "duration_ms": {"type": "float"},
+                "line_number": {"type": "integer"},
+                "user_agent": {"type": "keyword", "ignore_above": 512, "doc_values": False}
+            }
+        }
+    },
+    "metrics": {
+        "version": 1,
+        "settings": {
+            "number_of_shards": 1,
+            "number_of_replicas": 1,
+            "refresh_interval": "30s"
+        },
+        "mappings": {
+            "dynamic_templates": STRINGS_AS_KEYWORDS,
+            "properties": {
+                "timestamp": {"type": "date"}
+            }
+        }
+    }
+}
+
+
+def versioned_name(alias, kind):
+    return f"{alias}-v{INDEX_SPECS[kind]['version']}"
+
+
+def alias_indices(es, alias):
+    """Concrete indices behind `alias`, or [] if it is not an alias"""
+    if not es.indices.exists_alias(name=alias):
+        return []
+    return sorted(es.indices.get_alias(name=alias).keys())
+
+
+def create_index(es, index_name, kind, **overrides):
+    """Create `index_name` with the spec for `kind`; `overrides` replace settings"""
+    spec = INDEX_SPECS[kind]
+    settings = dict(spec["settings"], **overrides)
+    es.indices.create(index=index_name, settings=settings, mappings=spec["mappings"])
+
+
+def ensure_alias(es, alias, kind):
+    """Make sure `alias` can be read and written, creating its first version if needed
+
+    Returns the concrete index behind the alias. A plain index already
+    named `alias` (created before indices were managed) is left in place
+    and returned; `reindex` migrates it.
+    """
+    indices = alias_indices(es, alias)
+    if indices:
+        return indices[-1]
+    if es.indices.exists(index=alias):
+        return alias
+    index_name = versioned_name(alias, kind)
+    try:
+        create_index(es, index_name, kind)
+    except ApiError as e:
+        # Another worker may have created it first
+        if e.error != 'resource_already_exists_exception':
+            raise
+    es.indices.put_alias(index=index_name, name=alias, is_write_index=True)
+    return index_name
+
+
+def wait_for_task(es, task_id, poll_interval=5.0, progress=None):
+    """Poll a background task until it completes; returns its response"""
+    while True:
+        task = es.tasks.get(task_id=task_id)
+        if progress is not None:
+            progress(task['task'].get('status', {}))
+        if task.get('completed'):
+            if task.get('error'):
+                raise RuntimeError(f"Task {task_id} failed: {task['error']}")
+            return task.get('response', {})
+        time.sleep(poll_interval)
+
+
+def copy_documents(es, source, dest, op_type='index', progress=None):
+    """Copy every document from `source` to `dest` with a background _reindex task"""
+    task = es.reindex(
+        source={"index": source},
+        dest={"index": dest, "op_type": op_type},
+        conflicts='proceed',
+        wait_for_completion=False,
+        slices='auto'
+    )
+    return wait_for_task(es, task['task'], progress=progress)
+
+
+def reindex(es, alias, kind, delete_old=False, progress=print):
+    """Build a new index for `alias` from the current spec and atomically swap the alias
+
+    The new index is loaded with refresh and replicas disabled, then given
+    its real settings. After the swap, a second pass copies any documents
+    written to the old index while the first copy ran; ids are content
+    hashes, so existing documents are skipped rather than duplicated.
+    The catch-up only adds documents: deletions made in the old index
+    while the copy runs (e.g. a superseded version) are not carried over,
+    so run reindex with writers such as the uploader stopped.
+
+    A plain index being migrated is deleted by the swap, so its catch-up
+    runs first, with the index made read-only so that no write can land
+    between the catch-up and the swap; writes fail until the swap is done.
+    Old indices are kept unless `delete_old` is set, which is required to
+    migrate a plain (unaliased) index that has the alias's name.
+    """
+    old_indices = alias_indices(es, alias)
+    legacy = not old_indices and es.indices.exists(index=alias)
+    if legacy:
+        old_indices = [alias]
+        if not delete_old:
+            raise ValueError(f"'{alias}' is a plain index; pass delete_old=True to replace it with an alias")
+    if not old_indices:
+        return ensure_alias(es, alias, kind)
+
+    new_index = versioned_name(alias, kind)
+    if es.indices.exists(index=new_index):
+        new_index = f"{new_index}-{time.strftime('%Y%m%d%H%M%S')}"
+    spec_settings = INDEX_SPECS[kind]["settings"]
+    create_index(es, new_index, kind, refresh_interval='-1', number_of_replicas=0)
+    progress(f"Copying {', '.join(old_indices)} into {new_index}")
+
+    result = copy_documents(es, alias, new_index, progress=lambda status: progress(
+        f"  {status.get('created', 0) + status.get('updated', 0)} of {status.get('total', '?')} documents"
+    ))
+    progress(f"Copied {result.get('created', 0)} documents ({len(result.get('failures', []))} failures)")
+    es.indices.put_settings(index=new_index, settings={
+        "refresh_interval": spec_settings["refresh_interval"],
+        "number_of_replicas": spec_settings["number_of_replicas"]
+    })
+    es.indices.refresh(index=new_index)
+
+    # One atomic alias update: readers and writers move to the new index together
+    actions = [{"add": {"index": new_index, "alias": alias, "is_write_index": True}}]
+    if legacy:
+        actions.insert(0, {"remove_index": {"index": alias}})
+        # The plain index is deleted by the swap; catch-up must happen before it, with writes blocked
+        es.indices.put_settings(index=alias, settings={"index.blocks.write": True})
+        try:
+            copy_documents(es, alias, new_index, op_type='create')
+            es.indices.update_aliases(actions=actions)
+        except Exception:
+            es.indices.put_settings(index=alias, settings={"index.blocks.write": False})
+            raise
+    else:
+        actions.insert(0, {"remove": {"indices": old_indices, "alias": alias}})
+        es.indices.update_aliases(actions=actions)
+    progress(f"Alias '{alias}' now points to {new_index}")
+
+    if not legacy:
+        caught_up = copy_documents(es, ",".join(old_indices), new_index, op_type='create')
+        progress(f"Caught up {caught_up.get('created', 0)} documents written during the copy")
+        if delete_old:
+            es.indices.delete(index=",".join(old_indices))
+            progress(f"Deleted {', '.join(old_indices)}")
+    return new_index
+
+
+def status(es, alias):
+    """Describe the indices behind `alias`"""
+    indices = alias_indices(es, alias)
+    if not indices:
+        return {"alias": alias, "managed": False, "exists": bool(es.indices.exists(index=alias))}
+    counts = es.cat.indices(index=",".join(indices), format="json", h="index,docs.count,store.size")
+    return {"alias": alias, "managed": True, "indices": counts}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage versioned Elasticsearch indices behind aliases")
+    parser.add_argument("command", choices=["status", "ensure", "reindex"], help="Action to run")
+    parser.add_argument("kind", choices=sorted(INDEX_SPECS), help="Index spec to use")
+    parser.add_argument("alias", help="Alias that applications read and write, e.g. docstraining4")
+    parser.add_argument("--url", required=True, help="Elasticsearch URL")
+    parser.add_argument("--username", help="Elasticsearch username")
+    parser.add_argument("--password", help="Elasticsearch password")
+    parser.add_argument("--api-key", help="Elasticsearch API key")
+    parser.add_argument("--delete-old", action="store_true", help="Delete the previous index after reindexing")
+
+    args = parser.parse_args()
+
+    # Validate auth params
+    if not (args.api_key or (args.username and args.password)):
+        print("Error: You must provide either API key or username and password")
+        exit(1)
+
+    es = create_client(args.url, api_key=args.api_key, username=args.username, password=args.password)
+
+    if args.command == "status":
+        print(status(es, args.alias))
+    elif args.command == "ensure":
+        print(f"'{args.alias}' is backed by {ensure_alias(es, args.alias, args.kind)}")
+    else:
+        reindex(es, args.alias, args.kind, delete_old=args.delete_old)
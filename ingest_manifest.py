@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+ManifestEntry = namedtuple('ManifestEntry', ['path', 'size', 'mtime_ns', 'content_hash', 'doc_id', 'indexed_at'])
+FolderDelta = namedtuple('FolderDelta', ['new', 'changed', 'unchanged', 'removed'])
+
+
+def scan_folder(folder, predicate):
+    """Return (path, size, mtime_ns) for files in `folder` whose name matches `predicate`"""
+    files = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_file() and predicate(entry.name):
+                stat = entry.stat()
+                files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+    return files
+
+
+class IngestManifest:
+    """Persistent record of every indexed file: path, size, mtime, hash and ES id
+
+    Comparing a folder scan against the manifest gives the delta since the
+    last run using only directory metadata: unchanged files are never
+    opened, so restarting over a large folder costs one scandir and one
+    table read. Entries are grouped by folder so each folder's removed
+    files can be detected independently.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS manifest ('
+            'path TEXT PRIMARY KEY, folder TEXT, size INTEGER, mtime_ns INTEGER, '
+            'content_hash TEXT, doc_id TEXT, indexed_at REAL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS manifest_folder ON manifest(folder)')
+        conn.execute('CREATE INDEX IF NOT EXISTS manifest_doc_id ON manifest(doc_id)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _key(path):
+        return os.path.abspath(path)
+
+    def get(self, path):
+        """Return the ManifestEntry for `path`, or None"""
+        row = self._connection().execute(
+            'SELECT path, size, mtime_ns, content_hash, doc_id, indexed_at FROM manifest WHERE path = ?',
+            (self._key(path),)
+        ).fetchone()
+        return ManifestEntry(*row) if row else None
+
+    def record(self, path, content_hash, doc_id):
+        """Record `path` (at its current size/mtime) as indexed under `doc_id`"""
+        key = self._key(path)
+        stat = os.stat(key)
+        self._connection().execute(
+            'INSERT OR REPLACE INTO manifest (path, folder, size, mtime_ns, content_hash, doc_id, indexed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (key, os.path.dirname(key), stat.st_size, stat.st_mtime_ns, content_hash, doc_id, time.time())
+        )
+
+    def remove(self, path):
+        self._connection().execute('DELETE FROM manifest WHERE path = ?', (self._key(path),))
+
+    def references(self, doc_id):
+        """Number of manifest entries pointing at `doc_id`"""
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM manifest WHERE doc_id = ?', (doc_id,)
+        ).fetchone()[0]
+
+    def compute_delta(self, folder, files):
+        """Compare a scan of `folder` (see scan_folder) with the manifest
+
+        Returns FolderDelta(new, changed, unchanged, removed): the first three
+        are lists of paths, `removed` is a list of ManifestEntry for files
+        that were indexed but no longer exist.
+        """
+        folder = self._key(folder)
+        known = {
+            row[0]: ManifestEntry(*row)
+            for row in self._connection().execute(
+                'SELECT path, size, mtime_ns, content_hash, doc_id, indexed_at FROM manifest WHERE folder = ?',
+                (folder,)
+            )
+        }
+
+        new, changed, unchanged = [], [], []
+        for path, size, mtime_ns in files:
+            entry = known.pop(self._key(path), None)
+            if entry is None:
+                new.append(path)
+            elif entry.size != size or entry.mtime_ns != mtime_ns:
+                changed.append(path)
+            else:
+                unchanged.append(path)
+
+        return FolderDelta(new, changed, unchanged, list(known.values()))
+
+
+def delete_removed(es, index_name, removed, manifest, fingerprints, doc_store=None, chunk_size=500):
+    """Delete ES documents for removed files and drop them from the manifest
+
+    A document is only deleted when no other file still maps to it (the
+    same content may exist under several names). Its stored downloads are
+    deleted too when `doc_store` is given. Returns the number of documents
+    deleted.
+    """
+    for entry in removed:
+        manifest.remove(entry.path)
+
+    doc_ids = sorted({entry.doc_id for entry in removed if entry.doc_id and not manifest.references(entry.doc_id)})
+    for start in range(0, len(doc_ids), chunk_size):
+        operations = [{'delete': {'_index': index_name, '_id': doc_id}} for doc_id in doc_ids[start:start + chunk_size]]
+        es.bulk(operations=operations)
+    for doc_id in doc_ids:
+        fingerprints.forget(doc_id)
+        if doc_store is not None:
+            doc_store.delete(doc_id)
+    return len(doc_ids)
@@ -0,0 +1,199 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bulk_ingest import chunk_actions, index_action, send_chunk
+
+
+def parse_document(convert, file_path):
+    """Run `convert` in a pool process; module-level so it can be pickled"""
+    return convert(file_path, os.path.basename(file_path))
+
+
+class IngestPipeline:
+    """Staged conversion and indexing pipeline for dropped documents
+
+    Stage 1 is an intake queue that callers (such as watchdog callbacks)
+    feed with file paths without blocking. Stage 2 parses files in a process
+    pool, since DOCX parsing is CPU-bound and holds the GIL. Stage 3 collects
+    parsed documents and indexes them with one _bulk request per batch,
+    flushed when `batch_size` documents are waiting or the oldest has waited
+    `flush_interval` seconds.
+
+    `convert(file_path, filename)` must be a picklable module-level
+    function. `prepare(file_path, document)` runs in this process after
+    parsing and may stamp the document (e.g. with its content hash).
+    `on_indexed(file_path, doc_id)` and `on_failed(file_path, error)` are
+    called from the indexing thread.
+
+    With a `health` monitor (es_health.HealthMonitor), a batch waits up to
+    `health_wait` seconds for an open circuit to close and otherwise fails
+    without a request; bulk request errors are reported to the monitor.
+    """
+
+    def __init__(self, es_client, index_name, convert, prepare=None, on_indexed=None, on_failed=None,
+                 parse_workers=None, batch_size=50, flush_interval=2.0, max_in_flight=None,
+                 health=None, health_wait=30.0):
+        self.es_client = es_client
+        self.index_name = index_name
+        self.convert = convert
+        self.prepare = prepare or (lambda file_path, document: None)
+        self.on_indexed = on_indexed or (lambda file_path, doc_id: None)
+        self.on_failed = on_failed or (lambda file_path, error: None)
+        self.parse_workers = parse_workers or os.cpu_count() or 2
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.health = health
+        self.health_wait = health_wait
+
+        self.intake_queue = queue.Queue()
+        self.index_queue = queue.Queue()
+        # Bound parsed-but-unindexed work so a slow cluster applies back-pressure
+        self._slots = threading.BoundedSemaphore(max_in_flight or self.parse_workers * 4)
+        self._executor = None
+        self._threads = []
+        self._lock = threading.Lock()
+        self._started_at = None
+        self._stats = {
+            'submitted': 0,
+            'parsed': 0,
+            'parse_failed': 0,
+            'indexed': 0,
+            'index_failed': 0,
+            'batches': 0,
+            'unavailable_batches': 0,
+            'parse_seconds': 0.0,
+            'index_seconds': 0.0
+        }
+
+    def _incr(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def start(self):
+        """Start the process pool and the dispatch/indexing threads"""
+        self._started_at = time.time()
+        self._executor = ProcessPoolExecutor(max_workers=self.parse_workers)
+        self._threads = [
+            threading.Thread(target=self._dispatch, name='ingest-dispatch', daemon=True),
+            threading.Thread(target=self._index, name='ingest-index', daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, file_path):
+        """Queue a file for conversion and indexing"""
+        self._incr('submitted')
+        self.intake_queue.put(file_path)
+
+    def _dispatch(self):
+        """Move paths from the intake queue into the process pool"""
+        while True:
+            file_path = self.intake_queue.get()
+            if file_path is None:
+                return
+            self._slots.acquire()
+            started = time.time()
+            future = self._executor.submit(parse_document, self.convert, file_path)
+            future.add_done_callback(
+                lambda f, file_path=file_path, started=started: self._parsed(file_path, started, f)
+            )
+
+    def _parsed(self, file_path, started, future):
+        """Hand a finished parse to the indexing stage"""
+        self._incr('parse_seconds', time.time() - started)
+        try:
+            document = future.result()
+            self.prepare(file_path, document)
+        except Exception as e:
+            self._slots.release()
+            self._incr('parse_failed')
+            self.on_failed(file_path, e)
+            return
+        self._incr('parsed')
+        self.index_queue.put((file_path, document))
+
+    def _index(self):
+        """Collect parsed documents into batches and send them with _bulk"""
+        batch = []
+        batch_started = None
+        stopping = False
+
+        while not (stopping and not batch):
+            timeout = self.flush_interval
+            if batch:
+                timeout = max(0.0, self.flush_interval - (time.time() - batch_started))
+            try:
+                item = self.index_queue.get(timeout=timeout)
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+                    if batch_started is None:
+                        batch_started = time.time()
+            except queue.Empty:
+                pass
+
+            if batch and (stopping or len(batch) >= self.batch_size
+                          or time.time() - batch_started >= self.flush_interval):
+                self._send(batch)
+                batch = []
+                batch_started = None
+
+    def _send(self, batch):
+        started = time.time()
+        finished = set()  # paths already reported through on_indexed or on_failed
+        actions = ((file_path, index_action(self.index_name, document), document)
+                   for file_path, document in batch)
+        try:
+            if self.health is not None and not self.health.wait_until_available(self.health_wait):
+                self._incr('unavailable_batches')
+                raise ConnectionError("Elasticsearch is unavailable")
+            for chunk in chunk_actions(actions, max_docs=self.batch_size):
+                try:
+                    indexed, failed, _ = send_chunk(self.es_client, chunk)
+                except Exception as e:
+                    if self.health is not None:
+                        self.health.record_failure(e)
+                    raise
+                if self.health is not None:
+                    self.health.record_success()
+                self._incr('indexed', len(indexed))
+                self._incr('index_failed', len(failed))
+                for file_path, doc_id in indexed:
+                    finished.add(file_path)
+                    self.on_indexed(file_path, doc_id)
+                for file_path, error in failed:
+                    finished.add(file_path)
+                    self.on_failed(file_path, error)
+        except Exception as e:
+            # Only the files whose chunk never got a response; earlier chunks were already reported
+            remaining = [file_path for file_path, _ in batch if file_path not in finished]
+            self._incr('index_failed', len(remaining))
+            for file_path in remaining:
+                self.on_failed(file_path, e)
+        finally:
+            for _ in batch:
+                self._slots.release()
+            self._incr('batches')
+            self._incr('index_seconds', time.time() - started)
+
+    def stop(self):
+        """Finish all queued work, then shut down the pool and threads"""
+        self.intake_queue.put(None)
+        self._threads[0].join()
+        self._executor.shutdown(wait=True)
+        self.index_queue.put(None)
+        self._threads[1].join()
+
+    def stats(self):
+        """Return counters, queue depths and throughput since start"""
+        with self._lock:
+            snapshot = dict(self._stats)
+        elapsed = time.time() - self._started_at if self._started_at else 0.0
+        snapshot['intake_depth'] = self.intake_queue.qsize()
+        snapshot['index_depth'] = self.index_queue.qsize()
+        snapshot['docs_per_second'] = round(snapshot['indexed'] / elapsed, 2) if elapsed else 0.0
+        return snapshot
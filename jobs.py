@@ -0,0 +1,85 @@
+import json
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """Handle a running task uses to report its progress"""
+
+    def __init__(self, manager, job_id, state):
+        self.manager = manager
+        self.id = job_id
+        self.state = state
+
+    def update(self, **fields):
+        """Merge `fields` into the job state and publish it"""
+        self.state.update(fields)
+        self.state['updated_at'] = time.time()
+        self.manager._save(self.id, self.state)
+
+
+class JobManager:
+    """Run background tasks on a local thread pool and publish their status
+
+    Job state is stored in a cache backend (see cache_backends.py), so with
+    the shared SQLite backend any gunicorn worker can answer a status
+    request for a job that another worker is running. Tasks are called as
+    `func(job, *args, **kwargs)` and may call `job.update(...)` to report
+    progress; their return value becomes the job's `result`.
+    """
+
+    def __init__(self, backend, max_workers=2, ttl=3600):
+        self.backend = backend
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self._executor = None
+
+    def _pool(self):
+        # Created on first use so worker threads start after gunicorn forks
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+        return self._executor
+
+    def _save(self, job_id, state):
+        self.backend.set(f"jobs:{job_id}", json.dumps(state, default=str), self.ttl)
+
+    def submit(self, func, *args, description=None, **kwargs):
+        """Queue `func` and return the new job's id immediately"""
+        job_id = uuid.uuid4().hex
+        job = Job(self, job_id, {
+            'id': job_id,
+            'status': 'queued',
+            'description': description,
+            'progress': 0,
+            'created_at': time.time(),
+            'updated_at': time.time()
+        })
+        job.update()
+        self.backend.incr('jobs:submitted')
+        self._pool().submit(self._run, job, func, args, kwargs)
+        return job_id
+
+    def _run(self, job, func, args, kwargs):
+        job.update(status='running', started_at=time.time())
+        try:
+            result = func(job, *args, **kwargs)
+            job.update(status='done', progress=100, result=result, finished_at=time.time())
+            self.backend.incr('jobs:done')
+        except Exception as e:
+            job.update(status='failed', error=str(e), finished_at=time.time())
+            self.backend.incr('jobs:failed')
+            traceback.print_exc()
+
+    def get(self, job_id):
+        """Return the job's state dict, or None if unknown or expired"""
+        value = self.backend.get(f"jobs:{job_id}")
+        return json.loads(value) if value else None
+
+    def stats(self):
+        return {name: self.backend.counter(f"jobs:{name}") for name in ('submitted', 'done', 'failed')}
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
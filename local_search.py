@@ -0,0 +1,516 @@
+import argparse
+import fcntl
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import uuid
+import zlib
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+SEGMENT_MAGIC = b'MTSEG001'
+# magic, then doc count, term count, total token count and eight section offsets
+HEADER = struct.Struct('<8sQQQ8Q')
+MANIFEST = 'manifest.json'
+LOCK = '.lock'
+
+# Title terms count this many times, like the title^2 boost of /search
+TITLE_WEIGHT = 2
+# BM25 parameters (Elasticsearch defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Fuzzy expansions per query term, and their weight relative to exact matches
+FUZZY_MAX_EXPANSIONS = 50
+FUZZY_WEIGHT = 0.5
+# Merge all segments into one when there are more than this many
+MAX_SEGMENTS = 8
+
+
+def tokenize(text):
+    return WORD.findall(text.lower())
+
+
+def fuzziness(term):
+    """Allowed edits for a term, like Elasticsearch's AUTO fuzziness"""
+    if len(term) <= 2:
+        return 0
+    return 1 if len(term) <= 5 else 2
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance between a and b, or limit + 1 once it exceeds `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _aligned(blob):
+    """Pad a section to 8 bytes so typed views over the mmap stay aligned"""
+    return blob + b'\0' * (-len(blob) % 8)
+
+
+def _offsets(parts):
+    offsets = array('Q', [0])
+    for part in parts:
+        offsets.append(offsets[-1] + len(part))
+    return offsets
+
+
+def write_segment(path, documents):
+    """Write (doc_id, document) pairs to an immutable segment file
+
+    Sections: sorted term lexicon with offsets, per-term postings as
+    interleaved uint32 (document ordinal, term frequency) pairs, document
+    lengths, document ids, and zlib-compressed stored fields for snippets
+    and downloads. Every section is a flat array, so a reader can mmap the
+    file and binary-search it without loading it.
+    """
+    postings = defaultdict(lambda: array('I'))
+    lengths = array('I')
+    ids = []
+    stored = []
+    for ordinal, (doc_id, document) in enumerate(documents):
+        frequencies = defaultdict(int)
+        for term in tokenize(document.get('title') or ''):
+            frequencies[term] += TITLE_WEIGHT
+        for term in tokenize(document.get('content') or ''):
+            frequencies[term] += 1
+        for term, frequency in frequencies.items():
+            postings[term].extend((ordinal, frequency))
+        lengths.append(sum(frequencies.values()))
+        ids.append(doc_id.encode('utf-8'))
+        fields = {key: document.get(key) for key in ('title', 'filename', 'has_original', 'content')}
+        stored.append(zlib.compress(json.dumps(fields).encode('utf-8')))
+
+    terms = sorted(term.encode('utf-8') for term in postings)
+    term_lists = [postings[term.decode('utf-8')].tobytes() for term in terms]
+    sections = [
+        _offsets(terms).tobytes(), b''.join(terms),
+        _offsets(term_lists).tobytes(), b''.join(term_lists),
+        lengths.tobytes(),
+        _offsets(ids).tobytes(), b''.join(ids),
+        _offsets(stored).tobytes() + b''.join(stored)
+    ]
+
+    position = HEADER.size
+    section_offsets = []
+    for section in sections:
+        section_offsets.append(position)
+        position += len(_aligned(section))
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(HEADER.pack(SEGMENT_MAGIC, len(ids), len(terms), sum(lengths), *section_offsets))
+        for section in sections:
+            file.write(_aligned(section))
+    os.replace(temp_path, path)
+    return len(ids)
+
+
+class Segment:
+    """Read-only, memory-mapped view of a segment file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, self.doc_count, self.term_count, self.total_length, *offsets = HEADER.unpack_from(self._mmap)
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not a segment file")
+        ends = offsets[1:] + [len(view)]
+        sections = [view[start:end] for start, end in zip(offsets, ends)]
+        self._term_offsets = sections[0][:(self.term_count + 1) * 8].cast('Q')
+        self._terms = sections[1]
+        self._posting_offsets = sections[2][:(self.term_count + 1) * 8].cast('Q')
+        self._postings = sections[3]
+        self.lengths = sections[4][:self.doc_count * 4].cast('I')
+        self._id_offsets = sections[5][:(self.doc_count + 1) * 8].cast('Q')
+        self._ids = sections[6]
+        self._stored_offsets = sections[7][:(self.doc_count + 1) * 8].cast('Q')
+        self._stored = sections[7][(self.doc_count + 1) * 8:]
+        self.ids = [self.doc_id(ordinal) for ordinal in range(self.doc_count)]
+        self.ordinals = {doc_id: ordinal for ordinal, doc_id in enumerate(self.ids)}
+
+    def _term(self, index):
+        return bytes(self._terms[self._term_offsets[index]:self._term_offsets[index + 1]])
+
+    def _find(self, term_bytes):
+        """Index of the first lexicon entry >= term_bytes"""
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < term_bytes:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def postings(self, term):
+        """(ordinals, frequencies) views for `term`, or None if absent"""
+        term_bytes = term.encode('utf-8')
+        index = self._find(term_bytes)
+        if index >= self.term_count or self._term(index) != term_bytes:
+            return None
+        pairs = self._postings[self._posting_offsets[index]:self._posting_offsets[index + 1]].cast('I')
+        return pairs[0::2], pairs[1::2]
+
+    def terms_between(self, low, high):
+        """Lexicon terms t with low <= t < high"""
+        start = self._find(low.encode('utf-8'))
+        end = self._find(high.encode('utf-8'))
+        return [self._term(index).decode('utf-8') for index in range(start, end)]
+
+    def doc_id(self, ordinal):
+        return bytes(self._ids[self._id_offsets[ordinal]:self._id_offsets[ordinal + 1]]).decode('utf-8')
+
+    def stored(self, ordinal):
+        data = self._stored[self._stored_offsets[ordinal]:self._stored_offsets[ordinal + 1]]
+        return json.loads(zlib.decompress(data))
+
+
+def highlight(text, terms, fragment_size=200, number_of_fragments=3):
+    """Up to `number_of_fragments` snippets of `text` with matched terms in <em>"""
+    matches = [match for match in WORD.finditer(text) if match.group().lower() in terms]
+    if not matches:
+        return []
+    fragments = []
+    index = 0
+    while index < len(matches):
+        start = max(0, matches[index].start() - fragment_size // 4)
+        if start:
+            # Begin the fragment on a word boundary
+            space = text.find(' ', start, matches[index].start())
+            start = space + 1 if space != -1 else matches[index].start()
+        end = min(len(text), start + fragment_size)
+        inside = []
+        while index < len(matches) and matches[index].end() <= end:
+            inside.append(matches[index])
+            index += 1
+        if not inside:
+            inside.append(matches[index])
+            end = matches[index].end()
+            index += 1
+        fragments.append((start, end, inside))
+    # Keep the fragments with the most matches, in document order
+    best = sorted(sorted(fragments, key=lambda fragment: -len(fragment[2]))[:number_of_fragments])
+    snippets = []
+    for start, end, inside in best:
+        parts = []
+        position = start
+        for match in inside:
+            parts.append(text[position:match.start()])
+            parts.append(f"<em>{match.group()}</em>")
+            position = match.end()
+        parts.append(text[position:end])
+        snippets.append(''.join(parts).strip())
+    return snippets
+
+
+class LocalIndex:
+    """Embedded full-text index: memory-mapped segments plus deletions
+
+    Each `add_documents` call writes one immutable segment; a manifest
+    lists the live segments and deleted ids, and is swapped atomically
+    under a file lock, so several processes (gunicorn workers, uploaders)
+    can write while others search. Readers reload when the manifest
+    changes. Segments are merged once there are more than MAX_SEGMENTS.
+    Document ids are content hashes, so a document present in several
+    segments is the same document and is returned once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._segments = []
+        self._deleted = frozenset()
+        self._manifest_mtime = None
+        self._reload_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        # Writers create the folder themselves; reads of a missing folder find no segments
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOCK), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.path, MANIFEST)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {'segments': [], 'deleted': []}
+
+    def _write_manifest(self, manifest):
+        temp_path = os.path.join(self.path, f"{MANIFEST}.tmp")
+        with open(temp_path, 'w') as file:
+            json.dump(manifest, file)
+        os.replace(temp_path, os.path.join(self.path, MANIFEST))
+
+    def _refresh(self):
+        """Reopen segments if another process changed the manifest"""
+        try:
+            mtime = os.stat(os.path.join(self.path, MANIFEST)).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._manifest_mtime:
+            return
+        with self._reload_lock:
+            if mtime == self._manifest_mtime:
+                return
+            manifest = self._read_manifest()
+            current = {segment.path: segment for segment in self._segments}
+            segments = []
+            for name in manifest['segments']:
+                path = os.path.join(self.path, name)
+                segments.append(current.pop(path, None) or Segment(path))
+            # Dropped segments are unmapped once no search is using them
+            self._segments = segments
+            self._deleted = frozenset(manifest['deleted'])
+            self._manifest_mtime = mtime
+
+    def add_documents(self, documents):
+        """Index (doc_id, document) pairs as a new segment; returns the count"""
+        documents = list(documents)
+        if not documents:
+            return 0
+        name = f"{uuid.uuid4().hex}.seg"
+        os.makedirs(self.path, exist_ok=True)
+        count = write_segment(os.path.join(self.path, name), documents)
+        with self._locked():
+            manifest = self._read_manifest()
+            manifest['segments'].append(name)
+            added = {doc_id for doc_id, _ in documents}
+            manifest['deleted'] = [doc_id for doc_id in manifest['deleted'] if doc_id not in added]
+            self._write_manifest(manifest)
+        if len(manifest['segments']) > MAX_SEGMENTS:
+            self.compact()
+        return count
+
+    def delete(self, doc_ids):
+        """Hide documents; their data is dropped at the next merge"""
+        doc_ids = [doc_id for doc_id in doc_ids if doc_id]
+        if not doc_ids:
+            return
+        with self._locked():
+            manifest = self._read_manifest()
+            manifest['deleted'] = sorted(set(manifest['deleted']) | set(doc_ids))
+            self._write_manifest(manifest)
+
+    def iter_documents(self):
+        """Yield (doc_id, stored fields) for every live document"""
+        self._refresh()
+        seen = set(self._deleted)
+        for segment in reversed(self._segments):
+            for ordinal, doc_id in enumerate(segment.ids):
+                if doc_id not in seen:
+                    seen.add(doc_id)
+                    yield doc_id, segment.stored(ordinal)
+
+    def compact(self):
+        """Merge all segments into one, dropping deleted and duplicate documents"""
+        with self._locked():
+            manifest = self._read_manifest()
+            if len(manifest['segments']) <= 1 and not manifest['deleted']:
+                return
+            self._manifest_mtime = None
+            self._refresh()
+            name = f"{uuid.uuid4().hex}.seg"
+            write_segment(os.path.join(self.path, name), list(self.iter_documents()))
+            self._write_manifest({'segments': [name], 'deleted': []})
+            for old in manifest['segments']:
+                os.remove(os.path.join(self.path, old))
+
+    def get(self, doc_id):
+        """Stored fields (title, filename, content) of a document, or None"""
+        self._refresh()
+        if doc_id in self._deleted:
+            return None
+        for segment in reversed(self._segments):
+            ordinal = segment.ordinals.get(doc_id)
+            if ordinal is not None:
+                return segment.stored(ordinal)
+        return None
+
+    def _expand(self, term):
+        """(term, weight) for the exact term and its fuzzy variants"""
+        expansions = {term: 1.0}
+        edits = fuzziness(term)
+        if not edits:
+            return expansions
+        # Like a prefix_length of 1: variants share the first character
+        candidates = set()
+        for segment in self._segments:
+            candidates.update(segment.terms_between(term[0], chr(ord(term[0]) + 1)))
+        scored = []
+        for candidate in candidates:
+            if candidate != term and abs(len(candidate) - len(term)) <= edits:
+                distance = edit_distance(term, candidate, edits)
+                if distance <= edits:
+                    scored.append((distance, candidate))
+        for _, candidate in sorted(scored)[:FUZZY_MAX_EXPANSIONS]:
+            expansions[candidate] = FUZZY_WEIGHT
+        return expansions
+
+    def search(self, query, offset=0, size=10, track_total_hits=False, ids_only=False):
+        """BM25 search shaped like /search: returns (hits, total)
+
+        Hits carry id and score, plus title, filename and <em> highlights
+        unless `ids_only`. `total` is None unless `track_total_hits`.
+        """
+        self._refresh()
+        segments = self._segments
+        doc_count = sum(segment.doc_count for segment in segments)
+        if not doc_count:
+            return [], ({"value": 0, "relation": "eq"} if track_total_hits is not False else None)
+        average_length = sum(segment.total_length for segment in segments) / doc_count
+
+        scores = defaultdict(float)
+        matched_terms = defaultdict(set)
+        for query_term in set(tokenize(query)):
+            for term, weight in self._expand(query_term).items():
+                found = [(index, segment.postings(term)) for index, segment in enumerate(segments)]
+                found = [(index, postings) for index, postings in found if postings is not None]
+                document_frequency = sum(len(postings[0]) for _, postings in found)
+                if not document_frequency:
+                    continue
+                idf = math.log(1 + (doc_count - document_frequency + 0.5) / (document_frequency + 0.5))
+                for index, (ordinals, frequencies) in found:
+                    lengths = segments[index].lengths
+                    for ordinal, frequency in zip(ordinals, frequencies):
+                        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[ordinal] / average_length)
+                        scores[(index, ordinal)] += weight * idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+                        matched_terms[(index, ordinal)].add(term)
+
+        # Newest segment wins for a document stored more than once
+        best = {}
+        for (index, ordinal), score in scores.items():
+            doc_id = segments[index].ids[ordinal]
+            if doc_id in self._deleted:
+                continue
+            if doc_id not in best or index > best[doc_id][1]:
+                best[doc_id] = (score, index, ordinal)
+        ranked = sorted(best.items(), key=lambda item: -item[1][0])
+
+        hits = []
+        for doc_id, (score, index, ordinal) in ranked[offset:offset + size]:
+            result = {"id": doc_id, "score": round(score, 4)}
+            if not ids_only:
+                stored = segments[index].stored(ordinal)
+                terms = matched_terms[(index, ordinal)]
+                result["title"] = stored.get('title')
+                result["filename"] = stored.get('filename')
+                result["has_original"] = stored.get('has_original') or False
+                highlights = {}
+                content = highlight(stored.get('content') or '', terms)
+                if content:
+                    highlights["content"] = content
+                title = highlight(stored.get('title') or '', terms, number_of_fragments=1)
+                if title:
+                    highlights["title"] = title
+                if highlights:
+                    result["highlights"] = highlights
+            hits.append(result)
+
+        total = None
+        if track_total_hits is not False:
+            total = {"value": len(ranked), "relation": "eq"}
+        return hits, total
+
+    def stats(self):
+        self._refresh()
+        return {
+            'segments': len(self._segments),
+            'documents': sum(segment.doc_count for segment in self._segments),
+            'deleted': len(self._deleted),
+            'bytes': sum(os.path.getsize(segment.path) for segment in self._segments)
+        }
+
+
+def iter_folder_documents(folder_path):
+    """(id, document) for the JSON files written by the converters"""
+    # Imported here so the index itself has no Elasticsearch dependency
+    import doc_identity
+    for name in sorted(os.listdir(folder_path)):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(folder_path, name), encoding='utf-8') as file:
+            document = json.load(file)
+        content_hash = document.get('content_hash') or doc_identity.document_hash(document)
+        yield doc_identity.document_id(content_hash), document
+
+
+def iter_index_documents(es, index_name):
+    """(id, document) for every document in an Elasticsearch index"""
+    from elasticsearch.helpers import scan
+    for hit in scan(es, index=index_name, query={"query": {"match_all": {}}},
+                    _source=["title", "filename", "has_original", "content"]):
+        yield hit['_id'], hit['_source']
+
+
+def add_in_batches(index, documents, batch_size=5000):
+    """Add documents as segments of at most `batch_size`, then merge them"""
+    batch = []
+    total = 0
+    for item in documents:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            total += index.add_documents(batch)
+            batch = []
+    total += index.add_documents(batch)
+    index.compact()
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query the embedded local search index")
+    parser.add_argument("command", choices=["build", "search", "compact", "stats"], help="Action to run")
+    parser.add_argument("--path", required=True, help="Local index directory")
+    parser.add_argument("--folder", help="Build from the JSON files in this folder")
+    parser.add_argument("--url", help="Build from an Elasticsearch index at this URL")
+    parser.add_argument("--username", help="Elasticsearch username")
+    parser.add_argument("--password", help="Elasticsearch password")
+    parser.add_argument("--api-key", help="Elasticsearch API key")
+    parser.add_argument("--index", default="documents", help="Elasticsearch index name")
+    parser.add_argument("--query", help="Query text (with search)")
+
+    args = parser.parse_args()
+    local_index = LocalIndex(args.path)
+
+    if args.command == "build":
+        if args.folder:
+            documents = iter_folder_documents(args.folder)
+        elif args.url:
+            from es_client import create_client
+            es = create_client(args.url, api_key=args.api_key, username=args.username, password=args.password)
+            documents = iter_index_documents(es, args.index)
+        else:
+            print("Error: build needs --folder or --url")
+            exit(1)
+        print(f"Indexed {add_in_batches(local_index, documents)} documents into {args.path}")
+    elif args.command == "search":
+        hits, total = local_index.search(args.query or '', track_total_hits=True)
+        print(f"{total['value']} matching documents")
+        for hit in hits:
+            print(f"{hit['score']:8.3f}  {hit['title']}  ({hit['id']})")
+    elif args.command == "compact":
+        local_index.compact()
+    print(local_index.stats())
@@ -0,0 +1,164 @@
+import os
+import queue
+import threading
+import time
+
+
+class BulkLogShipper:
+    """Ship log and access-log documents to Elasticsearch in the background
+
+    Documents are put on a bounded in-process queue and a worker thread
+    flushes them with the _bulk API once either `batch_size` documents are
+    pending or the oldest pending document is `flush_interval` seconds old.
+    When the queue is full the `drop_policy` decides what is lost:
+    'drop_newest' discards the incoming document, 'drop_oldest' evicts the
+    oldest queued one to make room.
+    """
+
+    def __init__(self, es_client, max_queue_size=10000, batch_size=500,
+                 flush_interval=2.0, drop_policy='drop_newest'):
+        if drop_policy not in ('drop_newest', 'drop_oldest'):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+
+        self.es_client = es_client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.queue = queue.Queue(maxsize=max_queue_size)
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._flush_requested = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._stats = {
+            'enqueued': 0,
+            'shipped': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0,
+            'last_batch_ms': 0.0
+        }
+
+    def _ensure_started(self):
+        """Start the worker thread, restarting it after a fork"""
+        # Threads do not survive fork(), so a shipper created in the gunicorn
+        # master has to start its own worker in each child process
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='es-log-shipper', daemon=True)
+            self._thread.start()
+
+    def _incr(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def enqueue(self, index, document):
+        """Queue a document for shipping without blocking the caller"""
+        self._ensure_started()
+        item = (index, document)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self._incr('dropped')
+            if self.drop_policy == 'drop_newest':
+                return False
+            # drop_oldest: evict the oldest queued document to make room
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                return False
+        self._incr('enqueued')
+        return True
+
+    def _run(self):
+        """Worker loop: collect batches by size/age and send them"""
+        batch = []
+        batch_started = None
+
+        while True:
+            if batch:
+                timeout = max(0.0, self.flush_interval - (time.time() - batch_started))
+            else:
+                timeout = self.flush_interval
+
+            try:
+                batch.append(self.queue.get(timeout=min(timeout, 0.5)))
+                if batch_started is None:
+                    batch_started = time.time()
+            except queue.Empty:
+                pass
+
+            stopping = self._stop_event.is_set()
+            flushing = self._flush_requested.is_set()
+            batch_full = len(batch) >= self.batch_size
+            batch_old = batch and time.time() - batch_started >= self.flush_interval
+
+            if batch and (batch_full or batch_old or ((stopping or flushing) and self.queue.empty())):
+                self._send(batch)
+                batch = []
+                batch_started = None
+
+            if flushing and not batch and self.queue.empty():
+                self._flush_requested.clear()
+
+            if stopping and not batch and self.queue.empty():
+                return
+
+    def _send(self, batch):
+        """Send one batch of documents with a single _bulk request"""
+        operations = []
+        for index, document in batch:
+            operations.append({'index': {'_index': index}})
+            operations.append(document)
+
+        start = time.time()
+        try:
+            response = self.es_client.bulk(operations=operations)
+            failed = 0
+            if response.get('errors'):
+                failed = sum(1 for item in response['items'] if item['index'].get('error'))
+            self._incr('shipped', len(batch) - failed)
+            self._incr('failed', failed)
+        except Exception as e:
+            # Printing rather than logging: logging here would feed back into the queue
+            print(f"Failed to ship {len(batch)} log documents to Elasticsearch: {e}")
+            self._incr('failed', len(batch))
+        finally:
+            with self._lock:
+                self._stats['batches'] += 1
+                self._stats['last_batch_ms'] = round((time.time() - start) * 1000, 2)
+
+    def flush(self, timeout=10.0):
+        """Ship everything queued so far, waiting up to `timeout` seconds"""
+        if not self._thread or not self._thread.is_alive() or self._pid != os.getpid():
+            return self.queue.empty()
+        self._flush_requested.set()
+        deadline = time.time() + timeout
+        while self._flush_requested.is_set() and time.time() < deadline:
+            time.sleep(0.05)
+        return not self._flush_requested.is_set()
+
+    def close(self, timeout=10.0):
+        """Drain the queue and stop the worker thread"""
+        if not self._thread or self._pid != os.getpid():
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+
+    def stats(self):
+        """Return a snapshot of the shipping counters"""
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot['queue_depth'] = self.queue.qsize()
+        snapshot['queue_capacity'] = self.queue.maxsize
+        return snapshot
@@ -0,0 +1,269 @@
+import bisect
+import json
+import os
+import re
+import threading
+import time
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Prefix of the shared counters that hold flushed metrics
+PREFIX = 'metrics:'
+# Prefix of the per-worker gauge entries, one per process id
+GAUGE_PREFIX = 'metrics-gauges:'
+HISTOGRAM_SUFFIXES = ('_bucket', '_sum', '_count')
+LE_LABEL = re.compile(r'le="([^"]+)"')
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def series(name, labels):
+    """Sample name with its labels in Prometheus syntax, e.g. requests_total{route="search"}"""
+    pairs = [f'{key}="{escape(value)}"' for key, value in sorted(labels.items())]
+    return f"{name}{{{','.join(pairs)}}}" if pairs else name
+
+
+def format_value(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def sort_key(sample):
+    """Order samples by name and labels, with histogram buckets in numeric order"""
+    match = LE_LABEL.search(sample)
+    if match is None:
+        return sample, 0.0
+    bound = float('inf') if match.group(1) == '+Inf' else float(match.group(1))
+    return sample[:match.start()], bound
+
+
+class Shard:
+    """One thread's counters and histograms; only that thread writes to it"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.counters = {}
+        self.histograms = {}
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and latency histograms, shared by all workers
+
+    Recording is lock-free: each thread updates its own shard, and nothing
+    else writes to it. A background thread sums the shards every
+    `flush_interval` seconds and adds what changed since the last flush
+    to counters in the shared cache backend, in one transaction. With the
+    SQLite backend every gunicorn worker on the host flushes into the same
+    counters, so `prometheus()` returns host-wide totals from any worker.
+    Counters survive worker restarts.
+
+    Gauges are per-process values that are summed across workers: each
+    flush stores this worker's values in a cache entry of its own that
+    expires after `gauge_ttl` seconds, so a worker that is killed stops
+    counting once its entry lapses; `close()` deletes it at once. Collectors added with `add_collector` set gauges just before
+    each flush. Host collectors (`add_host_collector`) report values that
+    are already host-wide, such as the shared cache counters, and run at
+    exposition time.
+
+    With `export`, the flusher also calls `export()` every
+    `export_interval` seconds, e.g. to ship a metrics document to
+    Elasticsearch.
+    """
+
+    def __init__(self, backend, namespace='mimiketech', flush_interval=5.0, export=None, export_interval=60.0,
+                 gauge_ttl=None):
+        self.backend = backend
+        self.namespace = namespace
+        self.flush_interval = flush_interval
+        self.gauge_ttl = gauge_ttl or max(3 * flush_interval, 15.0)
+        self.export = export
+        self.export_interval = export_interval
+
+        self._families = {}
+        self._collectors = []
+        self._host_collectors = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._shards = []
+        self._gauges = {}
+        self._published = {}
+        self._last_export = 0.0
+
+    def _declare(self, name, kind, help_text, buckets=None):
+        self._families[name] = (kind, help_text, buckets)
+        return name
+
+    def counter(self, name, help_text):
+        return self._declare(name, 'counter', help_text)
+
+    def gauge(self, name, help_text):
+        return self._declare(name, 'gauge', help_text)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._declare(name, 'histogram', help_text, tuple(buckets))
+
+    def add_collector(self, collector):
+        """`collector(registry)` runs before each flush, typically calling set_gauge"""
+        self._collectors.append(collector)
+
+    def add_host_collector(self, collector):
+        """`collector()` returns (name, labels, value) samples that are already host-wide"""
+        self._host_collectors.append(collector)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is not None and shard.pid == os.getpid():
+            return shard
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked: the parent's samples and flusher thread belong to the parent
+                self._pid = os.getpid()
+                self._shards = []
+                self._gauges = {}
+                self._published = {}
+                self._stop_event.clear()
+                self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+                self._thread.start()
+            shard = Shard(self._pid)
+            self._shards.append(shard)
+        self._local.shard = shard
+        return shard
+
+    def inc(self, name, amount=1, **labels):
+        counters = self._shard().counters
+        key = series(name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        histograms = self._shard().histograms
+        key = (name, series('', labels))
+        counts = histograms.get(key)
+        if counts is None:
+            # One count per bucket, then +Inf, then the running sum
+            counts = histograms[key] = [0] * (len(self._families[name][2]) + 2)
+        counts[bisect.bisect_left(self._families[name][2], value)] += 1
+        counts[-1] += value
+
+    def set_gauge(self, name, value, **labels):
+        self._shard()  # starts the flusher in this process
+        self._gauges[series(name, labels)] = value
+
+    def _totals(self):
+        """Sum of every shard, as cumulative Prometheus samples"""
+        totals = {}
+        for shard in list(self._shards):
+            for key, value in shard.counters.copy().items():
+                totals[key] = totals.get(key, 0) + value
+            for (name, labels), counts in shard.histograms.copy().items():
+                counts = list(counts)
+                buckets = self._families[name][2]
+                label_pairs = labels[1:-1]
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), counts):
+                    cumulative += count
+                    key = f"{name}_bucket{{{label_pairs + ',' if label_pairs else ''}le=\"{bound}\"}}"
+                    totals[key] = totals.get(key, 0) + cumulative
+                totals[f"{name}_count{labels}"] = totals.get(f"{name}_count{labels}", 0) + cumulative
+                totals[f"{name}_sum{labels}"] = totals.get(f"{name}_sum{labels}", 0) + counts[-1]
+        return totals
+
+    def flush(self):
+        """Add this worker's counter changes since the last flush to the shared counters and store its gauges"""
+        if self._pid != os.getpid():
+            return
+        with self._flush_lock:
+            for collector in self._collectors:
+                try:
+                    collector(self)
+                except Exception as e:
+                    print(f"Metrics collector failed: {e}")
+            self.backend.set(f"{GAUGE_PREFIX}{self._pid}", json.dumps(self._gauges.copy()), self.gauge_ttl)
+            totals = self._totals()
+            deltas = {}
+            for key, value in totals.items():
+                # New samples are written even at zero, so every histogram bucket is exposed
+                delta = value - self._published.get(key, 0)
+                if delta or key not in self._published:
+                    deltas[PREFIX + key] = delta
+            if deltas:
+                self.backend.incr_many(deltas)
+            self._published = totals
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Failed to flush metrics: {e}")
+            if self.export is not None and time.time() - self._last_export >= self.export_interval:
+                self._last_export = time.time()
+                try:
+                    self.export()
+                except Exception as e:
+                    print(f"Failed to export metrics: {e}")
+
+    def samples(self):
+        """Host-wide samples: {sample name with labels: value}"""
+        self.flush()
+        values = {}
+        for key, value in self.backend.counters(PREFIX).items():
+            sample = key[len(PREFIX):]
+            # Gauges only come from the live workers' entries below
+            if self._families.get(self._family(sample), ('gauge',))[0] != 'gauge':
+                values[sample] = value
+        for gauges in self.backend.scan(GAUGE_PREFIX).values():
+            for sample, value in json.loads(gauges).items():
+                values[sample] = values.get(sample, 0) + value
+        for collector in self._host_collectors:
+            try:
+                for name, labels, value in collector():
+                    values[series(name, labels)] = value
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        return values
+
+    def _family(self, sample):
+        name = sample.partition('{')[0]
+        if name in self._families:
+            return name
+        for suffix in HISTOGRAM_SUFFIXES:
+            if name.endswith(suffix) and name[:-len(suffix)] in self._families:
+                return name[:-len(suffix)]
+        return None
+
+    def total(self, name):
+        """Sum of every sample of one metric, across its labels"""
+        return sum(value for sample, value in self.samples().items() if self._family(sample) == name)
+
+    def prometheus(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        grouped = {}
+        for sample, value in self.samples().items():
+            family = self._family(sample)
+            if family is not None:
+                grouped.setdefault(family, []).append((sample, value))
+        lines = []
+        for family in sorted(grouped):
+            kind, help_text, _ = self._families[family]
+            full_name = f"{self.namespace}_{family}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for sample, value in sorted(grouped[family], key=lambda item: sort_key(item[0])):
+                lines.append(f"{self.namespace}_{sample} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        """Stop flushing and remove this worker's gauge values from the totals"""
+        self._stop_event.set()
+        try:
+            self.flush()
+            self.backend.delete(f"{GAUGE_PREFIX}{self._pid}")
+        except Exception as e:
+            print(f"Failed to flush metrics: {e}")
@@ -0,0 +1,226 @@
+import argparse
+
+from elasticsearch.helpers import scan
+
+from bulk_ingest import chunk_actions, send_chunk
+from es_client import create_client
+from index_management import ensure_alias
+
+# Passages are runs of whole paragraphs up to this many characters
+PASSAGE_MAX_CHARS = 1200
+# Paragraphs repeated at the start of the next passage, so matches spanning a boundary are kept
+PASSAGE_OVERLAP = 1
+
+def split_long(paragraph, max_chars):
+    """Split a paragraph longer than `max_chars` on word boundaries"""
+    pieces = []
+    current = []
+    length = 0
+    words = []
+    for word in paragraph.split():
+        # Words longer than a passage (e.g. encoded data) are cut into pieces
+        words.extend(word[i:i + max_chars] for i in range(0, len(word), max_chars))
+    for word in words:
+        if current and length + len(word) + 1 > max_chars:
+            pieces.append(' '.join(current))
+            current = []
+            length = 0
+        current.append(word)
+        length += len(word) + 1
+    if current:
+        pieces.append(' '.join(current))
+    return pieces
+
+
+def split_passages(paragraphs, max_chars=PASSAGE_MAX_CHARS, overlap=PASSAGE_OVERLAP):
+    """Group paragraphs into overlapping passages of at most about `max_chars`"""
+    units = []
+    for paragraph in paragraphs:
+        paragraph = paragraph.strip()
+        if paragraph:
+            units.extend(split_long(paragraph, max_chars) if len(paragraph) > max_chars else [paragraph])
+
+    passages = []
+    start = 0
+    while start < len(units):
+        end = start
+        length = 0
+        while end < len(units) and (end == start or length + len(units[end]) <= max_chars):
+            length += len(units[end]) + 2
+            end += 1
+        passages.append('\n\n'.join(units[start:end]))
+        if end >= len(units):
+            break
+        # Step back by the overlap, unless the next passage would then have no room for new text
+        next_start = max(end - overlap, start + 1)
+        carried = sum(len(unit) + 2 for unit in units[next_start:end])
+        start = next_start if carried + len(units[end]) <= max_chars else end
+    return passages
+
+
+def document_paragraphs(document):
+    """Paragraph texts of an indexed document, from `paragraphs` or `content`"""
+    if document.get('paragraphs'):
+        return document['paragraphs']
+    return document.get('content', '').split('\n\n')
+
+
+def passage_actions(index_name, doc_id, document):
+    """Bulk (name, action, passage) entries for a document's passages
+
+    Passage ids derive from the parent id, so re-indexing the same content
+    overwrites its passages instead of adding more.
+    """
+    for number, text in enumerate(split_passages(document_paragraphs(document))):
+        passage = {
+            "parent_id": doc_id,
+            "title": document.get('title'),
+            "filename": document.get('filename'),
+            "has_original": document.get('has_original', False),
+            "passage": number,
+            "text": text
+        }
+        yield doc_id, {"index": {"_index": index_name, "_id": f"{doc_id}-{number}"}}, passage
+
+
+def index_passages(es, index_name, doc_id, document):
+    """Index a document's passages with _bulk; returns (indexed count, failed list)"""
+    indexed_count = 0
+    failures = []
+    for chunk in chunk_actions(passage_actions(index_name, doc_id, document)):
+        indexed, failed, _ = send_chunk(es, chunk)
+        indexed_count += len(indexed)
+        failures.extend(failed)
+    return indexed_count, failures
+
+
+def delete_passages(es, index_name, doc_ids):
+    """Delete every passage belonging to the given parent documents"""
+    doc_ids = [doc_id for doc_id in doc_ids if doc_id]
+    if not doc_ids:
+        return 0
+    response = es.delete_by_query(
+        index=index_name,
+        query={"terms": {"parent_id": doc_ids}},
+        conflicts='proceed',
+        refresh=False
+    )
+    return response.get('deleted', 0)
+
+
+def passage_query(query, offset=0, size=10, passages_per_doc=3, track_total_hits=False, ids_only=False):
+    """Request body for a passage search collapsed to one hit per parent document"""
+    body = {
+        "query": {
+            "multi_match": {
+                "query": query,
+                "fields": ["title^2", "text"],
+                "fuzziness": "AUTO"
+            }
+        },
+        "collapse": {"field": "parent_id"},
+        "from": offset,
+        "size": size,
+        "track_total_hits": False,
+        "_source": ["parent_id", "title", "filename", "has_original"]
+    }
+    if track_total_hits is not False:
+        body["aggs"] = {"documents": {"cardinality": {"field": "parent_id"}}}
+    if ids_only:
+        body["_source"] = ["parent_id"]
+    else:
+        body["collapse"]["inner_hits"] = {
+            "name": "passages",
+            "size": passages_per_doc,
+            "_source": ["passage", "text"],
+            "highlight": {"fields": {"text": {"fragment_size": 200, "number_of_fragments": 1}}}
+        }
+    return body
+
+
+def format_passage_hits(response, track_total_hits=False, ids_only=False):
+    """(hits, total) from a passage_query response; see search_passages"""
+    hits = []
+    for hit in response['hits']['hits']:
+        source = hit['_source']
+        result = {"id": source['parent_id'], "score": hit['_score']}
+        if not ids_only:
+            result["title"] = source.get('title')
+            result["filename"] = source.get('filename')
+            result["has_original"] = source.get('has_original', False)
+            inner = hit.get('inner_hits', {}).get('passages', {}).get('hits', {}).get('hits', [])
+            result["passages"] = [{
+                "passage": passage['_source']['passage'],
+                "score": passage['_score'],
+                "text": passage['_source']['text'],
+                "highlight": passage.get('highlight', {}).get('text', [])
+            } for passage in inner]
+            fragments = [fragment for passage in result["passages"] for fragment in passage["highlight"]]
+            if fragments:
+                result["highlights"] = {"content": fragments}
+        hits.append(result)
+
+    total = None
+    if track_total_hits is not False:
+        # cardinality is an estimate, so the count is never reported as exact
+        total = {"value": response['aggregations']['documents']['value'], "relation": "gte"}
+    return hits, total
+
+
+def search_passages(es, index_name, query, offset=0, size=10, passages_per_doc=3,
+                    track_total_hits=False, ids_only=False):
+    """Search passages and return (hits, total), one hit per parent document
+
+    Hits are collapsed on the parent id; each carries the parent's title
+    and filename, its best passages and their highlights under
+    highlights['content'], the same place document-level search puts them.
+    `total` counts matching documents, or is None when not requested; the
+    count comes from a cardinality aggregation, which is approximate, so
+    its relation is always "gte".
+    """
+    body = passage_query(query, offset, size, passages_per_doc, track_total_hits, ids_only)
+    response = es.search(index=index_name, body=body)
+    return format_passage_hits(response, track_total_hits, ids_only)
+
+
+def rebuild_passages(es, source_index, passage_index, batch_docs=100):
+    """(Re)build the passage index from every document in `source_index`"""
+    ensure_alias(es, passage_index, 'passages')
+
+    def actions():
+        for hit in scan(es, index=source_index, query={"query": {"match_all": {}}},
+                        _source=["title", "filename", "has_original", "content", "paragraphs"]):
+            yield from passage_actions(passage_index, hit['_id'], hit['_source'])
+
+    documents = set()
+    indexed_count = 0
+    failed_count = 0
+    for chunk in chunk_actions(actions(), max_docs=batch_docs * 10):
+        indexed, failed, _ = send_chunk(es, chunk)
+        documents.update(name for name, _ in indexed)
+        indexed_count += len(indexed)
+        failed_count += len(failed)
+    return len(documents), indexed_count, failed_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the passage index for an existing documents index")
+    parser.add_argument("--url", required=True, help="Elasticsearch URL")
+    parser.add_argument("--username", help="Elasticsearch username")
+    parser.add_argument("--password", help="Elasticsearch password")
+    parser.add_argument("--api-key", help="Elasticsearch API key")
+    parser.add_argument("--index", default="documents", help="Documents index to read")
+    parser.add_argument("--passage-index", help="Passage index to write (default: <index>-passages)")
+
+    args = parser.parse_args()
+
+    # Validate auth params
+    if not (args.api_key or (args.username and args.password)):
+        print("Error: You must provide either API key or username and password")
+        exit(1)
+
+    es = create_client(args.url, api_key=args.api_key, username=args.username, password=args.password)
+
+    passage_index = args.passage_index or f"{args.index}-passages"
+    documents, indexed, failed = rebuild_passages(es, args.index, passage_index)
+    print(f"Indexed {indexed} passages for {documents} documents into '{passage_index}' ({failed} failed)")
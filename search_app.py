@@ -1,7 +1,7 @@
-from flask import Flask, render_template, request, jsonify, Response, redirect, url_for, send_from_directory
-from elasticsearch import Elasticsearch
+from flask import Flask, Request, render_template, request, jsonify, Response, redirect, url_for, send_from_directory, send_file, g
+from elasticsearch import ApiError, ConnectionError as ESConnectionError, ConnectionTimeout
 from werkzeug.utils import secure_filename
-from docx import Document
+import docx_stream
 import logging
 from logging.handlers import RotatingFileHandler
 import datetime
@@ -11,73 +11,119 @@ import os
 import json
 import tempfile
 import uuid
+import io
 import socket
 import base64
+import atexit
+import hashlib
+import threading
+import fcntl
+from log_shipper import BulkLogShipper
+import search_cache
+import cache_backends
+import doc_identity
+import batch_upload
+import passages
+import index_management
+import suggest
+import local_search
+from doc_store import DocumentStore, COMPRESSED as COMPRESSED_DOWNLOADS
+from bulk_ingest import chunk_actions, index_action, send_chunk
+from jobs import JobManager
+from es_client import SharedClient, add_request_observer
+from es_health import HealthMonitor
+from metrics_registry import MetricsRegistry
+
+class SpooledRequest(Request):
+    """Request whose uploaded files stay in memory up to UPLOAD_SPOOL_BYTES
+
+    Batch uploads go straight to disk: all of a batch's files are kept
+    until its job finishes, so in memory they would add up to
+    UPLOAD_SPOOL_BYTES per file.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Anonymous temp files, which the OS removes even if the worker is killed
+        if self.endpoint == 'upload_batch':
+            return tempfile.TemporaryFile(dir=app.config['UPLOAD_FOLDER'])
+        return tempfile.SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_BYTES'], dir=app.config['UPLOAD_FOLDER'])
 
 app = Flask(__name__)
+app.request_class = SpooledRequest
 
 # Configuration
 app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()  # Use system temp directory
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
 app.config['ALLOWED_EXTENSIONS'] = {'docx'}
+app.config['SEARCH_LAYOUT'] = os.environ.get('SEARCH_LAYOUT', 'document')  # 'document' or 'passages' (chunked passage index)
+app.config['LOCAL_SEARCH'] = os.environ.get('LOCAL_SEARCH', 'off')  # 'off', 'fallback' (when Elasticsearch is unreachable) or 'primary'
+app.config['LOCAL_INDEX_PATH'] = os.environ.get('LOCAL_INDEX_PATH', os.path.join(tempfile.gettempdir(), 'mimiketech-local-index'))
+app.config['DOC_STORE_PATH'] = os.environ.get('DOC_STORE_PATH', os.path.join(tempfile.gettempdir(), 'mimiketech-doc-store'))
+app.config['UPLOAD_SPOOL_BYTES'] = int(os.environ.get('UPLOAD_SPOOL_BYTES', 8 * 1024 * 1024))  # uploads above this spill to disk
+app.config['CACHE_BACKEND'] = os.environ.get('CACHE_BACKEND', 'sqlite')  # 'sqlite' (shared by workers) or 'memory'
+app.config['CACHE_PATH'] = os.environ.get('CACHE_PATH', os.path.join(tempfile.gettempdir(), 'mimiketech-cache.sqlite3'))
+app.config['BATCH_MAX_CONTENT_LENGTH'] = 256 * 1024 * 1024  # max request size for /upload-batch
+app.config['BATCH_MAX_FILES'] = 500  # max documents per batch, including archive members
+app.config['UPLOAD_WORKERS'] = int(os.environ.get('UPLOAD_WORKERS', 2))  # background conversion threads per worker
+app.config['FINGERPRINT_PATH'] = os.environ.get('FINGERPRINT_PATH', os.path.join(tempfile.gettempdir(), 'mimiketech-fingerprints.sqlite3'))
+app.config['HEALTH_CHECK_INTERVAL'] = float(os.environ.get('HEALTH_CHECK_INTERVAL', 10))  # seconds between cluster probes
+app.config['HEALTH_FAILURE_THRESHOLD'] = int(os.environ.get('HEALTH_FAILURE_THRESHOLD', 3))  # consecutive failures that open the circuit
+app.config['HEALTH_RESET_TIMEOUT'] = float(os.environ.get('HEALTH_RESET_TIMEOUT', 30))  # seconds before an open circuit is probed again
+app.config['BOOTSTRAP_MARKER'] = os.environ.get('BOOTSTRAP_MARKER', os.path.join(tempfile.gettempdir(), 'mimiketech-bootstrap.json'))
+app.config['BOOTSTRAP_RETRY_INTERVAL'] = 60  # seconds between lazy bootstrap attempts while the cluster is unreachable
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))  # seconds between pushes of worker metrics to the shared counters
+app.config['METRICS_EXPORT_INTERVAL'] = float(os.environ.get('METRICS_EXPORT_INTERVAL', 60))  # seconds between metrics documents shipped to Elasticsearch; 0 turns it off
 
 # Add metrics tracking attributes to app
 app.start_time = time.time()
 app.request_count = 0
 app.active_requests = set()
 
-# Create a static folder for assets if it doesn't exist
+# Static assets; the logo is written by bootstrap()
 STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
-if not os.path.exists(STATIC_FOLDER):
-    os.makedirs(STATIC_FOLDER)
-if not os.path.exists(os.path.join(STATIC_FOLDER, 'images')):
-    os.makedirs(os.path.join(STATIC_FOLDER, 'images'))
 
 # Elasticsearch connection details
-ES_URL = "https://7f5e3429796d45748b57199b8b00f8d2.us-east-1.aws.found.io:443"
-ES_API_KEY = "OU9VcTg1VUJqeXlLQnlwZHdtdHE6ZUlqcHdodTVTWmFpTXh0cjNUVDg1UQ=="
+ES_URL = os.environ.get('ES_URL', "https://7f5e3429796d45748b57199b8b00f8d2.us-east-1.aws.found.io:443")
+ES_API_KEY = os.environ.get('ES_API_KEY', "OU9VcTg1VUJqeXlLQnlwZHdtdHE6ZUlqcHdodTVTWmFpTXh0cjNUVDg1UQ==")
 ES_INDEX = "docstraining4"
+PASSAGE_INDEX = f"{ES_INDEX}-passages"  # overlapping paragraph passages, used by the 'passages' layout
+
+# Elasticsearch client with the shared pool, timeout and retry settings (see es_client.py);
+# each gunicorn worker creates its own on first use
+es = SharedClient(ES_URL, api_key=ES_API_KEY)
+
+# Cluster state probed in the background, so requests check a flag instead of pinging (see es_health.py)
+cluster_health = HealthMonitor(
+    es,
+    interval=app.config['HEALTH_CHECK_INTERVAL'],
+    failure_threshold=app.config['HEALTH_FAILURE_THRESHOLD'],
+    reset_timeout=app.config['HEALTH_RESET_TIMEOUT']
+)
+
+# Indices are versioned and read/written through aliases (see index_management.py); bootstrap() creates them
+ALIASES = [(ES_INDEX, 'documents'), ('mimiketech-logs', 'logs'), ('mimiketech-metrics', 'metrics')]
+if app.config['SEARCH_LAYOUT'] == 'passages':
+    ALIASES.append((PASSAGE_INDEX, 'passages'))
 
-# Initialize Elasticsearch client
-es = Elasticsearch(ES_URL, api_key=ES_API_KEY, verify_certs=False)
-
-# Add this right after initializing your Elasticsearch client
-try:
-    if not es.indices.exists(index='mimiketech-logs'):
-        es.indices.create(index='mimiketech-logs')
-    if not es.indices.exists(index='mimiketech-metrics'):
-        es.indices.create(index='mimiketech-metrics')
-except Exception as e:
-    print(f"Error creating indices: {e}")
-
-# Set up file logging
-if not os.path.exists('logs'):
-    os.mkdir('logs')
-file_handler = RotatingFileHandler('logs/search_app.log', maxBytes=10240, backupCount=10)
+# Set up file logging; the file is opened on the first record, once prepare_folders() has created logs/
+LOG_FOLDER = 'logs'
+file_handler = RotatingFileHandler(os.path.join(LOG_FOLDER, 'search_app.log'), maxBytes=10240, backupCount=10, delay=True)
 file_handler.setFormatter(logging.Formatter(
     '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
 ))
 file_handler.setLevel(logging.INFO)
 app.logger.addHandler(file_handler)
 app.logger.setLevel(logging.INFO)
-app.logger.info('Search app startup')
+
+# Ship log documents to Elasticsearch in batches from a background thread
+log_shipper = BulkLogShipper(es, max_queue_size=10000, batch_size=500, flush_interval=2.0)
+atexit.register(log_shipper.close)
 
 # Set up application logging to Elasticsearch
 class ElasticsearchLogHandler(logging.Handler):
-# In your ElasticsearchLogHandler class, modify the index_name to include a date
-def emit(self, record):
-    try:
-        # Use a daily index pattern
-        actual_index = f"{self.index_name}-{datetime.datetime.utcnow().strftime('%Y.%m.%d')}"
-        log_entry = {
-            # ... your log entry data ...
-        }
-        self.es_client.index(index=actual_index, document=log_entry)
-    except Exception as e:
-        print(f"Failed to send log to Elasticsearch: {e}")
-    def __init__(self, es_client, index_name):
+    def __init__(self, shipper, index_name):
         super().__init__()
-        self.es_client = es_client
+        self.shipper = shipper
         self.index_name = index_name
         self.hostname = socket.gethostname()
         
@@ -96,21 +142,113 @@ def emit(self, record):
                 'request_id': getattr(record, 'request_id', str(uuid.uuid4()))
             }
             
-            self.es_client.index(index=self.index_name, document=log_entry)
+            # Queued, not indexed: the shipper sends it with the next _bulk batch
+            self.shipper.enqueue(self.index_name, log_entry)
         except Exception as e:
-            print(f"Failed to send log to Elasticsearch: {e}")
+            print(f"Failed to queue log for Elasticsearch: {e}")
 
 # Add Elasticsearch log handler to app logger
-es_handler = ElasticsearchLogHandler(es, 'mimiketech-logs')
+es_handler = ElasticsearchLogHandler(log_shipper, 'mimiketech-logs')
 es_handler.setLevel(logging.INFO)
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 es_handler.setFormatter(formatter)
 app.logger.addHandler(es_handler)
 
-# Create logo and save it to static folder
-def create_logo():
-    # Base64 encoded SVG logo for Mimiketech
-    logo_svg = '''
+# Record of already-indexed content, so re-uploads don't create duplicate documents
+fingerprints = doc_identity.FingerprintIndex(app.config['FINGERPRINT_PATH'])
+
+# Cache backend shared by all gunicorn workers on this host (or per-process)
+if app.config['CACHE_BACKEND'] == 'sqlite':
+    cache_backend = cache_backends.create_backend('sqlite', path=app.config['CACHE_PATH'])
+else:
+    cache_backend = cache_backends.create_backend('memory')
+
+# Background conversion/indexing jobs for uploads; status is shared through the cache backend
+upload_jobs = JobManager(cache_backend, max_workers=app.config['UPLOAD_WORKERS'])
+atexit.register(upload_jobs.shutdown)
+
+# Caches of /search results and fetched documents, invalidated whenever the documents index changes
+SEARCH_CACHE_GENERATION_CHECK_INTERVAL = 10  # seconds between index stats probes
+result_cache = search_cache.SearchCache(cache_backend, namespace='search', ttl=300)
+document_cache = search_cache.SearchCache(cache_backend, namespace='documents', ttl=600)
+_last_generation_check = 0
+_last_generation_token = None
+
+def load_suggestion_sources():
+    """(id, title, headings) for every indexed document, for the suggestion trie"""
+    for listing in iter_listings(fields=["title", "headings"]):
+        yield listing["id"], listing["title"], listing["headings"]
+
+# Ready-to-send download files (text, JSON, original .docx) written at ingest time
+doc_store = DocumentStore(app.config['DOC_STORE_PATH'])
+DOWNLOAD_MAX_AGE = 24 * 3600  # stored files never change: their ids are content hashes
+
+# Embedded BM25 index on local disk, kept in step with uploads (see local_search.py)
+local_index = None
+if app.config['LOCAL_SEARCH'] != 'off':
+    local_index = local_search.LocalIndex(app.config['LOCAL_INDEX_PATH'])
+
+def es_unavailable(error):
+    """Whether an Elasticsearch error means the cluster could not serve the request
+
+    Such errors are reported to the health monitor, so repeated failures
+    open the circuit without waiting for the next probe.
+    """
+    unavailable = isinstance(error, (ESConnectionError, ConnectionTimeout)) or (
+        isinstance(error, ApiError) and error.status_code >= 500
+    )
+    if unavailable:
+        cluster_health.record_failure(error)
+    return unavailable
+
+# In-process autocomplete trie over titles and frequent title/heading terms
+suggestions = suggest.SuggestIndex(load_suggestion_sources, max_age=600, min_interval=30)
+
+def generation_check_due():
+    """Whether it is time to probe the index for writes made by other processes"""
+    global _last_generation_check
+    now = time.time()
+    if now - _last_generation_check < SEARCH_CACHE_GENERATION_CHECK_INTERVAL:
+        return False
+    _last_generation_check = now
+    return True
+
+def sync_index_generation(stats):
+    """Invalidate caches and suggestions if the indexing stats show new writes"""
+    global _last_generation_token
+    # Indexing/delete totals change whenever any worker or uploader script writes
+    indexing = stats['_all']['primaries']['indexing']
+    token = (indexing['index_total'], indexing['delete_total'])
+    result_cache.sync_generation(token)
+    document_cache.sync_generation(token)
+    if _last_generation_token is not None and token != _last_generation_token:
+        suggestions.invalidate()
+    _last_generation_token = token
+
+def check_index_generation():
+    """Invalidate cached results if documents were indexed by another process"""
+    if not generation_check_due():
+        return
+    try:
+        sync_index_generation(es.indices.stats(index=ES_INDEX, metric='indexing'))
+    except Exception as e:
+        print(f"Failed to check index generation: {e}")
+
+def invalidate_after_writes(use_passages):
+    """Refresh the indices an upload wrote to, then drop cached results and documents
+
+    Without the refresh, a search made before the next refresh_interval
+    would still see the old index and be cached for the full cache TTL.
+    """
+    try:
+        es.indices.refresh(index=[ES_INDEX, PASSAGE_INDEX] if use_passages else ES_INDEX)
+    except Exception as e:
+        app.logger.warning(f"Failed to refresh after upload: {e}")
+    result_cache.invalidate()
+    document_cache.invalidate()
+
+# SVG logo for Mimiketech, saved to the static folder by bootstrap()
+LOGO_SVG = '''
     <svg xmlns="http://www.w3.org/2000/svg" width="200" height="60" viewBox="0 0 200 60">
         <rect width="200" height="60" fill="#2c3e50" rx="5" ry="5"/>
         <text x="20" y="38" font-family="Arial, sans-serif" font-size="24" font-weight="bold" fill="#ecf0f1">Mimiketech</text>
@@ -118,28 +256,140 @@ def create_logo():
         <path d="M165 30 L175 30 M170 25 L170 35" stroke="#ecf0f1" stroke-width="2"/>
     </svg>
     '''
-    
-    # Save the SVG logo
-    with open(os.path.join(STATIC_FOLDER, 'images', 'logo.svg'), 'w') as f:
-        f.write(logo_svg)
-    
-    return '/static/images/logo.svg'
+logo_path = '/static/images/logo.svg'
+
+def create_logo():
+    """Save the logo to the static folder, unless it is already there"""
+    path = os.path.join(STATIC_FOLDER, 'images', 'logo.svg')
+    try:
+        with open(path) as f:
+            if f.read() == LOGO_SVG:
+                return logo_path
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(LOGO_SVG)
+    return logo_path
 
-# Generate logo path
-logo_path = create_logo()
+def bootstrap_key():
+    """Identifies what bootstrap() sets up, so a changed deploy runs it again"""
+    return hashlib.sha256(json.dumps([ES_URL, ALIASES, LOGO_SVG]).encode('utf-8')).hexdigest()[:16]
+
+def bootstrapped():
+    """Whether bootstrap() has completed for this configuration on this host"""
+    try:
+        with open(app.config['BOOTSTRAP_MARKER']) as f:
+            return json.load(f).get('key') == bootstrap_key()
+    except (FileNotFoundError, ValueError):
+        return False
+
+def prepare_folders():
+    """Create the local folders the app writes to: logs, the document store and the local index"""
+    os.makedirs(LOG_FOLDER, exist_ok=True)
+    os.makedirs(app.config['DOC_STORE_PATH'], exist_ok=True)
+    if local_index is not None:
+        os.makedirs(app.config['LOCAL_INDEX_PATH'], exist_ok=True)
+
+def bootstrap(force=False):
+    """One-time startup tasks: local folders, the static logo and the index aliases
+
+    Runs once per deploy from `python bootstrap.py`, or in the background
+    from the first worker to serve a request (see ensure_bootstrapped), and
+    records a marker so later starts skip it. Every task is idempotent.
+    Returns whether everything is in place.
+    """
+    if not force and bootstrapped():
+        return True
+    prepare_folders()
+    create_logo()
+    try:
+        for index_name, role in ALIASES:
+            index_management.ensure_alias(es, index_name, role)
+    except Exception as e:
+        print(f"Error creating indices: {e}")
+        return False
+    marker = app.config['BOOTSTRAP_MARKER']
+    with open(f"{marker}.{os.getpid()}.tmp", 'w') as f:
+        json.dump({'key': bootstrap_key(), 'completed_at': time.time()}, f)
+    os.replace(f"{marker}.{os.getpid()}.tmp", marker)
+    return True
+
+_folders_prepared = False
+_bootstrap_done = False
+_bootstrap_attempted = 0
+
+def ensure_bootstrapped():
+    """Run bootstrap() in the background if it has not run for this deploy
+
+    The local folders are created here first, on the worker's first
+    request (a few mkdir calls), since the folders may have been removed
+    since the bootstrap ran. The rest is a fallback for deploys that
+    skipped `python bootstrap.py`; requests never wait for it.
+    """
+    global _folders_prepared, _bootstrap_done, _bootstrap_attempted
+    if not _folders_prepared:
+        prepare_folders()
+        _folders_prepared = True
+        app.logger.info('Search app startup')
+    if _bootstrap_done:
+        return
+    now = time.time()
+    if now - _bootstrap_attempted < app.config['BOOTSTRAP_RETRY_INTERVAL']:
+        return
+    _bootstrap_attempted = now
+    if bootstrapped():
+        _bootstrap_done = True
+        return
+    threading.Thread(target=run_bootstrap, name='bootstrap', daemon=True).start()
+
+def run_bootstrap():
+    """bootstrap() in at most one process at a time; the others check again at the next retry interval"""
+    global _bootstrap_done
+    with open(f"{app.config['BOOTSTRAP_MARKER']}.lock", 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        _bootstrap_done = bootstrap()
+
+def fetch_document(doc_id):
+    """Fetch a document's _source, served from the document cache when possible"""
+    source = document_cache.get(doc_id)
+    if source is None:
+        if local_index is not None and not cluster_health.available():
+            return local_index.get(doc_id)
+        try:
+            doc = es.get(index=ES_INDEX, id=doc_id)
+        except Exception as e:
+            if not es_unavailable(e) or local_index is None:
+                raise
+            app.logger.warning(f"Elasticsearch unavailable, reading {doc_id} from the local index: {e}")
+            return local_index.get(doc_id)
+        source = doc.get('_source') if doc else None
+        if source:
+            document_cache.set(doc_id, source)
+    return source
 
 def allowed_file(filename):
     """Check if the file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-def convert_docx_to_json(file_path, original_filename):
-    """Convert a .docx file to JSON format"""
+def take_upload_stream(file):
+    """Take an upload's spooled buffer so it outlives the request
+
+    Werkzeug closes request files when the request ends; the background
+    job reads the buffer directly instead of a copy saved to disk.
+    """
+    stream = file.stream
+    file.stream = io.BytesIO()
+    stream.seek(0)
+    return stream
+
+def convert_docx_to_json(source, original_filename):
+    """Convert a .docx file (a path or binary file object) to JSON format"""
     try:
-        # Open the document
-        doc = Document(file_path)
-        
-        # Extract text from paragraphs
-        paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
+        # Stream the document XML: headings, paragraphs, table cells, headers and footers
+        paragraphs, headings = docx_stream.extract_text(source)
         
         # Extract base name without extension
         base_name = os.path.splitext(original_filename)[0]
@@ -149,7 +399,8 @@ def convert_docx_to_json(file_path, original_filename):
             "title": base_name,
             "filename": original_filename,
             "content": "\n\n".join(paragraphs),
-            "paragraphs": paragraphs
+            "paragraphs": paragraphs,
+            "headings": headings
         }
         
         return document_data
@@ -163,6 +414,7 @@ def before_request():
     # Generate request ID
     request_id = request.headers.get('X-Request-ID') or str(uuid.uuid4())
     g.request_id = request_id
+    ensure_bootstrapped()
     # Store start time for performance tracking
     g.start_time = time.time()
     # Track request count
@@ -190,11 +442,8 @@ def after_request(response):
         'request_id': request_id
     }
     
-    # Send log to Elasticsearch
-    try:
-        es.index(index='mimiketech-logs', document=log_data)
-    except Exception as e:
-        print(f"Failed to log to Elasticsearch: {e}")
+    # Queue the access log for the background shipper
+    log_shipper.enqueue('mimiketech-logs', log_data)
     
     # Also log to application logger
     app.logger.info(
@@ -203,8 +452,8 @@ def after_request(response):
     )
     
     # Remove from active requests
-    if request_id in app.active_requests:
-        app.active_requests.remove(request_id)
+    app.active_requests.discard(request_id)
+    record_request(request.endpoint, request.method, response.status_code, duration)
     
     # Add request ID header to response
     response.headers['X-Request-ID'] = request_id
@@ -222,12 +471,73 @@ def serve_static(path):
 
 @app.route('/')
 def index():
-    # Check if Elasticsearch is connected
-    if not es.ping():
+    # Check if Elasticsearch is connected; the local index can serve searches without it
+    if local_index is None and not cluster_health.available():
         return render_template('es_error.html', logo_path=logo_path)
         
     return render_template('index.html', logo_path=logo_path)
 
+def process_upload(job, upload, filename):
+    """Background job: convert an uploaded .docx and index it"""
+    try:
+        # Skip content that is already indexed
+        job.update(stage='fingerprinting', progress=10)
+        content_hash = doc_identity.file_hash(upload)
+        existing_id = fingerprints.lookup(content_hash)
+        if existing_id:
+            app.logger.info(f"Duplicate upload skipped: {filename} (ID: {existing_id})")
+            return {
+                "message": f"Document '{filename}' is already indexed.",
+                "id": existing_id,
+                "duplicate": True
+            }
+        
+        # Convert to JSON
+        job.update(stage='converting', progress=30)
+        json_data = convert_docx_to_json(upload, filename)
+        identity = doc_identity.stamp_document(json_data, content_hash, filename, fingerprints)
+        app.logger.info(f"File converted to JSON: {filename}")
+        use_passages = app.config['SEARCH_LAYOUT'] == 'passages'
+        if use_passages:
+            # Paragraph text lives in the passage index; the parent keeps only `content`
+            del json_data['paragraphs']
+        
+        # The original .docx is stored below, so search results can offer its download
+        json_data['has_original'] = True
+        
+        # Index in Elasticsearch under the content-derived id, replacing any older version
+        job.update(stage='indexing', progress=70)
+        result = es.index(index=ES_INDEX, id=identity['doc_id'], document=json_data)
+        if use_passages:
+            job.update(stage='indexing passages', progress=85)
+            _, failures = passages.index_passages(es, PASSAGE_INDEX, identity['doc_id'], json_data)
+            if failures:
+                # Fail the job before the fingerprint is recorded, so uploading the file again retries it
+                raise Exception(f"{len(failures)} passages could not be indexed: {failures[0][1]}")
+        superseded = doc_identity.record_indexed(es, ES_INDEX, identity, fingerprints)
+        if superseded and use_passages:
+            passages.delete_passages(es, PASSAGE_INDEX, [identity['superseded_id']])
+        app.logger.info(f"File indexed in Elasticsearch: {filename} (ID: {result['_id']}, version {identity['version']})")
+        suggestions.add_document(result['_id'], json_data['title'])
+        if local_index is not None:
+            local_index.add_documents([(result['_id'], json_data)])
+            if superseded:
+                local_index.delete([identity['superseded_id']])
+        doc_store.put(result['_id'], json_data, original=upload)
+        if superseded:
+            doc_store.delete(identity['superseded_id'])
+        invalidate_after_writes(use_passages)
+        
+        return {
+            "message": f"Document '{filename}' uploaded and indexed successfully!",
+            "id": result['_id']
+        }
+    except Exception as e:
+        app.logger.error(f"Error processing file {filename}: {str(e)}")
+        raise
+    finally:
+        upload.close()
+
 @app.route('/upload', methods=['GET', 'POST'])
 def upload_file():
     if request.method == 'POST':
@@ -246,37 +556,28 @@ def upload_file():
             return jsonify({"error": "No file selected"}), 400
             
         if file and allowed_file(file.filename):
-            # Secure the filename and save temporarily
+            if not cluster_health.available():
+                app.logger.warning(f"Upload rejected, Elasticsearch unavailable: {file.filename}")
+                return jsonify({"error": "Indexing is temporarily unavailable; please try again later"}), 503
+            
             filename = secure_filename(file.filename)
-            temp_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4()}_{filename}")
+            upload = take_upload_stream(file)
             
             try:
-                file.save(temp_filepath)
-                app.logger.info(f"File saved temporarily: {filename}")
-                
-                # Convert to JSON
-                json_data = convert_docx_to_json(temp_filepath, filename)
-                app.logger.info(f"File converted to JSON: {filename}")
-                
-                # Index in Elasticsearch
-                result = es.index(index=ES_INDEX, document=json_data)
-                app.logger.info(f"File indexed in Elasticsearch: {filename} (ID: {result['_id']})")
+                # Conversion and indexing run in the background on the spooled upload; the client polls /jobs/<id>
+                job_id = upload_jobs.submit(process_upload, upload, filename, description=f"Upload {filename}")
+                app.logger.info(f"Upload job queued: {filename} (job {job_id})")
                 
-                # Clean up the temp file
-                os.remove(temp_filepath)
-                
-                # Return success with document ID
                 return jsonify({
-                    "success": True, 
-                    "message": f"Document '{filename}' uploaded and indexed successfully!",
-                    "id": result['_id']
-                })
+                    "success": True,
+                    "message": f"Document '{filename}' received and queued for indexing.",
+                    "job_id": job_id,
+                    "status_url": url_for('job_status', job_id=job_id)
+                }), 202
                 
             except Exception as e:
-                app.logger.error(f"Error processing file {filename}: {str(e)}")
-                # Clean up on error if file exists
-                if os.path.exists(temp_filepath):
-                    os.remove(temp_filepath)
+                app.logger.error(f"Error queueing file {filename}: {str(e)}")
+                upload.close()
                 return jsonify({"error": str(e)}), 500
         else:
             app.logger.warning(f"Invalid file type: {file.filename}")
@@ -285,16 +586,154 @@ def upload_file():
     # GET request returns the upload form
     return render_template('upload.html', logo_path=logo_path)
 
-@app.route('/search')
-def search():
-    query = request.args.get('q', '')
+def process_batch_upload(job, uploads):
+    """Background job: convert a batch of uploads and index them with _bulk"""
+    results = []
+    identities = {}
+    batch_hashes = {}
+    use_passages = app.config['SEARCH_LAYOUT'] == 'passages'
+    local_documents = {}
     
-    if not query:
-        return jsonify({"hits": []})
+    def documents():
+        # Convert one file at a time; archive members are read straight from the zip
+        for filename, source, error in batch_upload.iter_uploads(uploads, allowed_file, app.config['BATCH_MAX_FILES']):
+            position = len(results)
+            results.append({"filename": filename})
+            if error:
+                results[position].update(status="failed", error=error)
+                continue
+            try:
+                content_hash = doc_identity.file_hash(source)
+                existing_id = fingerprints.lookup(content_hash) or batch_hashes.get(content_hash)
+                if existing_id:
+                    results[position].update(status="duplicate", id=existing_id)
+                    continue
+                json_data = convert_docx_to_json(source, filename)
+                identity = doc_identity.stamp_document(json_data, content_hash, filename, fingerprints)
+            except Exception as e:
+                app.logger.error(f"Error processing file {filename}: {str(e)}")
+                results[position].update(status="failed", error=str(e))
+                continue
+            identities[position] = identity
+            if local_index is not None:
+                local_documents[position] = json_data
+            batch_hashes[content_hash] = identity['doc_id']
+            job.update(stage='converting', progress=min(60, 10 + position))
+            if use_passages:
+                # Paragraph text lives in the passage index; the parent keeps only `content`
+                del json_data['paragraphs']
+            # Stored now, while the upload is open; removed again below if indexing fails
+            json_data['has_original'] = True
+            doc_store.put(identity['doc_id'], json_data, original=source)
+            yield position, index_action(ES_INDEX, json_data), json_data
+            if use_passages:
+                # Passages ride in the same _bulk stream, unnamed so they are not reported per file
+                for _, action, passage in passages.passage_actions(PASSAGE_INDEX, identity['doc_id'], json_data):
+                    yield None, action, passage
     
-    app.logger.info(f"Search query: {query}")
+    try:
+        job.update(stage='converting', progress=10)
+        # Normally one _bulk request; very large batches are split at the usual size limits
+        superseded = []
+        for chunk in chunk_actions(documents()):
+            job.update(stage='indexing', progress=70)
+            indexed, failed, _ = send_chunk(es, chunk)
+            for position, doc_id in indexed:
+                if position is None:
+                    continue
+                if doc_identity.record_indexed(es, ES_INDEX, identities[position], fingerprints):
+                    superseded.append(identities[position]['superseded_id'])
+                results[position].update(status="indexed", id=doc_id)
+                suggestions.add_document(doc_id, os.path.splitext(results[position]["filename"])[0])
+            for position, error in failed:
+                if position is None:
+                    app.logger.error(f"Passage indexing failed: {error}")
+                    continue
+                results[position].update(status="failed", error=str(error))
+                doc_store.delete(identities[position]['doc_id'])
+        for doc_id in superseded:
+            doc_store.delete(doc_id)
+        if use_passages and superseded:
+            passages.delete_passages(es, PASSAGE_INDEX, superseded)
+        if local_index is not None:
+            # The whole batch becomes one local segment
+            local_index.add_documents(
+                (results[position]["id"], document) for position, document in local_documents.items()
+                if results[position].get("status") == "indexed"
+            )
+            local_index.delete(superseded)
+        
+        counts = {status: sum(1 for r in results if r.get('status') == status)
+                  for status in ('indexed', 'duplicate', 'failed')}
+        app.logger.info(f"Batch upload finished: {counts['indexed']} indexed, "
+                        f"{counts['duplicate']} duplicates, {counts['failed']} failed")
+        if counts['indexed']:
+            invalidate_after_writes(use_passages)
+        
+        return {
+            "message": f"{counts['indexed']} of {len(results)} documents indexed "
+                       f"({counts['duplicate']} already indexed, {counts['failed']} failed).",
+            **counts,
+            "files": results
+        }
+    finally:
+        for _, upload in uploads:
+            upload.close()
+
+@app.route('/upload-batch', methods=['POST'])
+def upload_batch():
+    # Batches may be much larger than a single document upload
+    request.max_content_length = app.config['BATCH_MAX_CONTENT_LENGTH']
+    files = [file for file in request.files.getlist('docfiles') + request.files.getlist('docfile') if file.filename]
+    if not files:
+        app.logger.warning("No files in batch upload request")
+        return jsonify({"error": "No files selected"}), 400
+    if len(files) > app.config['BATCH_MAX_FILES']:
+        return jsonify({"error": f"Too many files; the limit is {app.config['BATCH_MAX_FILES']}"}), 400
+    if not cluster_health.available():
+        app.logger.warning("Batch upload rejected, Elasticsearch unavailable")
+        return jsonify({"error": "Indexing is temporarily unavailable; please try again later"}), 503
     
-    # Search query with highlighting
+    uploads = [(secure_filename(file.filename), take_upload_stream(file)) for file in files]
+    try:
+        job_id = upload_jobs.submit(process_batch_upload, uploads, description=f"Batch upload of {len(uploads)} files")
+        app.logger.info(f"Batch upload job queued: {len(uploads)} files (job {job_id})")
+        
+        return jsonify({
+            "success": True,
+            "message": f"{len(uploads)} files received and queued for indexing.",
+            "job_id": job_id,
+            "status_url": url_for('job_status', job_id=job_id)
+        }), 202
+        
+    except Exception as e:
+        app.logger.error(f"Error queueing batch upload: {str(e)}")
+        for _, upload in uploads:
+            upload.close()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = upload_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+# Paging and payload settings for /search
+SEARCH_FIELDS = ["title", "filename", "has_original"]
+SEARCH_PAGE_SIZE = 10
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_FILTER_PATH = [
+    "hits.total",
+    "hits.hits._id",
+    "hits.hits._score",
+    "hits.hits._source",
+    "hits.hits.highlight"
+]
+
+def build_search_query(query, offset, size, track_total_hits, ids_only):
+    """Request body for a document-level /search"""
+    # Search query with highlighting; only the fields the UI renders are fetched
     search_query = {
         "query": {
             "multi_match": {
@@ -303,105 +742,311 @@ def search():
                 "fuzziness": "AUTO"
             }
         },
-        "highlight": {
+        "from": offset,
+        "size": size,
+        "track_total_hits": track_total_hits,
+        "_source": SEARCH_FIELDS
+    }
+    if ids_only:
+        # Lean mode: ids and scores only, no stored fields or highlighting
+        search_query["_source"] = False
+    else:
+        search_query["highlight"] = {
             "fields": {
                 "content": {"fragment_size": 200, "number_of_fragments": 3},
                 "title": {}
             }
         }
-    }
+    return search_query
+
+def format_search_hits(response, ids_only):
+    """(hits, total) for the /search payload from a build_search_query response"""
+    response_hits = response.get('hits', {})
+    hits = []
+    for hit in response_hits.get('hits', []):
+        result = {
+            "id": hit["_id"],
+            "score": hit["_score"]
+        }
+        
+        if not ids_only:
+            result["title"] = hit["_source"]["title"]
+            result["filename"] = hit["_source"]["filename"]
+            result["has_original"] = hit["_source"].get("has_original", False)
+        
+        # Add highlighting if available
+        if "highlight" in hit:
+            result["highlights"] = hit["highlight"]
+        
+        hits.append(result)
+    return hits, response_hits.get('total', {"value": 0, "relation": "eq"})
+
+def parse_track_total_hits(value):
+    """Parse the track_total_hits parameter: true, false or a count threshold"""
+    if value is None or value.lower() == 'false':
+        return False
+    if value.lower() == 'true':
+        return True
+    return int(value)
+
+@app.route('/search')
+def search():
+    query = request.args.get('q', '')
     
+    if not query:
+        return jsonify({"hits": []})
+    
+    # Paging and payload options
     try:
-        response = es.search(index=ES_INDEX, body=search_query)
-        
-        # Format the results
-        hits = []
-        for hit in response['hits']['hits']:
-            result = {
-                "id": hit["_id"],
-                "score": hit["_score"],
-                "title": hit["_source"]["title"],
-                "filename": hit["_source"]["filename"]
-            }
-            
-            # Add highlighting if available
-            if "highlight" in hit:
-                result["highlights"] = hit["highlight"]
-            
-            hits.append(result)
+        offset = max(request.args.get('from', 0, type=int), 0)
+        size = min(max(request.args.get('size', SEARCH_PAGE_SIZE, type=int), 1), SEARCH_MAX_PAGE_SIZE)
+        track_total_hits = parse_track_total_hits(request.args.get('track_total_hits'))
+    except ValueError:
+        return jsonify({"error": "track_total_hits must be true, false or an integer"}), 400
+    ids_only = request.args.get('mode') == 'ids'
+    
+    app.logger.info(f"Search query: {query}")
+    
+    # Local replica mode: answer from the embedded index without a round trip to the cluster
+    if local_index is not None and app.config['LOCAL_SEARCH'] == 'primary':
+        return search_local(query, offset, size, track_total_hits, ids_only)
+    
+    # Serve repeated queries from the result cache
+    check_index_generation()
+    layout = app.config['SEARCH_LAYOUT']
+    cache_key = search_cache.make_key(
+        query, offset=offset, size=size, track_total_hits=track_total_hits, ids_only=ids_only, layout=layout
+    )
+    cached_payload = result_cache.get(cache_key)
+    if cached_payload is not None:
+        app.logger.info(f"Search cache hit: {len(cached_payload['hits'])} hits for query '{query}'")
+        return jsonify(cached_payload)
+    
+    # Circuit open: don't wait on a cluster that is known to be down
+    if not cluster_health.available():
+        if local_index is not None:
+            app.logger.warning("Elasticsearch circuit open, searching the local index")
+            return search_local(query, offset, size, track_total_hits, ids_only)
+        return jsonify({"error": "Search is temporarily unavailable"}), 503
+    
+    try:
+        if layout == 'passages':
+            # Best matching passages per document, highlighted on the small passage field
+            hits, total = passages.search_passages(
+                es, PASSAGE_INDEX, query, offset, size, track_total_hits=track_total_hits, ids_only=ids_only
+            )
+        else:
+            # filter_path strips shard/timing metadata from the response body
+            search_query = build_search_query(query, offset, size, track_total_hits, ids_only)
+            response = es.search(index=ES_INDEX, body=search_query, filter_path=SEARCH_FILTER_PATH)
+            hits, total = format_search_hits(response, ids_only)
+        
+        payload = {"hits": hits}
+        if track_total_hits is not False:
+            payload["total"] = total
             
+        result_cache.set(cache_key, payload)
+        cluster_health.record_success()
         app.logger.info(f"Search results: {len(hits)} hits for query '{query}'")
-        return jsonify({"hits": hits})
+        return jsonify(payload)
         
     except Exception as e:
+        if es_unavailable(e) and local_index is not None:
+            app.logger.warning(f"Elasticsearch unavailable, searching the local index: {str(e)}")
+            return search_local(query, offset, size, track_total_hits, ids_only)
         app.logger.error(f"Search error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def search_local(query, offset, size, track_total_hits, ids_only):
+    """/search response from the embedded local index; not cached, since it is already local"""
+    hits, total = local_index.search(query, offset, size, track_total_hits=track_total_hits, ids_only=ids_only)
+    payload = {"hits": hits, "source": "local"}
+    if total is not None:
+        payload["total"] = total
+    app.logger.info(f"Local search results: {len(hits)} hits for query '{query}'")
+    return jsonify(payload)
+
+SUGGEST_MAX_RESULTS = 10
+
+@app.route('/suggest')
+def suggest_completions():
+    """Search-as-you-type suggestions from the in-process prefix trie; never queries Elasticsearch"""
+    prefix = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', SUGGEST_MAX_RESULTS, type=int), 1), SUGGEST_MAX_RESULTS)
+    check_index_generation()
+    response = jsonify({"suggestions": suggestions.suggest(prefix, limit)})
+    # Browsers may reuse suggestions for a prefix they already asked about
+    response.headers['Cache-Control'] = 'private, max-age=30'
+    return response
+
+# Paging settings for /list-all
+LIST_FIELDS = ["title", "filename"]
+LIST_PAGE_SIZE = 100
+LIST_MAX_PAGE_SIZE = 1000
+LIST_PIT_KEEP_ALIVE = "2m"
+
+def encode_cursor(pit_id, search_after):
+    """Encode point-in-time paging state as an opaque URL-safe cursor"""
+    state = json.dumps({"pit_id": pit_id, "search_after": search_after})
+    return base64.urlsafe_b64encode(state.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor"""
+    state = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return state["pit_id"], state["search_after"]
+
+def close_point_in_time(pit_id):
+    """Release a point in time, ignoring ones that already expired"""
+    try:
+        es.close_point_in_time(id=pit_id)
+    except Exception as e:
+        app.logger.warning(f"Failed to close point in time: {str(e)}")
+
+def build_list_query(size, pit_id, search_after=None, fields=LIST_FIELDS):
+    """Request body for one point-in-time page of document listings"""
+    # Only the listed fields are fetched; content and paragraphs stay on the cluster
+    list_query = {
+        "query": {
+            "match_all": {}
+        },
+        "size": size,
+        "_source": fields,
+        "pit": {"id": pit_id, "keep_alive": LIST_PIT_KEEP_ALIVE},
+        "sort": [{"_shard_doc": "asc"}],
+        "track_total_hits": False
+    }
+    if search_after:
+        list_query["search_after"] = search_after
+    return list_query
+
+def format_list_page(response, size, fields=LIST_FIELDS):
+    """(listings, search_after for the next page) from a build_list_query response
+
+    search_after is None once a short page shows the end of the index was reached.
+    """
+    hits = []
+    for hit in response['hits']['hits']:
+        listing = {"id": hit["_id"]}
+        listing.update((field, hit["_source"].get(field)) for field in fields)
+        hits.append(listing)
+    if len(hits) < size:
+        return hits, None
+    return hits, response['hits']['hits'][-1]["sort"]
+
+def list_page(size, cursor=None, fields=LIST_FIELDS):
+    """Fetch one page of document listings using point-in-time + search_after"""
+    if cursor:
+        pit_id, search_after = decode_cursor(cursor)
+    else:
+        pit_id = es.open_point_in_time(index=ES_INDEX, keep_alive=LIST_PIT_KEEP_ALIVE)["id"]
+        search_after = None
+    
+    response = es.search(body=build_list_query(size, pit_id, search_after, fields))
+    pit_id = response.get("pit_id", pit_id)
+    hits, search_after = format_list_page(response, size, fields)
+    
+    if search_after is None:
+        close_point_in_time(pit_id)
+        next_cursor = None
+    else:
+        next_cursor = encode_cursor(pit_id, search_after)
+    
+    return hits, next_cursor
+
+def iter_listings(page_size=LIST_MAX_PAGE_SIZE, fields=LIST_FIELDS):
+    """Yield every document listing in the index, one page in memory at a time"""
+    cursor = None
+    try:
+        while True:
+            hits, cursor = list_page(page_size, cursor, fields)
+            for hit in hits:
+                yield hit
+            if cursor is None:
+                break
+    finally:
+        # Release the point in time if the consumer stopped early
+        if cursor is not None:
+            close_point_in_time(decode_cursor(cursor)[0])
+
 @app.route('/list-all')
 def list_all():
     try:
         app.logger.info("List all documents request")
         
-        # Query to fetch all documents without sorting
-        list_query = {
-            "query": {
-                "match_all": {}
-            },
-            "size": 100  # Limit to 100 documents
-        }
+        # Streaming mode: every document as newline-delimited JSON
+        if request.args.get('format') == 'ndjson':
+            def generate():
+                for hit in iter_listings():
+                    yield json.dumps(hit) + "\n"
+            app.logger.info("Streaming all documents as NDJSON")
+            return Response(generate(), mimetype='application/x-ndjson')
         
-        response = es.search(index=ES_INDEX, body=list_query)
+        size = min(request.args.get('size', LIST_PAGE_SIZE, type=int), LIST_MAX_PAGE_SIZE)
+        if size < 1:
+            return jsonify({"error": "size must be positive"}), 400
+        
+        hits, next_cursor = list_page(size, request.args.get('cursor'))
         
-        # Format the results
-        hits = []
-        for hit in response['hits']['hits']:
-            result = {
-                "id": hit["_id"],
-                "title": hit["_source"]["title"],
-                "filename": hit["_source"]["filename"]
-            }
-            hits.append(result)
-            
         app.logger.info(f"Listed {len(hits)} documents")
-        return jsonify({"hits": hits})
+        return jsonify({"hits": hits, "next_cursor": next_cursor})
         
     except Exception as e:
         app.logger.error(f"List all error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def download_name(doc_id, kind, meta):
+    """Attachment name for a download, as the routes have always named them"""
+    if kind == 'json':
+        return f"{meta.get('title') or f'document_{doc_id}'}.json"
+    return meta.get('filename') or f"document_{doc_id}.txt"
+
+def send_stored(doc_id, kind):
+    """Send a file from the document store with a strong ETag and Range support, or None
+
+    Files are streamed from disk in blocks, so memory per download does not
+    grow with the document. Text and JSON go out gzip-compressed to clients
+    that accept it.
+    """
+    gzipped = kind in COMPRESSED_DOWNLOADS and request.accept_encodings['gzip'] > 0
+    stored = doc_store.get(doc_id, kind, gzipped=gzipped)
+    if stored is None:
+        return None
+    path, mimetype, meta = stored
+    encoded = path.endswith('.gz')
+    # send_file answers If-None-Match and Range requests itself and lets the server use sendfile
+    response = send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name(doc_id, kind, meta),
+                         etag=f"{doc_id}-{kind}{'-gzip' if encoded else ''}", conditional=True,
+                         max_age=DOWNLOAD_MAX_AGE)
+    if encoded:
+        response.headers['Content-Encoding'] = 'gzip'
+    if kind in COMPRESSED_DOWNLOADS:
+        response.vary.add('Accept-Encoding')
+    return response
+
+def stored_or_fetched(doc_id, kind):
+    """Serve a download from the store, fetching the document into it on a miss"""
+    response = send_stored(doc_id, kind)
+    if response is not None:
+        return response
+    source = fetch_document(doc_id)
+    if not source:
+        return None
+    # Documents indexed by other tools enter the store on their first download
+    doc_store.put(doc_id, source)
+    return send_stored(doc_id, kind)
+
 @app.route('/download/<doc_id>')
 def download_document(doc_id):
     try:
         app.logger.info(f"Download request for document ID: {doc_id}")
         
-        # Get the document from Elasticsearch
-        doc = es.get(index=ES_INDEX, id=doc_id)
-        
-        if not doc or not doc.get('_source'):
+        # Served from the local document store; the cluster is only asked on a miss
+        response = stored_or_fetched(doc_id, 'text')
+        if response is None:
             app.logger.warning(f"Document not found: {doc_id}")
             return "Document not found", 404
         
-        # Get the document source
-        source = doc['_source']
-        
-        # Determine the filename
-        filename = source.get('filename', f"document_{doc_id}.txt")
-        
-        # Get the content (could be in 'content' or 'paragraphs' field)
-        if 'content' in source:
-            content = source['content']
-        elif 'paragraphs' in source:
-            content = '\n\n'.join(source['paragraphs'])
-        else:
-            content = json.dumps(source, indent=2)  # Fallback to the entire source
-        
-        app.logger.info(f"Downloading document: {filename}")
-        
-        # Create a downloadable response
-        response = Response(content)
-        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
-        response.headers['Content-Type'] = 'text/plain; charset=utf-8'
-        
+        app.logger.info(f"Downloading document: {doc_id}")
         return response
         
     except Exception as e:
@@ -413,53 +1058,155 @@ def download_json(doc_id):
     try:
         app.logger.info(f"Download JSON request for document ID: {doc_id}")
         
-        # Get the document from Elasticsearch
-        doc = es.get(index=ES_INDEX, id=doc_id)
-        
-        if not doc or not doc.get('_source'):
+        response = stored_or_fetched(doc_id, 'json')
+        if response is None:
             app.logger.warning(f"Document not found: {doc_id}")
             return "Document not found", 404
         
-        # Get the document source
-        source = doc['_source']
-        
-        # Determine the filename
-        base_filename = source.get('title', f"document_{doc_id}")
-        filename = f"{base_filename}.json"
-        
-        app.logger.info(f"Downloading JSON: {filename}")
-        
-        # Create a downloadable response with the full JSON
-        response = Response(json.dumps(source, indent=2))
-        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        
+        app.logger.info(f"Downloading JSON: {doc_id}")
         return response
         
     except Exception as e:
         app.logger.error(f"Download JSON error: {str(e)}")
         return f"Error retrieving document: {str(e)}", 500
 
+@app.route('/download-original/<doc_id>')
+def download_original(doc_id):
+    app.logger.info(f"Download original request for document ID: {doc_id}")
+    response = send_stored(doc_id, 'original')
+    if response is None:
+        app.logger.warning(f"Original file not available: {doc_id}")
+        return "Original file not available", 404
+    return response
+
+_process = None
+
+def current_process():
+    """psutil handle for this worker, kept so cpu_percent() measures since the previous call"""
+    global _process
+    if _process is None or _process.pid != os.getpid():
+        _process = psutil.Process()
+    return _process
+
+def export_metrics():
+    """Queue this worker's metrics document for the next _bulk batch to the metrics index"""
+    log_shipper.enqueue('mimiketech-metrics', collect_metrics())
+
+# Request, Elasticsearch and queue metrics; workers flush them to the shared cache backend,
+# so any worker can serve host-wide totals (see metrics_registry.py)
+registry = MetricsRegistry(
+    cache_backend,
+    flush_interval=app.config['METRICS_FLUSH_INTERVAL'],
+    export=export_metrics if app.config['METRICS_EXPORT_INTERVAL'] > 0 else None,
+    export_interval=app.config['METRICS_EXPORT_INTERVAL']
+)
+atexit.register(registry.close)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+registry.counter('http_requests_total', 'HTTP requests served, by route, method and status')
+registry.histogram('http_request_duration_seconds', 'Time to build each HTTP response, by route')
+registry.counter('es_requests_total', 'Elasticsearch API calls, by operation and response status')
+registry.histogram('es_request_duration_seconds', 'Elasticsearch API call time including retries, by operation')
+registry.gauge('workers', 'Worker processes reporting metrics')
+registry.gauge('process_resident_memory_bytes', 'Resident memory of all workers')
+registry.gauge('log_shipper_queue_depth', 'Log and metrics documents waiting to be shipped')
+registry.gauge('es_requests_in_flight', 'Elasticsearch requests waiting for a response')
+registry.gauge('es_connections_in_use', 'Pooled Elasticsearch connections checked out')
+registry.gauge('es_circuit_open', 'Workers whose Elasticsearch circuit breaker is open')
+registry.gauge('http_requests_in_flight', 'HTTP requests being served')
+registry.counter('cache_hits_total', 'Result and document cache hits')
+registry.counter('cache_misses_total', 'Result and document cache misses')
+registry.gauge('cache_hit_ratio', 'Cache hits as a fraction of lookups')
+registry.counter('upload_jobs_total', 'Upload jobs, by state')
+registry.gauge('upload_jobs_pending', 'Upload jobs queued or running')
+
+def record_request(endpoint, method, status, duration):
+    route = endpoint or 'unmatched'
+    registry.inc('http_requests_total', route=route, method=method, status=status)
+    registry.observe('http_request_duration_seconds', duration, route=route)
+
+def record_es_request(operation, seconds, status):
+    registry.inc('es_requests_total', operation=operation, status=status or 'error')
+    registry.observe('es_request_duration_seconds', seconds, operation=operation)
+
+add_request_observer(record_es_request)
+
+def set_pool_gauges(registry, nodes, client):
+    """Connection pool gauges from es_client pool stats, labelled with the client they belong to"""
+    registry.set_gauge('es_requests_in_flight', sum(node['in_flight'] for node in nodes), client=client)
+    registry.set_gauge('es_connections_in_use', sum(node['connections_in_use'] for node in nodes), client=client)
+
+def collect_worker_gauges(registry):
+    registry.set_gauge('workers', 1)
+    registry.set_gauge('http_requests_in_flight', len(app.active_requests))
+    registry.set_gauge('process_resident_memory_bytes', current_process().memory_info().rss)
+    registry.set_gauge('log_shipper_queue_depth', log_shipper.stats()['queue_depth'])
+    set_pool_gauges(registry, es.stats(), 'sync')
+    registry.set_gauge('es_circuit_open', 0 if cluster_health.available() else 1)
+
+def collect_host_metrics():
+    """Samples kept in the shared cache backend's counters, already host-wide"""
+    samples = []
+    for name, cache in (('search', result_cache), ('documents', document_cache)):
+        stats = cache.stats()
+        samples += [
+            ('cache_hits_total', {'cache': name}, stats['hits']),
+            ('cache_misses_total', {'cache': name}, stats['misses']),
+            ('cache_hit_ratio', {'cache': name}, stats['hit_rate'])
+        ]
+    jobs = upload_jobs.stats()
+    samples += [('upload_jobs_total', {'state': state}, count) for state, count in jobs.items()]
+    samples.append(('upload_jobs_pending', {}, jobs['submitted'] - jobs['done'] - jobs['failed']))
+    return samples
+
+registry.add_collector(collect_worker_gauges)
+registry.add_host_collector(collect_host_metrics)
+
+def prometheus_requested(accept_mimetypes, requested_format=None):
+    """Whether /metrics should answer in Prometheus format: ?format= wins, then the Accept header"""
+    if requested_format:
+        return requested_format == 'prometheus'
+    # Accept values come best first; Prometheus prefers its text formats, browsers and curl get JSON as before
+    for value, _ in accept_mimetypes:
+        mimetype = value.split(';')[0].strip()
+        if mimetype in ('application/openmetrics-text', 'text/plain'):
+            return True
+        if mimetype in ('application/json', '*/*'):
+            return False
+    return False
+
+def collect_metrics():
+    """Basic application metrics for this worker, as served and recorded by /metrics"""
+    return {
+        'timestamp': datetime.datetime.utcnow().isoformat(),
+        'host': socket.gethostname(),
+        'service': 'mimiketech-search',
+        'uptime_seconds': time.time() - app.start_time,
+        'memory_usage_mb': current_process().memory_info().rss / 1024 / 1024,
+        'cpu_percent': current_process().cpu_percent(),
+        'total_requests': app.request_count,
+        'active_requests': len(app.active_requests),
+        'host_total_requests': registry.total('http_requests_total'),
+        'host_active_requests': registry.total('http_requests_in_flight'),
+        'log_shipper': log_shipper.stats(),
+        'search_cache': result_cache.stats(),
+        'document_cache': document_cache.stats(),
+        'suggestions': suggestions.stats(),
+        'doc_store': doc_store.stats(),
+        'local_index': local_index.stats() if local_index is not None else None,
+        'upload_jobs': upload_jobs.stats(),
+        'cache_usage': cache_backend.usage(),
+        'elasticsearch': es.stats(),
+        'cluster_health': cluster_health.stats()
+    }
+
 @app.route('/metrics')
 def metrics():
+    """Host-wide metrics in Prometheus text format for scrapers, or this worker's details as JSON"""
     try:
-        # Gather basic application metrics
-        app_metrics = {
-            'timestamp': datetime.datetime.utcnow().isoformat(),
-            'host': socket.gethostname(),
-            'service': 'mimiketech-search',
-            'uptime_seconds': time.time() - app.start_time,
-            'memory_usage_mb': psutil.Process().memory_info().rss / 1024 / 1024,
-            'cpu_percent': psutil.Process().cpu_percent(),
-            'total_requests': app.request_count,
-            'active_requests': len(app.active_requests)
-        }
-        
-        # Send to Elasticsearch
-        es.index(index='mimiketech-metrics', document=app_metrics)
-        app.logger.info("Metrics collected and sent to Elasticsearch")
-        
-        return jsonify(app_metrics)
+        if prometheus_requested(request.accept_mimetypes, request.args.get('format')):
+            return Response(registry.prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+        return jsonify(collect_metrics())
     except Exception as e:
         app.logger.error(f"Metrics error: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,83 @@
+import json
+
+from cache_backends import MemoryBackend
+
+
+def normalize_query(query):
+    """Normalize query text so trivially different queries share a cache entry"""
+    # The index uses the standard analyzer, so case and extra whitespace
+    # never change the results
+    return ' '.join(query.lower().split())
+
+
+def make_key(query, **params):
+    """Build a cache key from the normalized query and any paging/options"""
+    return json.dumps([normalize_query(query), sorted(params.items())], default=str)
+
+
+class SearchCache:
+    """LRU/TTL cache of JSON-serializable results on top of a cache backend
+
+    Storage, eviction and counters live in the backend (see
+    cache_backends.py), so the same cache can be per-process or shared by
+    every gunicorn worker on the host. Keys are prefixed with a namespace
+    and the current generation; bumping the generation (see `invalidate`
+    and `sync_generation`) makes every existing entry unreachable at once,
+    and the stale rows then age out through normal LRU/TTL eviction.
+    """
+
+    def __init__(self, backend=None, namespace='search', ttl=300, max_value_bytes=1024 * 1024):
+        self.backend = backend or MemoryBackend()
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_value_bytes = max_value_bytes
+        self._generation_token = None
+
+    @property
+    def generation(self):
+        return self.backend.counter(f"{self.namespace}:generation")
+
+    def _storage_key(self, key):
+        return f"{self.namespace}:{self.generation}:{key}"
+
+    def get(self, key):
+        """Return the cached value for `key`, or None on a miss"""
+        value = self.backend.get(self._storage_key(key))
+        if value is None:
+            self.backend.incr(f"{self.namespace}:misses")
+            return None
+        self.backend.incr(f"{self.namespace}:hits")
+        return json.loads(value)
+
+    def set(self, key, value):
+        """Store `value` under `key`, letting the backend evict as needed"""
+        serialized = json.dumps(value, default=str)
+        if len(serialized) > self.max_value_bytes:
+            return
+        evicted = self.backend.set(self._storage_key(key), serialized, self.ttl)
+        if evicted:
+            self.backend.incr(f"{self.namespace}:evictions", evicted)
+
+    def invalidate(self):
+        """Make every cached entry stale, e.g. after a document was indexed"""
+        self.backend.incr(f"{self.namespace}:generation")
+        self.backend.incr(f"{self.namespace}:invalidations")
+
+    def sync_generation(self, token):
+        """Invalidate the cache if the observed index generation token changed"""
+        if token is None:
+            return
+        if self._generation_token is not None and token != self._generation_token:
+            self.invalidate()
+        self._generation_token = token
+
+    def stats(self):
+        """Return a snapshot of cache counters"""
+        snapshot = {
+            name: self.backend.counter(f"{self.namespace}:{name}")
+            for name in ('hits', 'misses', 'evictions', 'invalidations', 'generation')
+        }
+        snapshot['backend'] = 'shared' if self.backend.shared else 'per-process'
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_rate'] = round(snapshot['hits'] / lookups, 4) if lookups else 0.0
+        return snapshot
@@ -0,0 +1,186 @@
+import re
+import threading
+import time
+from collections import Counter
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+# Prefixes are indexed up to this many characters; longer input filters the candidates
+MAX_PREFIX_CHARS = 24
+# Candidates kept per trie node, enough to fill a suggestion list after filtering
+NODE_CANDIDATES = 16
+# Title/heading words seen in at least this many documents are suggested as terms
+MIN_TERM_DOCS = 2
+MAX_TERMS = 20000
+
+TITLE = 0
+TERM = 1
+
+
+def normalize(text):
+    """Lowercase and collapse whitespace, as typed queries are compared"""
+    return ' '.join(WORD.findall(text.lower()))
+
+
+class PrefixTrie:
+    """Character trie where every node keeps its best-ranked completions
+
+    Lookups walk at most MAX_PREFIX_CHARS nodes and read a precomputed
+    candidate list, so their cost does not depend on how many entries share
+    the prefix. Each entry is reachable from the start of every word in its
+    text, so "rep" suggests "Annual report" as well as "Report templates".
+    """
+
+    def __init__(self):
+        self.root = ({}, [])
+        self.entries = 0
+
+    def add(self, text, rank, payload):
+        """Insert `text`; lower `rank` tuples sort first among completions"""
+        key = normalize(text)
+        if not key:
+            return
+        # The entry number breaks ties so payload dicts are never compared
+        item = (rank, key, self.entries, payload)
+        starts = [0] + [i + 1 for i, char in enumerate(key) if char == ' ']
+        for start in starts:
+            node = self.root
+            for char in key[start:start + MAX_PREFIX_CHARS]:
+                children, candidates = node
+                node = children.get(char)
+                if node is None:
+                    node = children[char] = ({}, [])
+                self._offer(node[1], item)
+        self.entries += 1
+
+    @staticmethod
+    def _offer(candidates, item):
+        # One suggestion per distinct text; the first (a title, when there is one) wins
+        if any(candidate[1] == item[1] for candidate in candidates):
+            return
+        if len(candidates) < NODE_CANDIDATES:
+            candidates.append(item)
+            candidates.sort()
+        elif item < candidates[-1]:
+            candidates[-1] = item
+            candidates.sort()
+
+    def complete(self, prefix, limit=10):
+        """Return up to `limit` payloads whose text has a word starting with `prefix`"""
+        key = normalize(prefix)
+        if not key:
+            return []
+        node = self.root
+        for char in key[:MAX_PREFIX_CHARS]:
+            node = node[0].get(char)
+            if node is None:
+                return []
+        candidates = node[1]
+        if len(key) > MAX_PREFIX_CHARS:
+            candidates = [item for item in candidates if (' ' + item[1]).find(' ' + key) != -1]
+        return [payload for _, _, _, payload in candidates[:limit]]
+
+
+def build_trie(documents):
+    """Build a PrefixTrie from (doc_id, title, headings) tuples
+
+    Titles are suggested first, each linking to its document; words that
+    occur in the titles or headings of several documents follow as search
+    terms, most frequent first.
+    """
+    trie = PrefixTrie()
+    document_frequency = Counter()
+    for doc_id, title, headings in documents:
+        if title:
+            trie.add(title, (TITLE, len(title)), {"text": title, "type": "title", "id": doc_id})
+        words = set()
+        for text in [title or ''] + list(headings or []):
+            words.update(word for word in WORD.findall(text.lower()) if len(word) > 2 and not word.isdigit())
+        document_frequency.update(words)
+
+    for term, count in document_frequency.most_common(MAX_TERMS):
+        if count < MIN_TERM_DOCS:
+            break
+        trie.add(term, (TERM, -count), {"text": term, "type": "term"})
+    return trie
+
+
+class SuggestIndex:
+    """Per-process autocomplete index, rebuilt in the background when stale
+
+    `loader()` returns an iterable of (doc_id, title, headings). Lookups
+    never wait for a build: until the first build finishes they return no
+    suggestions, and while a rebuild runs the previous trie keeps serving.
+    Rebuilds are triggered by `invalidate()` (e.g. after the index changed)
+    or when the trie is older than `max_age`, and run at most once every
+    `min_interval` seconds.
+    """
+
+    def __init__(self, loader, max_age=600, min_interval=30):
+        self.loader = loader
+        self.max_age = max_age
+        self.min_interval = min_interval
+        self._trie = None
+        self._built_at = 0.0
+        self._build_seconds = 0.0
+        self._stale = True
+        self._building = False
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._failures = 0
+
+    def invalidate(self):
+        """Mark the suggestions stale; the next lookup starts a rebuild"""
+        self._stale = True
+
+    def add_document(self, doc_id, title):
+        """Make a just-indexed title suggestible before the next rebuild"""
+        trie = self._trie
+        if trie is not None and title:
+            trie.add(title, (TITLE, len(title)), {"text": title, "type": "title", "id": doc_id})
+
+    def _maybe_rebuild(self):
+        now = time.time()
+        if not (self._stale or now - self._built_at > self.max_age):
+            return
+        with self._lock:
+            if self._building or (self._trie is not None and now - self._built_at < self.min_interval):
+                return
+            self._building = True
+            self._stale = False
+        threading.Thread(target=self._rebuild, name='suggest-build', daemon=True).start()
+
+    def _rebuild(self):
+        started = time.time()
+        try:
+            trie = build_trie(self.loader())
+            self._trie = trie
+            self._built_at = time.time()
+            self._build_seconds = self._built_at - started
+        except Exception as e:
+            self._failures += 1
+            self._stale = True
+            print(f"Failed to build suggestions: {e}")
+        finally:
+            self._building = False
+
+    def suggest(self, prefix, limit=10):
+        """Return up to `limit` suggestion dicts for `prefix`"""
+        self._maybe_rebuild()
+        self._lookups += 1
+        trie = self._trie
+        if trie is None:
+            return []
+        return trie.complete(prefix, limit)
+
+    def stats(self):
+        trie = self._trie
+        return {
+            'ready': trie is not None,
+            'entries': trie.entries if trie is not None else 0,
+            'age_seconds': round(time.time() - self._built_at, 1) if trie is not None else None,
+            'build_seconds': round(self._build_seconds, 3),
+            'building': self._building,
+            'lookups': self._lookups,
+            'build_failures': self._failures
+        }
@@ -1,14 +1,16 @@
 import os
 import json
 import argparse
-from elasticsearch import Elasticsearch
+from es_client import create_client
+from bulk_ingest import bulk_ingest, iter_json_documents, print_report
+import doc_identity
+from ingest_manifest import IngestManifest, scan_folder, delete_removed
+from index_management import ensure_alias
+from doc_store import DocumentStore
 
-def upload_json_files(folder_path, es_url, username, password, api_key, index_name):
+def upload_json_files(folder_path, es_url, username, password, api_key, index_name, bulk=False, workers=4, chunk_size=500, fingerprint_path=None, doc_store_path=None):
     # Connect to Elasticsearch
-    if api_key:
-        es = Elasticsearch(es_url, api_key=api_key, verify_certs=False)
-    else:
-        es = Elasticsearch(es_url, basic_auth=(username, password), verify_certs=False)
+    es = create_client(es_url, api_key=api_key, username=username, password=password, connections_per_node=workers)
     
     # Check connection
     if not es.ping():
@@ -17,41 +19,81 @@ def upload_json_files(folder_path, es_url, username, password, api_key, index_na
     
     print(f"Connected to Elasticsearch at {es_url}")
     
-    # Create index if it doesn't exist
-    if not es.indices.exists(index=index_name):
-        print(f"Creating index '{index_name}'...")
-        mapping = {
-            "mappings": {
-                "properties": {
-                    "title": {"type": "text"},
-                    "filename": {"type": "keyword"},
-                    "content": {"type": "text"},
-                    "paragraphs": {"type": "text"}
-                }
-            }
-        }
-        es.indices.create(index=index_name, body=mapping)
+    # Create the index (a versioned index behind an alias) if it doesn't exist
+    print(f"Writing to '{index_name}' ({ensure_alias(es, index_name, 'documents')})")
     
-    # Process all JSON files in the folder
+    # Local record of already-indexed content and files, one per target index
+    state_path = fingerprint_path or os.path.join(folder_path, f".{index_name}.fingerprints.sqlite3")
+    fingerprints = doc_identity.FingerprintIndex(state_path)
+    manifest = IngestManifest(state_path)
+    # The search app's download store, if given, loses the entries of deleted documents
+    doc_store = DocumentStore(doc_store_path) if doc_store_path else None
+    
+    def record_indexed(identity):
+        if doc_identity.record_indexed(es, index_name, identity, fingerprints) and doc_store is not None:
+            doc_store.delete(identity['superseded_id'])
+    
+    # Work out what changed since the last run from directory metadata alone
+    delta = manifest.compute_delta(folder_path, scan_folder(folder_path, lambda name: name.endswith('.json')))
+    to_process = delta.new + delta.changed
+    deleted = delete_removed(es, index_name, delta.removed, manifest, fingerprints, doc_store)
+    print(f"Delta: {len(delta.new)} new, {len(delta.changed)} changed, {len(delta.unchanged)} unchanged, "
+          f"{len(delta.removed)} removed ({deleted} documents deleted)")
+    
+    # Bulk mode: stream new files through concurrent _bulk senders
+    if bulk:
+        identities = {}
+        skipped = []
+        
+        def on_indexed(name, doc_id):
+            identity = identities[name]
+            record_indexed(identity)
+            manifest.record(os.path.join(folder_path, name), identity['content_hash'], doc_id)
+        
+        documents = doc_identity.iter_new_documents(
+            iter_json_documents(folder_path, to_process), fingerprints, identities, skipped
+        )
+        stats = bulk_ingest(es, index_name, documents, workers=workers, chunk_docs=chunk_size, on_indexed=on_indexed)
+        
+        # Files whose content was already indexed under another name still join the manifest
+        for name, content_hash in skipped:
+            manifest.record(os.path.join(folder_path, name), content_hash, fingerprints.lookup(content_hash))
+        
+        print_report(stats, index_name)
+        print(f"Skipped {len(skipped)} files with already-indexed content")
+        return
+    
+    # Process new and changed JSON files in the folder
     file_count = 0
     success_count = 0
     
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.json'):
-            file_path = os.path.join(folder_path, filename)
-            file_count += 1
+    for file_path in to_process:
+        filename = os.path.basename(file_path)
+        file_count += 1
+        
+        try:
+            with open(file_path, 'r', encoding='utf-8') as file:
+                doc = json.load(file)
             
-            try:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    doc = json.load(file)
-                
-                # Index the document
-                result = es.index(index=index_name, document=doc)
-                print(f"Indexed {filename}: {result['result']}")
+            # Skip content that is already indexed
+            content_hash = doc_identity.document_hash(doc)
+            existing_id = fingerprints.lookup(content_hash)
+            if existing_id:
+                manifest.record(file_path, content_hash, existing_id)
+                print(f"Skipped {filename}: unchanged")
                 success_count += 1
-                
-            except Exception as e:
-                print(f"Error processing {filename}: {str(e)}")
+                continue
+            identity = doc_identity.stamp_document(doc, content_hash, doc.get('filename', filename), fingerprints)
+            
+            # Index the document under its content-derived id
+            result = es.index(index=index_name, id=identity['doc_id'], document=doc)
+            record_indexed(identity)
+            manifest.record(file_path, content_hash, identity['doc_id'])
+            print(f"Indexed {filename}: {result['result']}")
+            success_count += 1
+            
+        except Exception as e:
+            print(f"Error processing {filename}: {str(e)}")
     
     # Refresh index
     es.indices.refresh(index=index_name)
@@ -65,6 +107,11 @@ if __name__ == "__main__":
     parser.add_argument("--password", help="Elasticsearch password")
     parser.add_argument("--api-key", help="Elasticsearch API key")
     parser.add_argument("--index", default="documents", help="Elasticsearch index name")
+    parser.add_argument("--bulk", action="store_true", help="Use parallel _bulk ingestion")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent bulk senders (with --bulk)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Documents per bulk request (with --bulk)")
+    parser.add_argument("--fingerprints", help="Fingerprint/manifest database path (default: inside the folder)")
+    parser.add_argument("--doc-store", help="Search app document store to remove deleted documents from")
     
     args = parser.parse_args()
     
@@ -79,5 +126,10 @@ if __name__ == "__main__":
         args.username,
         args.password,
         args.api_key,
-        args.index
+        args.index,
+        bulk=args.bulk,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        fingerprint_path=args.fingerprints,
+        doc_store_path=args.doc_store
     )
\ No newline at end of file